@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    build_CDNC_cube.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        18/10/2026 20:45
+
+import os
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from get_cdnc import CDNC_DATA_PATH, REGIONS, get_cdnc_file
+from cdnc_grid import get_default_grid_cache
+from cdnc_cube import create_cube, get_cube_dates, append_to_cube
+
+REGION = 'northeast_pacific'  # box of get_cdnc.REGIONS
+DAYS_PER_APPEND = 64
+
+
+def get_daily_files(start_year, end_year, data_path=CDNC_DATA_PATH):
+    """
+    (date, file) of every daily file between two years, in date order.
+    """
+    daily_files = []
+    for year in range(start_year, end_year + 1):
+        number_of_days = (np.datetime64('{}-01-01'.format(year + 1)) - np.datetime64('{}-01-01'.format(year))).astype(int)
+        for day in range(1, number_of_days + 1):
+            file_name = get_cdnc_file(year, day, data_path)
+            if file_name is not None:
+                daily_files.append((np.datetime64('{}-01-01'.format(year)) + np.timedelta64(day - 1, 'D'), file_name))
+    return daily_files
+
+
+def read_day(grid, file_name, region):
+    return grid.read_region(file_name, region)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Consolidates the daily MODIS CDNC files of a region into one "
+                                                 "(time, lat, lon) cube, appending the days not yet in it.")
+    parser.add_argument("--start_year", type=int, default=2000, help="First year.")
+    parser.add_argument("--end_year", type=int, default=2020, help="Last year (included).")
+    parser.add_argument("--region", type=str, default=REGION, choices=sorted(REGIONS), help="Region of get_cdnc.")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get('SLURM_CPUS_PER_TASK', os.cpu_count() or 1)),
+                        help="Number of worker processes reading the daily files.")
+    parser.add_argument("--data_path", type=str, default=CDNC_DATA_PATH, help="Root of the daily CDNC files.")
+    parser.add_argument("--output", type=str, default=None, help="Cube file, default CDNC_cube_<region>.nc.")
+    args = parser.parse_args()
+
+    output_file = args.output or 'CDNC_cube_{}.nc'.format(args.region)
+
+    daily_files = get_daily_files(args.start_year, args.end_year, args.data_path)
+    if len(daily_files) == 0:
+        print("No daily file found")
+        return
+
+    grid = get_default_grid_cache().get(daily_files[0][1], [args.region])
+    if not os.path.exists(output_file):
+        lat, lon, _ = grid.get_region_grid(args.region)
+        create_cube(output_file, args.region, lat, lon)
+
+    # days already in the cube are skipped, so the same command appends newly arrived days
+    existing = set(get_cube_dates(output_file).tolist())
+    daily_files = [(date, file_name) for date, file_name in daily_files if date.tolist() not in existing]
+    print(f"{len(existing)} days already in {output_file}, {len(daily_files)} to append")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for start in range(0, len(daily_files), DAYS_PER_APPEND):
+            block = daily_files[start:start + DAYS_PER_APPEND]
+            data = list(executor.map(read_day, [grid] * len(block), [file_name for _, file_name in block],
+                                     [args.region] * len(block)))
+            append_to_cube(output_file, [date for date, _ in block], np.stack(data))
+            print(f"Appended {block[0][0]} to {block[-1][0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    cdnc_cube.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        18/10/2026 20:30
+
+import netCDF4 as nc
+import numpy as np
+
+TIME_UNITS = 'days since 1970-01-01'
+
+
+def create_cube(file_path, region, lat, lon, complevel=4):
+    """
+    Creates an empty (time, lat, lon) float32 cube with an unlimited time
+    dimension, chunked by month-sized blocks of full maps.
+    """
+    with nc.Dataset(file_path, mode='w', format='NETCDF4') as dataset:
+        dataset.region = region
+
+        dataset.createDimension('time', None)
+        dataset.createDimension('lat', len(lat))
+        dataset.createDimension('lon', len(lon))
+
+        time = dataset.createVariable('time', 'i4', ('time',))
+        time.units = TIME_UNITS
+        dataset.createVariable('lat', 'f4', ('lat',))[:] = lat
+        dataset.createVariable('lon', 'f4', ('lon',))[:] = lon
+
+        nd = dataset.createVariable('Nd_BR17', 'f4', ('time', 'lat', 'lon'), zlib=True, complevel=complevel,
+                                    chunksizes=(32, len(lat), len(lon)), fill_value=np.float32(np.nan))
+        nd.units = 'cm-3'
+
+
+def get_cube_dates(file_path):
+    """
+    Dates already stored in a cube, in storage order.
+    """
+    with nc.Dataset(file_path, mode='r') as dataset:
+        return dataset['time'][:].astype('timedelta64[D]') + np.datetime64('1970-01-01')
+
+
+def append_to_cube(file_path, dates, data):
+    """
+    Appends daily (lat, lon) maps to the end of the time dimension.
+    """
+    with nc.Dataset(file_path, mode='a') as dataset:
+        start = len(dataset.dimensions['time'])
+        stop = start + len(dates)
+        dataset['time'][start:stop] = (np.asarray(dates, dtype='datetime64[D]') -
+                                       np.datetime64('1970-01-01')).astype(np.int32)
+        dataset['Nd_BR17'][start:stop] = np.asarray(data, dtype=np.float32)
+
+
+class CDNCCube():
+
+    """
+    Regional Nd_BR17 time series held in memory: a (time, lat, lon) float32
+    array sorted by date, loaded from the consolidated cube in one read.
+    Monthly means and anomalies are then slicing and reductions of the array.
+    """
+
+    def __init__(self, dates, lat, lon, data, region=None):
+
+        order = np.argsort(dates, kind='stable')
+        self.dates = np.asarray(dates, dtype='datetime64[D]')[order]
+        self.lat = np.asarray(lat)
+        self.lon = np.asarray(lon)
+        self.data = np.asarray(data, dtype=np.float32)[order]
+        self.region = region
+
+    @classmethod
+    def load(cls, file_path, start_date=None, end_date=None):
+
+        with nc.Dataset(file_path, mode='r') as dataset:
+            dataset.set_auto_mask(False)
+            dates = dataset['time'][:].astype('timedelta64[D]') + np.datetime64('1970-01-01')
+
+            keep = np.ones(len(dates), dtype=bool)
+            if start_date is not None:
+                keep &= dates >= np.datetime64(start_date, 'D')
+            if end_date is not None:
+                keep &= dates <= np.datetime64(end_date, 'D')
+            index = np.flatnonzero(keep)
+
+            data = dataset['Nd_BR17'][index] if len(index) < len(dates) else dataset['Nd_BR17'][:]
+            return cls(dates[index], dataset['lat'][:], dataset['lon'][:], data, dataset.region)
+
+    def get_months(self):
+        return np.unique(self.dates.astype('datetime64[M]'))
+
+    def get_mean_map(self, start_date=None, end_date=None):
+        """
+        (lat, lon) mean over the days between two dates, both included.
+        """
+        keep = np.ones(len(self.dates), dtype=bool)
+        if start_date is not None:
+            keep &= self.dates >= np.datetime64(start_date, 'D')
+        if end_date is not None:
+            keep &= self.dates <= np.datetime64(end_date, 'D')
+
+        block = self.data[keep]
+        count = np.isfinite(block).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > 0, np.nansum(block, axis=0) / count, np.nan)
+
+    def get_monthly_mean(self):
+        """
+        (month, lat, lon) mean of every month present, NaN where no valid day.
+        """
+        months = self.dates.astype('datetime64[M]')
+        unique_months, start = np.unique(months, return_index=True)
+        stop = np.append(start[1:], len(months))
+
+        mean = np.full((len(unique_months),) + self.data.shape[1:], np.nan, dtype=np.float32)
+        for i in range(len(unique_months)):
+            block = self.data[start[i]:stop[i]]
+            count = np.isfinite(block).sum(axis=0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean[i] = np.where(count > 0, np.nansum(block, axis=0) / count, np.nan)
+
+        return unique_months, mean
+
+    def get_monthly_anomalies(self):
+        """
+        Monthly means minus the mean of the same calendar month over all years.
+        """
+        months, mean = self.get_monthly_mean()
+        calendar_month = months.astype(int) % 12
+
+        anomalies = np.full_like(mean, np.nan)
+        for month in np.unique(calendar_month):
+            selected = calendar_month == month
+            count = np.isfinite(mean[selected]).sum(axis=0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                climatology = np.where(count > 0, np.nansum(mean[selected], axis=0) / count, np.nan)
+            anomalies[selected] = mean[selected] - climatology
+
+        return months, anomalies
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    cdnc_grid.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        18/10/2026 19:10
+
+import os
+import re
+import json
+import logging
+import netCDF4 as nc
+import numpy as np
+from get_cdnc import CDNC_VARIABLE, REGIONS, get_region_slices, read_region_hyperslab, read_region
+
+# e.g. modis_nd.2015.050.A.v1.nc -> A.v1
+VERSION_PATTERN = re.compile(r'modis_nd\.\d{4}\.\d{3}\.(\w+\.v\d+)\.nc')
+DEFAULT_CACHE_PATH = os.environ.get('CDNC_GRID_CACHE',
+                                    os.path.join(os.path.expanduser('~'), '.cache', 'PacificPlastic', 'cdnc_grid'))
+EARTH_RADIUS_KM = 6371.0
+
+
+def get_dataset_version(file_name):
+    match = VERSION_PATTERN.search(os.path.basename(file_name))
+    return None if match is None else match.group(1)
+
+
+class CDNCGrid():
+
+    """
+    Geometry shared by every daily file of one dataset version: cell centres
+    and bounds of the rows (lat) and columns (lon) of Nd_BR17[0].T, the stored
+    shape of the variable (time, lon, lat, with lat bounds stored in the
+    opposite order of the rows), cell areas and the index slices of every
+    region of get_cdnc.REGIONS. The per-day loops then only read the data
+    variable.
+    """
+
+    def __init__(self, version, shape, lat_bounds, lon_bounds, regions=None):
+
+        self.version = version
+        self.shape = list(shape)
+        self.lat_bounds = np.asarray(lat_bounds, dtype=np.float64)
+        self.lon_bounds = np.asarray(lon_bounds, dtype=np.float64)
+        self.lat = self.lat_bounds.mean(axis=1)
+        self.lon = self.lon_bounds.mean(axis=1)
+        # name -> {'ranges': box, 'slices': [row start, row stop, column start, column stop]}
+        self.regions = {} if regions is None else dict(regions)
+
+    @classmethod
+    def from_dataset(cls, dataset, version, variable_name=CDNC_VARIABLE):
+
+        """
+        Builds and validates the grid of an open daily file: monotonic centres
+        matching the (time, lon, lat) shape of the variable.
+        """
+        grid = cls(version, dataset[variable_name].shape, dataset['lat_bnds'][:][::-1], dataset['lon_bnds'][:])
+
+        for centres, size in [(grid.lat, grid.shape[2]), (grid.lon, grid.shape[1])]:
+            steps = np.diff(centres)
+            if len(centres) != size or not (np.all(steps > 0) or np.all(steps < 0)):
+                raise ValueError("Unexpected {} grid in {}".format(variable_name, dataset.filepath()))
+        return grid
+
+    def matches(self, dataset, variable_name=CDNC_VARIABLE):
+        """
+        Cheap drift check from the headers only.
+        """
+        return list(dataset[variable_name].shape) == self.shape and \
+            dataset['lat_bnds'].shape[0] == len(self.lat) and dataset['lon_bnds'].shape[0] == len(self.lon)
+
+    def get_cell_areas(self):
+        """
+        (lat, lon) cell areas in km2 on a spherical Earth.
+        """
+        lat_bounds = np.radians(self.lat_bounds)
+        lon_width = np.radians(np.abs(self.lon_bounds[:, 1] - self.lon_bounds[:, 0]))
+        row_factor = np.abs(np.sin(lat_bounds[:, 1]) - np.sin(lat_bounds[:, 0]))
+        return EARTH_RADIUS_KM ** 2 * np.outer(row_factor, lon_width)
+
+    def get_region_slices(self, region_name):
+        """
+        (row slice, column slice) of a region of get_cdnc.REGIONS, resolved once
+        and resolved again if the region box has changed.
+        """
+        ranges = [list(value) for value in REGIONS[region_name]]
+        if region_name not in self.regions or self.regions[region_name]['ranges'] != ranges:
+            lat_slice, lon_slice = get_region_slices(self.lat, self.lon, *ranges)
+            self.regions[region_name] = {'ranges': ranges,
+                                         'slices': [int(lat_slice.start), int(lat_slice.stop),
+                                                    int(lon_slice.start), int(lon_slice.stop)]}
+
+        row_start, row_stop, column_start, column_stop = self.regions[region_name]['slices']
+        return slice(row_start, row_stop), slice(column_start, column_stop)
+
+    def get_region_grid(self, region_name):
+        """
+        (lat, lon, areas) of the cells of a region.
+        """
+        lat_slice, lon_slice = self.get_region_slices(region_name)
+        return self.lat[lat_slice], self.lon[lon_slice], self.get_cell_areas()[lat_slice, lon_slice]
+
+    def read_region(self, file_name, region_name, variable_name=CDNC_VARIABLE):
+        """
+        Reads the region hyperslab of a daily file, touching only the data
+        variable. Files whose grid differs are read through their own bounds.
+        """
+        with nc.Dataset(file_name, mode='r') as dataset:
+            if self.matches(dataset, variable_name):
+                return read_region_hyperslab(dataset[variable_name], *self.get_region_slices(region_name))
+
+        logging.warning("Grid of {} does not match the cached {} grid, reading its bounds".format(
+            file_name, self.version))
+        return read_region(file_name, *REGIONS[region_name], variable_name=variable_name)[0]
+
+    def to_dict(self):
+        return {'version': self.version,
+                'shape': self.shape,
+                'lat_bounds': self.lat_bounds.tolist(),
+                'lon_bounds': self.lon_bounds.tolist(),
+                'regions': self.regions}
+
+    @classmethod
+    def from_dict(cls, dictionary):
+        return cls(dictionary['version'], dictionary['shape'], dictionary['lat_bounds'],
+                   dictionary['lon_bounds'], dictionary['regions'])
+
+
+class CDNCGridCache():
+
+    """
+    Persistent cache of CDNCGrid objects, one JSON file per dataset version.
+    """
+
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH):
+
+        self.cache_path = cache_path
+        self._grids = {}
+
+    def _get_cache_file(self, version):
+        return os.path.join(self.cache_path, 'modis_nd-{}.json'.format(version))
+
+    def load(self, version):
+
+        if version not in self._grids:
+            cache_file = self._get_cache_file(version)
+            if not os.path.exists(cache_file):
+                return None
+            with open(cache_file, 'r') as f:
+                self._grids[version] = CDNCGrid.from_dict(json.load(f))
+
+        return self._grids[version]
+
+    def save(self, grid):
+
+        if not os.path.exists(self.cache_path):
+            os.makedirs(self.cache_path, exist_ok=True)
+
+        cache_file = self._get_cache_file(grid.version)
+        # write to a temporary file first so that concurrent jobs never read half a file
+        tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+        with open(tmp_file, 'w') as f:
+            json.dump(grid.to_dict(), f)
+        os.replace(tmp_file, cache_file)
+
+        self._grids[grid.version] = grid
+
+    def get(self, file_name, regions=()):
+        """
+        Returns the grid of the dataset version of a daily file, validating and
+        saving it on a cache miss, with the slices of the given regions resolved.
+        """
+        version = get_dataset_version(file_name) or 'unknown'
+        grid = self.load(version)
+
+        if grid is None:
+            with nc.Dataset(file_name, mode='r') as dataset:
+                grid = CDNCGrid.from_dataset(dataset, version)
+            logging.info("Cached CDNC grid of version {}".format(version))
+            missing = True
+        else:
+            missing = False
+
+        for region_name in regions:
+            cached = dict(grid.regions.get(region_name, {}))
+            grid.get_region_slices(region_name)
+            missing = missing or grid.regions[region_name] != cached
+
+        if missing:
+            self.save(grid)
+
+        return grid
+
+
+_default_grid_cache = None
+
+def get_default_grid_cache():
+
+    global _default_grid_cache
+
+    if _default_grid_cache is None:
+        _default_grid_cache = CDNCGridCache()
+
+    return _default_grid_cache
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    cdnc_statistics.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        18/10/2026 19:50
+
+import os
+import netCDF4 as nc
+import numpy as np
+from get_cdnc import CDNC_DATA_PATH, get_cdnc_file
+from cdnc_grid import get_default_grid_cache
+
+
+def get_days_of_month(year, month):
+    """
+    Days of year (1-based) of a calendar month.
+    """
+    first = np.datetime64('{}-{:02d}'.format(year, month), 'M')
+    start = (first.astype('datetime64[D]') - np.datetime64('{}-01-01'.format(year))).astype(int) + 1
+    stop = ((first + 1).astype('datetime64[D]') - np.datetime64('{}-01-01'.format(year))).astype(int) + 1
+    return range(start, stop)
+
+
+def reduce_month(year, month, region, data_path=CDNC_DATA_PATH, grid_cache=None):
+    """
+    Per-pixel count, sum and sum of squares of Nd_BR17 over the region for the
+    days of one month, accumulated one day at a time. Returns None if no daily
+    file exists.
+    """
+    grid_cache = get_default_grid_cache() if grid_cache is None else grid_cache
+    partial = None
+
+    for day in get_days_of_month(year, month):
+        file_name = get_cdnc_file(year, day, data_path)
+        if file_name is None:
+            continue
+
+        if partial is None:
+            grid = grid_cache.get(file_name, [region])
+            lat, lon, _ = grid.get_region_grid(region)
+            shape = (len(lat), len(lon))
+            partial = {'year': year, 'month': month, 'lat': lat, 'lon': lon, 'days': 0,
+                       'count': np.zeros(shape, dtype=np.int32),
+                       'sum': np.zeros(shape), 'sum_sq': np.zeros(shape)}
+
+        data = grid.read_region(file_name, region).astype(np.float64)
+        valid = np.isfinite(data)
+        partial['count'] += valid
+        partial['sum'] += np.where(valid, data, 0.)
+        partial['sum_sq'] += np.where(valid, data * data, 0.)
+        partial['days'] += 1
+
+    return partial
+
+
+def get_partial_file(partial_path, region, year, month):
+    return os.path.join(partial_path, '{}_{}-{:02d}.npz'.format(region, year, month))
+
+
+def save_partial(file_path, partial):
+
+    # write to a temporary file first so that an interrupted run never leaves half a partial
+    tmp_file = file_path + '.tmp.npz'
+    np.savez(tmp_file, **partial)
+    os.replace(tmp_file, file_path)
+
+
+def load_partial(file_path):
+
+    with np.load(file_path) as data:
+        partial = {name: data[name] for name in data.files}
+    for name in ['year', 'month', 'days']:
+        partial[name] = int(partial[name])
+    return partial
+
+
+def get_partial_mismatch(partial, lat, lon, number_of_days=None):
+    """
+    Why a partial on disk does not match the current region grid or the
+    number of daily files of its month, None if it does.
+    """
+    if partial['count'].shape != (len(lat), len(lon)) or \
+            not (np.allclose(partial['lat'], lat) and np.allclose(partial['lon'], lon)):
+        return 'region grid changed'
+    if number_of_days is not None and partial['days'] != number_of_days:
+        return '{} daily files, partial built from {}'.format(number_of_days, partial['days'])
+    return None
+
+
+def merge_partials(partials):
+    """
+    Adds partials over the same pixels, e.g. the same calendar month of several years.
+    """
+    merged = None
+    for partial in partials:
+        if merged is None:
+            merged = {name: np.copy(value) if isinstance(value, np.ndarray) else value
+                      for name, value in partial.items()}
+            continue
+        for name in ['count', 'sum', 'sum_sq']:
+            merged[name] = merged[name] + partial[name]
+        merged['days'] += partial['days']
+    return merged
+
+
+def get_box_statistics(partial):
+    """
+    Mean and standard deviation of every valid value of the box, as
+    np.nanmean/np.nanstd over all the daily arrays of the month.
+    """
+    count = partial['count'].sum()
+    if count == 0:
+        return np.nan, np.nan
+    mean = partial['sum'].sum() / count
+    variance = max(partial['sum_sq'].sum() / count - mean * mean, 0.)
+    return mean, np.sqrt(variance)
+
+
+def get_pixel_statistics(partial):
+    """
+    Per-pixel count, mean and standard deviation grids of a partial, NaN where
+    no valid value.
+    """
+    count = partial['count']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, partial['sum'] / count, np.nan)
+        variance = np.where(count > 0, partial['sum_sq'] / count - mean * mean, np.nan)
+    return count, mean, np.sqrt(np.maximum(variance, 0.))
+
+
+def save_monthly_grids(partial_files, output_file, grid, region, complevel=4):
+    """
+    Writes the per-pixel monthly count, mean and standard deviation of the
+    region into a (time, lat, lon) NetCDF file, one partial at a time, along
+    with the cell bounds and areas of the region.
+    """
+    partial_files = sorted(partial_files)
+    lat_slice, lon_slice = grid.get_region_slices(region)
+    lat_bounds, lon_bounds = grid.lat_bounds[lat_slice], grid.lon_bounds[lon_slice]
+
+    tmp_file = output_file + '.tmp'
+    with nc.Dataset(tmp_file, mode='w', format='NETCDF4') as dataset:
+        dataset.region = region
+
+        dataset.createDimension('time', len(partial_files))
+        dataset.createDimension('lat', len(lat_bounds))
+        dataset.createDimension('lon', len(lon_bounds))
+        dataset.createDimension('bnds', 2)
+
+        time = dataset.createVariable('time', 'i4', ('time',))
+        time.units = 'days since 1970-01-01'
+        dataset.createVariable('lat', 'f4', ('lat',))[:] = grid.lat[lat_slice]
+        dataset.createVariable('lon', 'f4', ('lon',))[:] = grid.lon[lon_slice]
+        dataset.createVariable('lat_bnds', 'f4', ('lat', 'bnds'))[:] = lat_bounds
+        dataset.createVariable('lon_bnds', 'f4', ('lon', 'bnds'))[:] = lon_bounds
+        area = dataset.createVariable('cell_area', 'f4', ('lat', 'lon'))
+        area[:] = grid.get_cell_areas()[lat_slice, lon_slice]
+        area.units = 'km2'
+
+        count = dataset.createVariable('count', 'i4', ('time', 'lat', 'lon'), zlib=True, complevel=complevel)
+        mean = dataset.createVariable('mean', 'f4', ('time', 'lat', 'lon'), zlib=True, complevel=complevel,
+                                      fill_value=np.float32(np.nan))
+        std = dataset.createVariable('std', 'f4', ('time', 'lat', 'lon'), zlib=True, complevel=complevel,
+                                     fill_value=np.float32(np.nan))
+        mean.units = std.units = 'cm-3'
+
+        for i, partial_file in enumerate(partial_files):
+            partial = load_partial(partial_file)
+            first_day = np.datetime64('{}-{:02d}-01'.format(partial['year'], partial['month']))
+            time[i] = (first_day - np.datetime64('1970-01-01')).astype(int)
+            count[i], mean[i], std[i] = get_pixel_statistics(partial)
+
+    os.replace(tmp_file, output_file)
+
+
+def load_monthly_grids(file_path):
+    """
+    Reads a file of save_monthly_grids. Dates are the first day of each month.
+    """
+    with nc.Dataset(file_path, mode='r') as dataset:
+        dataset.set_auto_mask(False)
+        grids = {name: dataset[name][:] for name in ['lat', 'lon', 'lat_bnds', 'lon_bnds', 'cell_area',
+                                                     'count', 'mean', 'std']}
+        grids['dates'] = dataset['time'][:].astype('timedelta64[D]') + np.datetime64('1970-01-01')
+        grids['region'] = dataset.region
+    return grids
+
+
+def get_pooled_statistics(count, mean, std, axis=None, weights=None):
+    """
+    Mean and standard deviation of all the values behind per-pixel (or
+    per-month) count/mean/std grids, reduced over the given axes. Optional
+    weights, e.g. cell areas, scale the contribution of every value of a pixel.
+    """
+    count = count.astype(np.float64)
+    if weights is not None:
+        count = count * weights
+    valid = count > 0
+    mean = np.where(valid, mean, 0.)
+    std = np.where(valid, std, 0.)
+
+    total = count.sum(axis=axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pooled_mean = (count * mean).sum(axis=axis) / total
+        pooled_variance = (count * (std * std + mean * mean)).sum(axis=axis) / total - pooled_mean ** 2
+    return pooled_mean, np.sqrt(np.maximum(pooled_variance, 0.))
@@ -5,75 +5,134 @@
 # @Email:       rui.song@physics.ox.ac.uk
 # @Time:        18/01/2024 11:10
 
-import netCDF4 as nc
-import matplotlib.pyplot as plt
-import numpy as np
 import os
 import csv
-from datetime import datetime, timedelta
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from get_cdnc import CDNC_DATA_PATH, REGIONS, get_cdnc_file
+from cdnc_grid import get_default_grid_cache
+from cdnc_statistics import reduce_month, get_partial_file, save_partial, load_partial, get_box_statistics, \
+    get_days_of_month, save_monthly_grids, get_partial_mismatch
 
-def read_nd_data(file_name, variable_name):
-    """
-    Reads the specified variable from a NetCDF file.
-    """
-    print(f"Reading data from file: {file_name}")
-    with nc.Dataset(file_name, mode='r') as dataset:
-        variable_array = dataset[variable_name][:]
-    return variable_array
+REGION = 'northeast_pacific'  # box of get_cdnc.REGIONS
+PARTIAL_PATH = './CDNC_partials'
+OUTPUT_CSV = 'Northeast_Pacific_2000_2020.csv'
+OUTPUT_GRIDS = 'Northeast_Pacific_2000_2020.nc'
 
-def filter_data(lat, lon, data, lat_range, lon_range):
-    """
-    Filters data within specified latitude and longitude ranges.
-    """
-    lat_mask = (lat >= lat_range[0]) & (lat <= lat_range[1])
-    lon_mask = (lon >= lon_range[0]) & (lon <= lon_range[1])
-    return data[lat_mask, :][:, lon_mask]
 
-def process_yearly_data(year):
+def process_month(year, month, region, data_path, partial_path):
     """
-    Processes and aggregates data for a given year.
+    Worker: reduces one month to a per-pixel partial and writes it to disk.
+    Returns the partial file, or None if the month has no data.
     """
-    data_path = f'/badc/deposited2022/modis_cdnc_sampling_gridded/data/{year}/'
-    monthly_data = [[] for _ in range(12)]
+    partial = reduce_month(year, month, region, data_path)
+    partial_file = get_partial_file(partial_path, region, year, month)
+    if partial is None:
+        # the daily files of a stale partial are gone
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+        return None
 
-    for day in range(1, 366):
-        file_name = data_path + f'modis_nd.{year}.{day:03d}.A.v1.nc'
-        if not os.path.exists(file_name):
-            continue
+    save_partial(partial_file, partial)
+    print(f"Processed: Year {year}, Month {month}, {partial['days']} days")
+    return partial_file
 
-        nd_data = read_nd_data(file_name, 'Nd_BR17')[0, :, :].T
-        lat = read_nd_data(file_name, 'lat_bnds')[::-1].mean(axis=1)
-        lon = read_nd_data(file_name, 'lon_bnds').mean(axis=1)
 
-        filtered_data = filter_data(lat, lon, nd_data, [20, 40], [-150, -130])
-        month = (datetime(year, 1, 1) + timedelta(days=day - 1)).month
-        monthly_data[month - 1].append(filtered_data)
-        print(f"Processed: Year {year}, Month {month}, Day {day}")
-
-    return monthly_data
-
-def save_to_csv(yearly_data):
+def save_to_csv(partial_files, output_file=OUTPUT_CSV):
     """
-    Saves aggregated data into a CSV file.
+    Saves the monthly box mean and standard deviation into a CSV file.
     """
-    with open('Northeast_Pacific_2000_2020.csv', 'w', newline='') as csvfile:
+    with open(output_file, 'w', newline='') as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(['Year-Month', 'Average Value', 'Standard Deviation'])
 
-        for year, months in yearly_data.items():
-            for month, data in enumerate(months, start=1):
-                if data:
-                    month_data = np.array(data)
-                    avg = np.nanmean(month_data)
-                    std = np.nanstd(month_data)
-                    writer.writerow([f'{year}-{month:02d}', avg, std])
+        for partial_file in sorted(partial_files):
+            partial = load_partial(partial_file)
+            avg, std = get_box_statistics(partial)
+            writer.writerow([f"{partial['year']}-{partial['month']:02d}", avg, std])
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Monthly MODIS CDNC statistics over a region, in parallel.")
+    parser.add_argument("--start_year", type=int, default=2000, help="First year.")
+    parser.add_argument("--end_year", type=int, default=2020, help="Last year (included).")
+    parser.add_argument("--region", type=str, default=REGION, choices=sorted(REGIONS), help="Region of get_cdnc.")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get('SLURM_CPUS_PER_TASK', os.cpu_count() or 1)),
+                        help="Number of worker processes.")
+    parser.add_argument("--data_path", type=str, default=CDNC_DATA_PATH, help="Root of the daily CDNC files.")
+    parser.add_argument("--partial_path", type=str, default=PARTIAL_PATH,
+                        help="Directory of the per-month partial aggregates.")
+    parser.add_argument("--force", action='store_true', help="Recompute months that already have a partial.")
+    parser.add_argument("--output", type=str, default=OUTPUT_CSV, help="Monthly box statistics (csv).")
+    parser.add_argument("--grid_output", type=str, default=OUTPUT_GRIDS,
+                        help="Per-pixel monthly count, mean and std grids (netCDF).")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.partial_path):
+        os.makedirs(args.partial_path, exist_ok=True)
+
+    months = [(year, month) for year in range(args.start_year, args.end_year + 1) for month in range(1, 13)]
+
+    # number of daily files of every month, to check the partials on disk against
+    number_of_days = {(year, month): sum(get_cdnc_file(year, day, args.data_path) is not None
+                                         for day in get_days_of_month(year, month))
+                      for year, month in months}
+
+    # resolve the grid once here rather than in every worker at the same time
+    grid = None
+    for year, month in months:
+        if number_of_days[(year, month)] > 0:
+            file_name = next(filter(None, (get_cdnc_file(year, day, args.data_path)
+                                           for day in get_days_of_month(year, month))))
+            grid = get_default_grid_cache().get(file_name, [args.region])
+            lat, lon, _ = grid.get_region_grid(args.region)
+            break
+
+    # months with a matching partial on disk are done, so an interrupted run resumes where it stopped;
+    # partials of another region box or of fewer daily files than now available are recomputed. Months
+    # without daily files are done too: they have no partial, and get one once their files arrive
+    partial_files = []
+    empty_months = 0
+    todo = []
+    for year, month in months:
+        partial_file = get_partial_file(args.partial_path, args.region, year, month)
+        if number_of_days[(year, month)] == 0:
+            # the daily files of a stale partial are gone
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
+            empty_months += 1
+            continue
+        if os.path.exists(partial_file) and not args.force:
+            mismatch = None if grid is None else \
+                get_partial_mismatch(load_partial(partial_file), lat, lon, number_of_days[(year, month)])
+            if mismatch is None:
+                partial_files.append(partial_file)
+                continue
+            print(f"Recomputing {year}-{month:02d}: {mismatch}")
+        todo.append((year, month))
+    print(f"{len(partial_files)} months already done, {empty_months} without daily files, {len(todo)} to process")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(process_month, year, month, args.region, args.data_path, args.partial_path):
+                   (year, month) for year, month in todo}
 
-# Main execution
-yearly_data = {}
-for year in range(2000, 2021):
-    yearly_data[year] = process_yearly_data(year)
+        for future in as_completed(futures):
+            try:
+                partial_file = future.result()
+            except Exception as e:
+                print('Cannot process month {}-{:02d}: {}'.format(*futures[future], e))
+                continue
+            if partial_file is not None:
+                partial_files.append(partial_file)
 
-save_to_csv(yearly_data)
+    save_to_csv(partial_files, args.output)
+    print(f"Saved {len(partial_files)} months to {args.output}")
 
-# write a fucntion ...
+    if grid is not None and len(partial_files) > 0:
+        save_monthly_grids(partial_files, args.grid_output, grid, args.region)
+        print(f"Saved the per-pixel monthly grids to {args.grid_output}")
 
+if __name__ == "__main__":
+    main()
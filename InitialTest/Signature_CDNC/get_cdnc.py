@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    get_cdnc.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        18/10/2026 18:30
+
+import os
+import netCDF4 as nc
+import numpy as np
+
+CDNC_DATA_PATH = '/badc/deposited2022/modis_cdnc_sampling_gridded/data/'
+CDNC_VARIABLE = 'Nd_BR17'
+
+# (lat range, lon range) of the boxes studied, bounds included
+REGIONS = {'northeast_pacific': ([20, 40], [-150, -130])}
+
+
+def get_cdnc_file(year, day, data_path=CDNC_DATA_PATH):
+    """
+    Path of the daily gridded file of a day of year, None if it does not exist.
+    """
+    file_name = os.path.join(data_path, f'{year}', f'modis_nd.{year}.{day:03d}.A.v1.nc')
+    return file_name if os.path.exists(file_name) else None
+
+
+def get_grid_centres(dataset):
+    """
+    Cell centres of the rows (lat) and columns (lon) of Nd_BR17[0].T. The lat
+    bounds are stored in the opposite order of the data rows.
+    """
+    lat = dataset['lat_bnds'][:][::-1].mean(axis=1)
+    lon = dataset['lon_bnds'][:].mean(axis=1)
+    return np.asarray(lat), np.asarray(lon)
+
+
+def get_region_slices(lat, lon, lat_range, lon_range):
+    """
+    Resolves closed lat/lon ranges on the cell centres to contiguous row and
+    column slices of Nd_BR17[0].T.
+    """
+    rows = np.flatnonzero((lat >= lat_range[0]) & (lat <= lat_range[1]))
+    columns = np.flatnonzero((lon >= lon_range[0]) & (lon <= lon_range[1]))
+    if len(rows) == 0 or len(columns) == 0:
+        raise ValueError("No grid cell in lat {} lon {}".format(lat_range, lon_range))
+
+    return slice(rows[0], rows[-1] + 1), slice(columns[0], columns[-1] + 1)
+
+
+def read_region_hyperslab(variable, lat_slice, lon_slice):
+    """
+    Reads only the region of a (time, lon, lat) variable from disk and returns
+    it as a float32 (lat, lon) array with NaN for missing cells, laid out like
+    Nd_BR17[0].T.
+    """
+    data = variable[0, lon_slice, lat_slice]
+    data = np.ma.filled(np.ma.asarray(data, dtype=np.float32), np.nan)
+    return np.ascontiguousarray(data.T)
+
+
+def read_region(file_name, lat_range, lon_range, variable_name=CDNC_VARIABLE):
+    """
+    Opens a daily file once, resolves the box to index slices and reads only
+    that hyperslab. Returns (data, lat, lon) of the region.
+    """
+    with nc.Dataset(file_name, mode='r') as dataset:
+        lat, lon = get_grid_centres(dataset)
+        lat_slice, lon_slice = get_region_slices(lat, lon, lat_range, lon_range)
+        data = read_region_hyperslab(dataset[variable_name], lat_slice, lon_slice)
+
+    return data, lat[lat_slice], lon[lon_slice]
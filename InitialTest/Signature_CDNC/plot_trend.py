@@ -10,6 +10,7 @@ import matplotlib.dates as mdates
 import csv
 from datetime import datetime
 import numpy as np
+from cdnc_statistics import load_monthly_grids, get_pooled_statistics
 
 def read_csv_data(file_path):
     """
@@ -25,6 +26,19 @@ def read_csv_data(file_path):
             std_devs.append(float(row[2]))
     return dates, averages, std_devs
 
+def read_gridded_data(file_path, area_weighted=False):
+    """
+    Reduces the per-pixel monthly grids of extract_CDNC_northeast_Pacific.py to
+    the box mean and standard deviation of every month, optionally weighting
+    every pixel by its cell area.
+    """
+    grids = load_monthly_grids(file_path)
+    weights = grids['cell_area'] if area_weighted else None
+    averages, std_devs = get_pooled_statistics(grids['count'], grids['mean'], grids['std'], axis=(1, 2),
+                                               weights=weights)
+    dates = [date.astype(datetime) for date in grids['dates']]
+    return dates, averages, std_devs
+
 def plot_data(dates, averages, std_devs):
     """
     Plots the data on a graph.
@@ -46,5 +60,5 @@ def plot_data(dates, averages, std_devs):
     plt.show()
 
 # Main execution
-dates, averages, std_devs = read_csv_data('./Northeast_Pacific_2000_2020.csv')
+dates, averages, std_devs = read_gridded_data('./Northeast_Pacific_2000_2020.nc')
 plot_data(dates, averages, std_devs)
@@ -5,27 +5,17 @@
 # @Email:       rui.song@physics.ox.ac.uk
 # @Time:        17/01/2024 15:03
 
-import netCDF4 as nc
 import matplotlib.pyplot as plt
 import cartopy.crs as ccrs
 import numpy as np
+from cdnc_statistics import load_monthly_grids, get_pooled_statistics
 
-DATA_PATH = '/badc/deposited2022/modis_cdnc_sampling_gridded/data/2015/'
-FILE_NAME = 'modis_nd.2015.050.A.v1.nc'
+GRID_FILE = './Northeast_Pacific_2000_2020.nc'  # per-pixel monthly grids of extract_CDNC_northeast_Pacific.py
 
-def read_nd_data(file_path, variable_name):
+def plot_regional_data(lon, lat, data, title, save_path, extent=None):
     """
-    Reads the variable_name dataset from a NetCDF file.
-    """
-    with nc.Dataset(file_path, mode='r') as dataset:
-        nd_variable_array = dataset[variable_name][:]
-
-    return nd_variable_array
-
-
-def plot_global_data(lon, lat, data, title, save_path):
-    """
-    Plots the data on a global map and saves the plot.
+    Plots a gridded field, such as the pooled regional mean, on a map and
+    saves the plot.
 
     Parameters:
     lon (numpy.ndarray): Longitude boundaries.
@@ -33,6 +23,7 @@ def plot_global_data(lon, lat, data, title, save_path):
     data (numpy.ndarray): Data to plot.
     title (str): Title of the plot.
     save_path (str): Path to save the plot.
+    extent (list): [west, east, south, north] of the map, global if None.
     """
     # Create a meshgrid for plotting
     lon_centers = (lon[:, 1] + lon[:, 0]) / 2
@@ -42,6 +33,8 @@ def plot_global_data(lon, lat, data, title, save_path):
     # Create the plot
     plt.figure(figsize=(15, 8))
     ax = plt.axes(projection=ccrs.PlateCarree())
+    if extent is not None:
+        ax.set_extent(extent, crs=ccrs.PlateCarree())
     ax.coastlines()
     ax.gridlines(draw_labels=True, dms=True, x_inline=False, y_inline=False)
 
@@ -61,13 +54,16 @@ def plot_global_data(lon, lat, data, title, save_path):
     plt.close()
 
 
-# Read data
-Nd_BR17_data = read_nd_data(DATA_PATH + FILE_NAME, 'Nd_BR17')[0, :, :].T
-lat = read_nd_data(DATA_PATH + FILE_NAME, 'lat_bnds')[::-1]
-lon = read_nd_data(DATA_PATH + FILE_NAME, 'lon_bnds')
+# Read the monthly grids and pool every month of every pixel
+grids = load_monthly_grids(GRID_FILE)
+Nd_BR17_mean, Nd_BR17_std = get_pooled_statistics(grids['count'], grids['mean'], grids['std'], axis=0)
+lat = grids['lat_bnds']
+lon = grids['lon_bnds']
+extent = [lon.min() - 5, lon.max() + 5, lat.min() - 5, lat.max() + 5]
 
 # Plot and save the data
-plot_title = 'Global Plot of Nd_BR17 Data'
-save_plot_path = 'Nd_BR17_global_plot.png'
-plot_global_data(lon, lat, Nd_BR17_data, plot_title, save_plot_path)
+plot_title = 'Mean Nd_BR17 {} to {}'.format(grids['dates'][0].astype('datetime64[M]'),
+                                            grids['dates'][-1].astype('datetime64[M]'))
+save_plot_path = 'Nd_BR17_{}_mean_plot.png'.format(grids['region'])
+plot_regional_data(lon, lat, Nd_BR17_mean, plot_title, save_plot_path, extent)
 
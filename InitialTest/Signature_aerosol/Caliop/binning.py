@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    binning.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        17/10/2026 18:05
+
+import os
+import numpy as np
+
+
+def get_bin_index(values, bin_edges):
+    """
+    Maps values to the index i of the bin with bin_edges[i] <= v < bin_edges[i + 1].
+    Values outside the edges (and NaN) get -1.
+    """
+    bin_index = np.searchsorted(bin_edges, values, side='right') - 1
+    bin_index[(bin_index >= len(bin_edges) - 1) | ~np.isfinite(values)] = -1
+    return bin_index
+
+
+def combine_moments(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+    """
+    Chan et al. parallel update: (count, mean, M2) of the union of two samples.
+    """
+    count = count_a + count_b
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = mean_b - mean_a
+        weight = np.where(count > 0, count_b / count, 0.)
+        mean = mean_a + delta * weight
+        m2 = m2_a + m2_b + delta * delta * count_a * weight
+    return count, mean, m2
+
+
+def reduce_cells(cell, values):
+    """
+    Reduces values to (cells, count, mean, M2) over the distinct cell indices
+    they fall in. Negative cells and NaN values are dropped. Only occupied cells
+    are returned, so the cost does not depend on the size of the target grid.
+    """
+    keep = (cell >= 0) & np.isfinite(values)
+    cells, inverse = np.unique(cell[keep], return_inverse=True)
+    values = values[keep].astype(np.float64)
+
+    count = np.bincount(inverse, minlength=len(cells))
+    mean = np.bincount(inverse, weights=values, minlength=len(cells)) / np.maximum(count, 1)
+    m2 = np.bincount(inverse, weights=(values - mean[inverse]) ** 2, minlength=len(cells))
+
+    return cells, count, mean, m2
+
+
+class BinnedStatistics():
+
+    """
+    Streaming count, mean and M2 (sum of squared deviations) per (bin, altitude)
+    cell. A curtain is an (altitude, profile) array binned by one coordinate per
+    profile (latitude, longitude...). Each curtain is reduced with bincount and
+    combined with the running state by the Chan et al. parallel update, so
+    accumulators from other granules, processes or days can be merged exactly
+    and memory does not depend on the number of granules.
+
+    NaN values are skipped. total counts every profile that fell in a bin,
+    including missing values.
+    """
+
+    def __init__(self, bin_edges, number_of_altitudes):
+
+        self.bin_edges = np.asarray(bin_edges)
+        self.number_of_bins = len(bin_edges) - 1
+        self.number_of_altitudes = number_of_altitudes
+
+        shape = (self.number_of_bins, number_of_altitudes)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.total = np.zeros(shape, dtype=np.int64)
+
+    def add(self, data, coordinates, bin_index=None):
+        """
+        Adds one (altitude, profile) curtain. bin_index can be passed instead of
+        coordinates if the profiles have already been mapped to bins.
+        """
+        if bin_index is None:
+            bin_index = get_bin_index(coordinates, self.bin_edges)
+
+        inside = bin_index >= 0
+        data = np.asarray(data)[:, inside]
+        bin_index = bin_index[inside]
+
+        shape = self.count.shape
+        number_of_cells = self.number_of_bins * self.number_of_altitudes
+        # flat (bin, altitude) cell of every value, laid out like data
+        cell = bin_index[np.newaxis, :] * self.number_of_altitudes + \
+               np.arange(self.number_of_altitudes)[:, np.newaxis]
+
+        self.total += np.bincount(cell.ravel(), minlength=number_of_cells).reshape(shape)
+
+        finite = np.isfinite(data)
+        cell = cell[finite]
+        values = data[finite].astype(np.float64)
+
+        count = np.bincount(cell, minlength=number_of_cells)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.bincount(cell, weights=values, minlength=number_of_cells) / count
+        mean[count == 0] = 0.
+        m2 = np.bincount(cell, weights=(values - mean[cell]) ** 2, minlength=number_of_cells)
+
+        self._combine(count.reshape(shape), mean.reshape(shape), m2.reshape(shape))
+
+    def add_sparse(self, values, bin_index, bin_profile, bin_altitude):
+        """
+        Adds the COO records of a sparse granule: bin_index maps every profile
+        to a bin, bin_profile/bin_altitude locate each record. Bins that were
+        not stored count as missing values, as NaN does in add.
+        """
+        shape = self.count.shape
+        number_of_cells = self.number_of_bins * self.number_of_altitudes
+
+        # every profile covers all altitudes of its bin
+        profile_count = np.bincount(bin_index[bin_index >= 0], minlength=self.number_of_bins)
+        self.total += profile_count[:, np.newaxis]
+
+        record_bin = bin_index[bin_profile]
+        values = np.asarray(values)
+        keep = (record_bin >= 0) & np.isfinite(values)
+        cell = record_bin[keep] * self.number_of_altitudes + bin_altitude[keep]
+        values = values[keep].astype(np.float64)
+
+        count = np.bincount(cell, minlength=number_of_cells)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.bincount(cell, weights=values, minlength=number_of_cells) / count
+        mean[count == 0] = 0.
+        m2 = np.bincount(cell, weights=(values - mean[cell]) ** 2, minlength=number_of_cells)
+
+        self._combine(count.reshape(shape), mean.reshape(shape), m2.reshape(shape))
+
+    def add_granule(self, data, variable, bin_index, feature_types=None):
+        """
+        Adds one variable of a granule from load_granule, dense or sparse.
+        Profiles with bin_index -1 are skipped. With feature_types, only the
+        bins of those feature types count (data needs caliop_feature_type), so
+        a granule gives the same statistics in either layout. Without, every
+        bin counts, which a sparse granule cannot provide.
+        """
+        values = np.asarray(data[variable])
+        sparse = data.get('layout') == 'sparse'
+        if sparse and (feature_types is None or not set(feature_types) <= set(data['feature_types'])):
+            raise ValueError("Sparse granule only stores feature types {}, not {}".format(
+                data['feature_types'], 'all' if feature_types is None else list(feature_types)))
+        if feature_types is not None:
+            values = np.where(np.isin(data['caliop_feature_type'], feature_types), values, np.nan)
+
+        if sparse:
+            self.add_sparse(values, bin_index, data['bin_profile'], data['bin_altitude'])
+        else:
+            self.add(values, None, bin_index=bin_index)
+
+    def _combine(self, count, mean, m2):
+        self.count, self.mean, self.m2 = combine_moments(self.count, self.mean, self.m2, count, mean, m2)
+
+    def merge(self, other):
+        """
+        Adds the state of another accumulator over the same bins.
+        """
+        if not np.array_equal(self.bin_edges, other.bin_edges) or \
+                self.number_of_altitudes != other.number_of_altitudes:
+            raise ValueError("Cannot merge statistics over different bins")
+
+        self._combine(other.count, other.mean, other.m2)
+        self.total += other.total
+        return self
+
+    def get_mean(self):
+        """
+        Mean per (bin, altitude), NaN for empty cells.
+        """
+        return np.where(self.count > 0, self.mean, np.nan)
+
+    def get_variance(self, ddof=0):
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > ddof, self.m2 / (self.count - ddof), np.nan)
+
+    def get_std(self, ddof=0):
+        return np.sqrt(self.get_variance(ddof))
+
+    def save(self, file_path):
+
+        # write to a temporary file first so that a killed job never leaves half a file
+        tmp_file = file_path + '.tmp.npz'
+        np.savez_compressed(tmp_file, bin_edges=self.bin_edges, count=self.count,
+                            mean=self.mean, m2=self.m2, total=self.total)
+        os.replace(tmp_file, file_path)
+
+    @classmethod
+    def load(cls, file_path):
+
+        with np.load(file_path) as data:
+            statistics = cls(data['bin_edges'], data['count'].shape[1])
+            statistics.count = data['count']
+            statistics.mean = data['mean']
+            statistics.m2 = data['m2']
+            statistics.total = data['total']
+
+        return statistics
+
+
+def merge_statistics(file_paths):
+    """
+    Reduces saved partial statistics (e.g. one per day) into one accumulator.
+    """
+    statistics = None
+    for file_path in file_paths:
+        partial = BinnedStatistics.load(file_path)
+        statistics = partial if statistics is None else statistics.merge(partial)
+
+    return statistics
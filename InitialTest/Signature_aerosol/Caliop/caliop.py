@@ -10,46 +10,25 @@ from pyhdf.SD import *
 from pyhdf.V import *
 import numpy as np
 import logging
+from Caliop.schema import get_default_schema_cache
+from Caliop.region import BoxRegion
 
 class Caliop_hdf_reader():
 
-    def get_altitudes(self, filename):
-
-        hdf_interface = HDF(filename)
-        vs_interface = hdf_interface.vstart()
-        meta = vs_interface.attach("metadata")
-        field_infos = meta.fieldinfo()
-        all_data = meta.read(meta._nrecs)[0]
-        meta.detach()
-
-        data_dictionary = {}
-        field_name_index = 0
-        for field_info, data in zip(field_infos, all_data):
-            data_dictionary[field_info[field_name_index]] = data
+    """
+    Per-call reader kept for the older scripts. Every method opens the granule
+    again; new code should use CaliopGranule to share the handles.
+    """
 
-        lidar_altitudes = data_dictionary["Lidar_Data_Altitudes"]
-        lidar_altitudes = np.asarray(lidar_altitudes)
-        vs_interface.end()
-        hdf_interface.close()
+    def get_altitudes(self, filename):
 
-        return lidar_altitudes
+        with CaliopGranule(filename) as granule:
+            return granule.get_altitudes()
 
     def get_variable_names(self, filename, data_type=None):
 
-        variables = set([])
-
-        # Determine the valid shape for variables
-        sd = SD(filename)
-        datasets = sd.datasets()
-        len_x = datasets['Latitude'][1][0]  # Assumes that latitude shape == longitude shape (it should)
-        alt_data = self.get_altitudes(filename)
-        len_y = len(alt_data)
-        valid_shape = (len_x, len_y)
-
-        for var_name, var_info in sd.datasets().items():
-            print(var_name)
-            if var_info[1] == valid_shape:
-                variables.add(var_name)
+        with CaliopGranule(filename) as granule:
+            return granule.get_variable_names(data_type)
 
     def _get_calipso_data(self, filename, variable):
 
@@ -63,175 +42,61 @@ class Caliop_hdf_reader():
             variable   -- The specific variable to read
         """
 
-        calipso_fill_values = {'Float_32': -9999.0,
-                               # 'Int_8' : 'See SDS description',
-                               'Int_16': -9999,
-                               'Int_32': -9999,
-                               'UInt_8': -127,
-                               # 'UInt_16' : 'See SDS description',
-                               # 'UInt_32' : 'See SDS description',
-                               'ExtinctionQC Fill Value': 32768,
-                               'FeatureFinderQC No Features Found': 32767,
-                               'FeatureFinderQC Fill Value': 65535}
-
-        sd = SD(filename)
-        datasets = sd.select(variable)
-        data = datasets.get()
-        attributes = datasets.attributes()
-
-        # Missing data. First try 'fillvalue'
-        missing_val = attributes.get('fillvalue', None)
-
-        # Now handle valid range mask
-        valid_range = attributes.get('valid_range', None)
-
-        if valid_range is not None:
-            # Split the range into two numbers of the right type
-            v_range = np.asarray(valid_range.split("..."), dtype=data.dtype)
-            # Some valid_ranges appear to have only one value, so ignore those...
-            if len(v_range) == 2:
-                print("Masking all values {} < v < {}.".format(*v_range))
-                data = np.ma.masked_outside(data, *v_range)
-            else:
-                print("Invalid valid_range: {}. Not masking values.".format(valid_range))
+        with CaliopGranule(filename) as granule:
+            return granule.get_calipso_data(variable)
 
-        # Offsets and scaling.
-        offset = attributes.get('add_offset', 0)
-        scale_factor = attributes.get('scale_factor', 1)
-        data = self._apply_scaling_factor_CALIPSO(data, scale_factor, offset)
-        data = data.T
-
-        return data
-
-    def bits_stripping(self, bit_start, bit_count, value):
+    @staticmethod
+    def bits_stripping(bit_start, bit_count, value):
         bitmask = pow(2, bit_start + bit_count) - 1
         return np.right_shift(np.bitwise_and(value, bitmask), bit_start)
 
     def _get_feature_classification(self, filename, variable):
 
-        sd = SD(filename)
-        datasets = sd.select(variable)
-        data = datasets.get()
-
-        # bit 10-12 is for aersol subtype
-        bit_start = 9
-        bit_count = 3
-
-        # for the moment, use the higher bins classification flag for 60-m data below 8.2km.
-        data = data[:,:,0]
-        caliop_v4_aerosol_type = self.bits_stripping(bit_start, bit_count, data)
-        caliop_v4_aerosol_type = caliop_v4_aerosol_type.T
-
-        feature_type = self.bits_stripping(0, 3, data)
-        feature_type = feature_type.T
-
-        return caliop_v4_aerosol_type, feature_type
+        with CaliopGranule(filename) as granule:
+            return granule.get_feature_classification(variable)
 
     def _get_cloud_phase(self, filename, variable):
 
-        sd = SD(filename)
-        datasets = sd.select(variable)
-        data = datasets.get()
-
-        # bit 6-7 is for cloud phase, bit 8-9 is for cloud phase QA
-        bit_start_phase = 5
-        bit_start_phase_QA = 7
-        bit_count = 2
-
-        data = data[:,:,0]
-        cloud_phase = self.bits_stripping(bit_start_phase, bit_count, data)
-        cloud_phase = cloud_phase.T
-
-        cloud_phase_QA = self.bits_stripping(bit_start_phase_QA, bit_count, data)
-        cloud_phase_QA = cloud_phase_QA.T
-
-        return cloud_phase, cloud_phase_QA
+        with CaliopGranule(filename) as granule:
+            return granule.get_cloud_phase(variable)
 
     def _get_feature_classification_ALay(self, filename, variable):
 
-        sd = SD(filename)
-        datasets = sd.select(variable)
-        data = datasets.get()
-
-        # bit 10-12 is for aersol subtype
-        bit_start = 9
-        bit_count = 3
-
-        # for the moment, use the higher bins classification flag for 60-m data below 8.2km.
-
-        caliop_v4_aerosol_type = self.bits_stripping(bit_start, bit_count, data)
-        caliop_v4_aerosol_type = caliop_v4_aerosol_type.T
-
-        feature_type = self.bits_stripping(0, 3, data)
-        feature_type = feature_type.T
-
-        return caliop_v4_aerosol_type, feature_type
+        with CaliopGranule(filename) as granule:
+            return granule.get_feature_classification_ALay(variable)
 
     def _get_profile_id(self, filename):
 
-        sd = SD(filename)
-        datasets = sd.select('Profile_ID')
-        data = datasets.get()[:,0]
-
-        return data
+        with CaliopGranule(filename) as granule:
+            return granule.get_profile_id()
 
     def _get_latitude(self, filename):
 
-        sd = SD(filename)
-        datasets = sd.select('Latitude')
-        data = datasets.get()[:,0]
-
-        return data
+        with CaliopGranule(filename) as granule:
+            return granule.get_latitude()
 
     def _get_aod(self, filename, variable):
 
-        sd = SD(filename)
-        datasets = sd.select(variable)
-        data = datasets.get()[:,0]
-
-        return data
+        with CaliopGranule(filename) as granule:
+            return granule.get_aod(variable)
 
     def _get_tropopause_height(self, filename):
 
-        sd = SD(filename)
-        datasets = sd.select('Tropopause_Height')
-        data = datasets.get()[:,0]
-
-        return data
+        with CaliopGranule(filename) as granule:
+            return granule.get_tropopause_height()
 
     def _get_longitude(self, filename):
 
-        sd = SD(filename)
-        datasets = sd.select('Longitude')
-        data = datasets.get()[:, 0]
-
-        return data
+        with CaliopGranule(filename) as granule:
+            return granule.get_longitude()
 
     def _get_profile_UTC(self, filename):
 
-        import datetime
-
-        sd = SD(filename)
-        datasets = sd.select('Profile_UTC_Time')
-        data = datasets.get()[:,0]
-
-        datetime_utc = np.zeros((data.shape))
-        fraction_of_day = [ data_i % 1 for data_i in data]
-
-        utc_hour = ['{:02d}'.format(int(np.floor(data_i * 24))) for data_i in fraction_of_day]
-        utc_minute = ['{:02d}'.format(int(np.floor((fraction_of_day[i] * 24 - int(utc_hour[i])) * 60)))
-                      for i in range(len(fraction_of_day))]
-        utc_second = ['{:02d}'.format(
-            int(np.floor((fraction_of_day[i] * 24 * 60 - int(utc_hour[i]) * 60 - int(utc_minute[i])) * 60)))
-                      for i in range(len(fraction_of_day))]
-
-        datetime_utc = [datetime.datetime.strptime('20' + str(data[i])[0:6] +
-                                                   '%s%s%s'%(str(utc_hour[i]),str(utc_minute[i]),str(utc_second[i])),
-                                                   '%Y%m%d%H%M%S') for i in range(len(data))]
+        with CaliopGranule(filename) as granule:
+            return granule.get_profile_UTC(as_datetime=True)
 
-        return datetime_utc
-
-    def _apply_scaling_factor_CALIPSO(self, data, scale_factor, offset):
+    @staticmethod
+    def _apply_scaling_factor_CALIPSO(data, scale_factor, offset):
         """
         Apply scaling factor Calipso data.
         This isn't explicitly documented, but is referred to in the CALIOP docs here:
@@ -408,30 +273,466 @@ class Caliop_hdf_reader():
 
     # def _nasa_vocal_cmp(self, cmp_filename):
 
-class Caliop_feature:
+class CaliopGranule():
+
+    """
+    Opens the SD and V interfaces of one CALIOP hdf granule once and reads any
+    number of variables through the same handles. Use as a context manager:
+
+        with CaliopGranule(filename) as granule:
+            lat = granule.get_latitude()
+            alpha = granule.get_calipso_data('Extinction_Coefficient_532')
+
+    Header information (altitude grid, SDS attributes) comes from the schema
+    cache of the product version when available; pass schema_cache=False to
+    always read it from the granule itself.
+    """
+
+    def __init__(self, filename, schema_cache=None):
+
+        self.filename = filename
+        self.schema_cache = get_default_schema_cache() if schema_cache is None else schema_cache
+        self.schema = None
+        self.sd = None
+        self.hdf_interface = None
+        self.vs_interface = None
+        self._sds = {}
+        self._altitudes = None
+        self.profile_ranges = None
+        self._feature_flags = {}
+        self._qc_mask = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+
+        self.sd = SD(self.filename)
+        if self.schema_cache:
+            self.schema = self.schema_cache.get(self)
+        return self
+
+    def _get_vs_interface(self):
+        # the V interface is only needed for the metadata vdata, so open it on demand
+        if self.vs_interface is None:
+            self.hdf_interface = HDF(self.filename)
+            self.vs_interface = self.hdf_interface.vstart()
+        return self.vs_interface
+
+    def close(self):
+
+        for sds in self._sds.values():
+            sds.endaccess()
+        self._sds = {}
+        self._feature_flags = {}
+
+        if self.vs_interface is not None:
+            self.vs_interface.end()
+            self.vs_interface = None
+        if self.hdf_interface is not None:
+            self.hdf_interface.close()
+            self.hdf_interface = None
+        if self.sd is not None:
+            self.sd.end()
+            self.sd = None
+
+    def select(self, variable):
+        """
+        Returns the SDS handle of a variable, selecting it only on first use.
+        """
+        if variable not in self._sds:
+            self._sds[variable] = self.sd.select(variable)
+        return self._sds[variable]
+
+    def get_number_of_profiles(self):
+        return self.select('Latitude').info()[2][0]
+
+    def select_profiles(self, mask):
+        """
+        Restricts all following per-profile reads to the profiles where mask is True.
+        The mask is turned into contiguous index ranges so that only those
+        hyperslabs are read from disk. Returns the number of selected profiles.
+        """
+        self.profile_ranges = mask_to_ranges(mask)
+        # decoded flags and QC masks belong to the previous selection
+        self._feature_flags = {}
+        self._qc_mask = None
+        return int(np.count_nonzero(mask))
+
+    def get_selected_profiles(self):
+        """
+        Indices of the currently selected profiles in the granule.
+        """
+        if self.profile_ranges is None:
+            return np.arange(self.get_number_of_profiles())
+        return np.concatenate([np.arange(start, stop) for start, stop in self.profile_ranges] +
+                              [np.zeros(0, dtype=np.int64)])
+
+    def apply_qc(self, qc_filter):
+        """
+        Evaluates a QCFilter on the current selection. Profiles without any
+        passing bin are dropped from the selection; in the remaining ones the
+        rejected bins read as NaN (masked with masked=True) in get_calipso_data
+        and as 0 in the decoded feature flags. Returns the per-rule report.
+        """
+        keep, report = qc_filter.evaluate(self)
+        profiles = keep.any(axis=0)
+
+        mask = np.zeros(self.get_number_of_profiles(), dtype=bool)
+        mask[self.get_selected_profiles()[profiles]] = True
+        report['profiles'] = self.select_profiles(mask)
+        self._qc_mask = np.ascontiguousarray(keep[:, profiles])
+
+        return report
+
+    def select_region(self, region, *bounds):
+        """
+        Selects the profiles inside a Region, or inside the lat/lon box given as
+        select_region(south, north, west, east). If west > east the box crosses
+        the dateline, e.g. west=145, east=-125 for 145E to 125W. The mask is
+        computed once and every later read uses the same profile ranges.
+        """
+        if bounds:
+            region = BoxRegion(region, *bounds)
+
+        self.profile_ranges = None
+        return self.select_profiles(region.get_mask(self.get_latitude(), self.get_longitude()))
+
+    def read(self, variable):
+        """
+        Reads a variable. If a profile selection is active and the leading
+        dimension of the variable is the profile dimension, only the selected
+        ranges are fetched with SDS get(start, count).
+        """
+        sds = self.select(variable)
+        if self.profile_ranges is None:
+            return sds.get()
+
+        dims = sds.info()[2]
+        dims = list(dims) if isinstance(dims, (list, tuple)) else [dims]
+        if dims[0] != self.get_number_of_profiles():
+            return sds.get()
+
+        trailing_start = [0] * (len(dims) - 1)
+        trailing_count = dims[1:]
 
-    def __init__(self, filename):
+        if len(self.profile_ranges) == 0:
+            # read a single profile to get the dtype and trailing shape right
+            return sds.get(start=[0] + trailing_start, count=[1] + trailing_count)[:0]
 
-        sd = SD(filename)
-        self.sds_obj = sd.select('Feature_Classification_Flags')
-        self.sds_info = self.sds_obj.info()
-        self.sds_attributes = self.sds_obj.attributes()
+        slabs = [sds.get(start=[int(start)] + trailing_start, count=[int(stop - start)] + trailing_count)
+                 for start, stop in self.profile_ranges]
 
-        feature_type = self._get_flag_from_bits(bit_start=0, bit_count=3)
+        return np.concatenate(slabs, axis=0)
 
+    def attributes(self, variable):
 
-        quit()
-        feature_subtype = self._get_flag_from_bits(bit_start=9, bit_count=3)
+        if self.schema is not None and variable in self.schema.datasets:
+            return self.schema.datasets[variable]['attributes']
+        return self.select(variable).attributes()
+
+    def get_altitudes(self):
+
+        if self.schema is not None:
+            return self.schema.altitudes
+
+        if self._altitudes is None:
+            self._altitudes = self.read_altitudes()
+
+        return self._altitudes
+
+    def read_altitudes(self):
+        """
+        Reads Lidar_Data_Altitudes from the metadata vdata of the granule.
+        """
+        meta = self._get_vs_interface().attach("metadata")
+        field_infos = meta.fieldinfo()
+        all_data = meta.read(meta._nrecs)[0]
+        meta.detach()
+
+        data_dictionary = {}
+        field_name_index = 0
+        for field_info, data in zip(field_infos, all_data):
+            data_dictionary[field_info[field_name_index]] = data
+
+        return np.asarray(data_dictionary["Lidar_Data_Altitudes"])
+
+    def get_variable_names(self, data_type=None):
+
+        if self.schema is not None:
+            return self.schema.get_variable_names()
+
+        variables = set([])
+
+        # Determine the valid shape for variables
+        datasets = self.sd.datasets()
+        len_x = datasets['Latitude'][1][0]  # Assumes that latitude shape == longitude shape (it should)
+        len_y = len(self.get_altitudes())
+        valid_shape = (len_x, len_y)
+
+        for var_name, var_info in datasets.items():
+            if var_info[1] == valid_shape:
+                variables.add(var_name)
+
+        return variables
+
+    def get_calipso_data(self, variable, masked=True, out=None):
+
+        """
+        Reads a variable and applies the valid range mask, scaling factor and offset.
+        Returns a transposed masked array (altitude x profile for 2D variables).
+        With masked=False a C-contiguous float32 array is returned instead, with
+        NaN for fill and out-of-range values; the scaling is skipped when it is the
+        identity. out can be a preallocated float32 buffer with at least as many
+        elements as the result, the returned array is then a view into it.
+        """
+
+        calipso_fill_values = {'Float_32': -9999.0,
+                               # 'Int_8' : 'See SDS description',
+                               'Int_16': -9999,
+                               'Int_32': -9999,
+                               'UInt_8': -127,
+                               # 'UInt_16' : 'See SDS description',
+                               # 'UInt_32' : 'See SDS description',
+                               'ExtinctionQC Fill Value': 32768,
+                               'FeatureFinderQC No Features Found': 32767,
+                               'FeatureFinderQC Fill Value': 65535}
+
+        data = self.read(variable)
+        attributes = self.attributes(variable)
+
+        # Missing data. First try 'fillvalue'
+        missing_val = attributes.get('fillvalue', None)
+
+        # Now handle valid range mask
+        valid_range = attributes.get('valid_range', None)
+        v_range = None
+
+        if valid_range is not None:
+            # Split the range into two numbers of the right type
+            v_range = np.asarray(valid_range.split("..."), dtype=data.dtype)
+            # Some valid_ranges appear to have only one value, so ignore those...
+            if len(v_range) == 2:
+                print("Masking all values {} < v < {}.".format(*v_range))
+            else:
+                print("Invalid valid_range: {}. Not masking values.".format(valid_range))
+                v_range = None
+
+        # Offsets and scaling.
+        offset = attributes.get('add_offset', 0)
+        scale_factor = attributes.get('scale_factor', 1)
+
+        if not masked:
+            data = self._decode_float32(data, v_range, missing_val, scale_factor, offset, out)
+            if self._qc_mask is not None and data.shape == self._qc_mask.shape:
+                data[~self._qc_mask] = np.nan
+            return data
+
+        if v_range is not None:
+            data = np.ma.masked_outside(data, *v_range)
+
+        data = Caliop_hdf_reader._apply_scaling_factor_CALIPSO(data, scale_factor, offset)
+        data = data.T
+
+        if self._qc_mask is not None and data.shape == self._qc_mask.shape:
+            data = np.ma.masked_where(~self._qc_mask, data)
 
-    def _get_flag_from_bits(self, bit_start, bit_count):
-        data = self.sds_obj.get()
-        print('here', np.max(data))
-        data = self.bits_stripping(bit_start, bit_count, data[:, :])
         return data
 
+    @staticmethod
+    def _decode_float32(data, v_range, missing_val, scale_factor, offset, out=None):
 
-    def bits_stripping(self, bit_start, bit_count, value):
-        bitmask = pow(2, bit_start + bit_count) - 1
-        return np.right_shift(np.bitwise_and(value, bitmask), bit_start)
+        shape = data.T.shape
+        size = data.size
+
+        if out is None:
+            out = np.empty(shape, dtype=np.float32)
+        else:
+            if out.dtype != np.float32 or out.size < size or not out.flags.c_contiguous:
+                raise ValueError("out must be a C-contiguous float32 buffer with at least {} elements".format(size))
+            out = out.reshape(-1)[:size].reshape(shape)
+
+        # transpose straight into the contiguous float32 buffer
+        np.copyto(out, data.T, casting='unsafe')
+
+        invalid = None
+        if v_range is not None:
+            invalid = (out < np.float32(v_range[0])) | (out > np.float32(v_range[1]))
+        if missing_val is not None:
+            is_fill = out == np.float32(missing_val)
+            invalid = is_fill if invalid is None else (invalid | is_fill)
+
+        if scale_factor != 1:
+            out /= np.float32(scale_factor)
+        if offset != 0:
+            out += np.float32(offset)
+
+        if invalid is not None:
+            out[invalid] = np.nan
+
+        return out
+
+    def get_feature_flags(self, variable, layer=0):
+        """
+        Reads a uint16 classification flag SDS once and decodes every V4 bit field
+        through the lookup table. The result is cached on the granule per
+        (variable, layer), so the feature type, subtype and phase getters share a
+        single read and decode.
+        Each field is a uint8 array, transposed like the other profile variables.
+        """
+        key = (variable, layer)
+        if key not in self._feature_flags:
+            data = self.read(variable)
+            # for the moment, use the higher bins classification flag for 60-m data below 8.2km.
+            if data.ndim == 3:
+                data = data[:, :, layer]
+            flags = decode_feature_flags(data.T)
+            if self._qc_mask is not None:
+                for field in flags.values():
+                    field[~self._qc_mask] = 0
+            self._feature_flags[key] = flags
+
+        return self._feature_flags[key]
+
+    def get_feature_classification(self, variable):
+
+        flags = self.get_feature_flags(variable)
+        return flags['feature_subtype'], flags['feature_type']
+
+    def get_cloud_phase(self, variable):
+
+        flags = self.get_feature_flags(variable)
+        return flags['ice_water_phase'], flags['ice_water_phase_QA']
+
+    def get_feature_classification_ALay(self, variable):
+
+        flags = self.get_feature_flags(variable)
+        return flags['feature_subtype'], flags['feature_type']
+
+    def get_profile_id(self):
+        return self.read('Profile_ID')[:, 0]
+
+    def get_latitude(self):
+        return self.read('Latitude')[:, 0]
+
+    def get_longitude(self):
+        return self.read('Longitude')[:, 0]
+
+    def get_aod(self, variable):
+        return self.read(variable)[:, 0]
+
+    def get_tropopause_height(self):
+        return self.read('Tropopause_Height')[:, 0]
+
+    def get_day_night_flag(self):
+        # 0 = day, 1 = night
+        return self.read('Day_Night_Flag')[:, 0]
+
+    def get_profile_UTC(self, as_datetime=False):
+        """
+        Returns the profile times as a datetime64[ms] array. With as_datetime=True
+        a list of datetime.datetime objects truncated to seconds is returned instead,
+        as the older per-profile decoder did.
+        """
+        datetime_utc = decode_profile_UTC(self.read('Profile_UTC_Time')[:, 0])
+
+        if as_datetime:
+            return datetime_utc.astype('datetime64[s]').astype(object).tolist()
+
+        return datetime_utc
+
+def mask_to_ranges(mask):
+    """
+    Converts a 1D boolean mask into a list of (start, stop) index pairs,
+    one for every contiguous run of True values.
+    """
+    padded = np.concatenate(([False], np.asarray(mask, dtype=bool), [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(edges[0::2], edges[1::2]))
+
+def decode_profile_UTC(data):
+    """
+    Converts the CALIOP Profile_UTC_Time encoding (yymmdd.fraction_of_day, years
+    since 2000) into a datetime64[ms] array with array arithmetic only.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    yymmdd = np.floor(data).astype(np.int64)
+    fraction_of_day = data - yymmdd
+
+    year = 2000 + yymmdd // 10000
+    month = (yymmdd // 100) % 100
+    day = yymmdd % 100
+
+    months_since_epoch = (year - 1970) * 12 + (month - 1)
+    date = months_since_epoch.astype('datetime64[M]').astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+    milliseconds = np.rint(fraction_of_day * 86400000.).astype(np.int64).astype('timedelta64[ms]')
+
+    return date.astype('datetime64[ms]') + milliseconds
+
+# V4 Feature_Classification_Flags / Atmospheric_Volume_Description bit fields: (bit_start, bit_count)
+FEATURE_FLAG_FIELDS = {'feature_type': (0, 3),
+                       'feature_type_QA': (3, 2),
+                       'ice_water_phase': (5, 2),
+                       'ice_water_phase_QA': (7, 2),
+                       'feature_subtype': (9, 3),
+                       'feature_subtype_QA': (12, 1),
+                       'horizontal_averaging': (13, 3)}
+
+_feature_flag_lut = None
+
+def get_feature_flag_lut():
+    """
+    Returns the (65536, n_fields) uint8 table holding every decoded field for
+    every possible uint16 flag value. Built once per process.
+    """
+    global _feature_flag_lut
+
+    if _feature_flag_lut is None:
+        values = np.arange(65536, dtype=np.uint16)
+        _feature_flag_lut = np.empty((65536, len(FEATURE_FLAG_FIELDS)), dtype=np.uint8)
+        for i, (bit_start, bit_count) in enumerate(FEATURE_FLAG_FIELDS.values()):
+            _feature_flag_lut[:, i] = Caliop_hdf_reader.bits_stripping(bit_start, bit_count, values)
+
+    return _feature_flag_lut
+
+def decode_feature_flags(flags):
+    """
+    Decodes all V4 classification bit fields of a uint16 flag array with a single
+    gather through the lookup table. Returns a dictionary of uint8 arrays with the
+    shape of flags, keyed by the names in FEATURE_FLAG_FIELDS.
+    """
+    decoded = get_feature_flag_lut()[np.asarray(flags, dtype=np.uint16)]
+
+    return {name: np.ascontiguousarray(decoded[..., i])
+            for i, name in enumerate(FEATURE_FLAG_FIELDS)}
+
+class Caliop_feature:
+
+    """
+    Lazy view over the decoded classification flags of one granule. Nothing is
+    read until a field is accessed, e.g. Caliop_feature(filename).feature_type.
+    """
+
+    def __init__(self, filename, variable='Feature_Classification_Flags', layer=0):
+
+        self.filename = filename
+        self.variable = variable
+        self.layer = layer
+        self._flags = None
+
+    @property
+    def flags(self):
+
+        if self._flags is None:
+            with CaliopGranule(self.filename) as granule:
+                self._flags = granule.get_feature_flags(self.variable, self.layer)
+        return self._flags
 
+    def __getattr__(self, name):
 
+        if name in FEATURE_FLAG_FIELDS:
+            return self.flags[name]
+        raise AttributeError(name)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    catalog.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        17/10/2026 11:20
+
+import os
+import re
+import sqlite3
+import logging
+import numpy as np
+from Caliop.caliop import CaliopGranule
+
+# e.g. CAL_LID_L2_05kmAPro-Standard-V4-51.2017-06-01T00-23-18ZN.hdf
+DAY_NIGHT_PATTERN = re.compile(r'T\d{2}-\d{2}-\d{2}Z([DN])')
+TRACK_SUBSAMPLE = 10      # keep every 10th profile of the ground track
+SEGMENT_LENGTH = 200      # profiles per bounding box (about 1000 km for 5 km profiles)
+
+
+def _format_time(time):
+    return str(np.datetime64(time, 'ms'))
+
+
+class CaliopCatalog():
+
+    """
+    SQLite index of the CALIOP granules under a data tree. For every granule it
+    keeps path, size, mtime, start/end time, day/night, a subsampled ground track
+    and per-segment lat/lon bounding boxes, so that extraction only opens the
+    granules that cross the region of interest.
+
+    Segment boxes are plain min/max boxes, a segment crossing the dateline gets
+    the full longitude range. That only costs a false positive, never a miss.
+    """
+
+    def __init__(self, catalog_file):
+
+        self.catalog_file = catalog_file
+        self.connection = sqlite3.connect(catalog_file)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS granules (
+                path TEXT PRIMARY KEY, size INTEGER, mtime REAL,
+                start_time TEXT, end_time TEXT, day_night TEXT,
+                track_lat BLOB, track_lon BLOB);
+            CREATE TABLE IF NOT EXISTS segments (
+                path TEXT, segment INTEGER, start_time TEXT, end_time TEXT,
+                south REAL, north REAL, west REAL, east REAL);
+            CREATE INDEX IF NOT EXISTS segments_path ON segments (path);
+            CREATE INDEX IF NOT EXISTS granules_time ON granules (start_time, end_time);
+        """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def update(self, data_path, pattern='.hdf'):
+        """
+        Walks data_path and (re-)indexes every granule that is new or whose size
+        or mtime changed since the last update. Granules that disappeared from
+        disk are dropped. Returns the number of granules indexed.
+        """
+        known = {path: (size, mtime) for path, size, mtime in
+                 self.connection.execute("SELECT path, size, mtime FROM granules")}
+        seen = set([])
+        number_indexed = 0
+
+        for root, _, files in os.walk(data_path):
+            for file in sorted(files):
+                if not file.endswith(pattern):
+                    continue
+                path = os.path.join(root, file)
+                seen.add(path)
+                stat = os.stat(path)
+                if known.get(path) == (stat.st_size, stat.st_mtime):
+                    continue
+                try:
+                    self.add_granule(path, stat)
+                    number_indexed += 1
+                except Exception as e:
+                    logging.warning("Cannot index {}: {}".format(path, e))
+
+        for path in set(known) - seen:
+            self.remove_granule(path)
+
+        self.connection.commit()
+        logging.info("Catalog {}: indexed {} granules".format(self.catalog_file, number_indexed))
+
+        return number_indexed
+
+    def add_granule(self, path, stat=None):
+
+        stat = os.stat(path) if stat is None else stat
+
+        with CaliopGranule(path) as granule:
+            lat = granule.get_latitude()
+            lon = granule.get_longitude()
+            utc = granule.get_profile_UTC()
+
+        match = DAY_NIGHT_PATTERN.search(os.path.basename(path))
+        day_night = match.group(1) if match is not None else None
+
+        self.remove_granule(path)
+        self.connection.execute(
+            "INSERT INTO granules VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime, _format_time(utc[0]), _format_time(utc[-1]), day_night,
+             lat[::TRACK_SUBSAMPLE].astype(np.float32).tobytes(),
+             lon[::TRACK_SUBSAMPLE].astype(np.float32).tobytes()))
+
+        segments = []
+        for i, start in enumerate(range(0, len(lat), SEGMENT_LENGTH)):
+            stop = min(start + SEGMENT_LENGTH, len(lat))
+            segment_lon = lon[start:stop]
+            west, east = float(segment_lon.min()), float(segment_lon.max())
+            if east - west > 180.:
+                west, east = -180., 180.
+            segments.append((path, i, _format_time(utc[start]), _format_time(utc[stop - 1]),
+                             float(lat[start:stop].min()), float(lat[start:stop].max()), west, east))
+
+        self.connection.executemany("INSERT INTO segments VALUES (?, ?, ?, ?, ?, ?, ?, ?)", segments)
+
+    def remove_granule(self, path):
+
+        self.connection.execute("DELETE FROM granules WHERE path = ?", (path,))
+        self.connection.execute("DELETE FROM segments WHERE path = ?", (path,))
+
+    def query(self, start_time, end_time, region=None, day_night=None):
+        """
+        Returns the paths of the granules with profiles in [start_time, end_time)
+        and, if region = (south, north, west, east) is given, a ground-track
+        segment intersecting the box. west > east means the box crosses the
+        dateline. A Region is matched against its bounding box. day_night can
+        be 'D' or 'N'.
+        """
+        sql = ("SELECT DISTINCT g.path, g.start_time FROM granules g JOIN segments s ON g.path = s.path "
+               "WHERE s.end_time >= ? AND s.start_time < ?")
+        parameters = [_format_time(start_time), _format_time(end_time)]
+
+        if region is not None:
+            south, north, west, east = region.get_bounds() if hasattr(region, 'get_bounds') else region
+            sql += " AND s.north > ? AND s.south < ?"
+            parameters += [south, north]
+            if west > east:
+                sql += " AND (s.east > ? OR s.west < ?)"
+            else:
+                sql += " AND s.east > ? AND s.west < ?"
+            parameters += [west, east]
+
+        if day_night is not None:
+            sql += " AND g.day_night = ?"
+            parameters.append(day_night)
+
+        sql += " ORDER BY g.start_time"
+
+        return [path for path, _ in self.connection.execute(sql, parameters)]
+
+    def get_track(self, path):
+        """
+        Returns the subsampled ground track (lat, lon) of a granule.
+        """
+        row = self.connection.execute("SELECT track_lat, track_lon FROM granules WHERE path = ?",
+                                      (path,)).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32), np.frombuffer(row[1], dtype=np.float32)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    cube.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        18/10/2026 09:40
+
+import os
+import netCDF4 as nc
+import numpy as np
+from Caliop.binning import combine_moments, reduce_cells
+from Caliop.grid import CaliopGrid
+
+
+def get_month_index(times, first_month, number_of_months):
+    """
+    Index of the month of every time relative to first_month, -1 outside the cube.
+    """
+    month_index = (np.asarray(times).astype('datetime64[M]') - np.datetime64(first_month, 'M')).astype(np.int64)
+    month_index[(month_index < 0) | (month_index >= number_of_months)] = -1
+    return month_index
+
+
+def get_cube_cells(grid, first_month, number_of_months, number_of_altitudes, lat, lon, times):
+    """
+    Flat (month, lat, lon, altitude) cell of every value of an (altitude, profile)
+    curtain, -1 for profiles outside the cube.
+    """
+    month_index = get_month_index(times, first_month, number_of_months)
+    lat_index = grid.get_lat_index(lat)
+    lon_index = grid.get_lon_index(lon)
+
+    profile_cell = (month_index * (len(grid.lat_edges) - 1) + lat_index) * (len(grid.lon_edges) - 1) + lon_index
+    profile_cell[(month_index < 0) | (lat_index < 0) | (lon_index < 0)] = -1
+
+    cell = profile_cell[np.newaxis, :] * number_of_altitudes + np.arange(number_of_altitudes)[:, np.newaxis]
+    cell[:, profile_cell < 0] = -1
+
+    return cell
+
+
+def reduce_granule(grid, first_month, number_of_months, number_of_altitudes, lat, lon, times, curtains):
+    """
+    Reduces the (altitude, profile) curtains of one granule to the occupied cube
+    cells. Returns {variable: (cells, count, mean, M2)}, cheap to send from a
+    worker process to the one holding the cube.
+    """
+    cell = get_cube_cells(grid, first_month, number_of_months, number_of_altitudes, lat, lon, times).ravel()
+    return {variable: reduce_cells(cell, np.asarray(curtain).ravel()) for variable, curtain in curtains.items()}
+
+
+class CaliopCube():
+
+    """
+    Gridded count, mean and M2 of several CALIOP variables over a fixed
+    (month, lat, lon, altitude) grid, filled in a single pass over the granules
+    and saved as a chunked, compressed NetCDF4 file. Trend and curtain plots are
+    then slices or reductions of the cube.
+
+    The full cube is held in memory while it is built, so the horizontal grid
+    is meant to be coarser than the 0.1 degree curtain bins (1 degree by default).
+    Curtains keep 0.1 degree bins on a grid collapsed across the other
+    coordinate (CaliopGrid.get_curtain_grid), which is small enough.
+    """
+
+    def __init__(self, grid, altitudes, first_month, number_of_months, variables):
+
+        self.grid = grid
+        self.altitudes = np.asarray(altitudes, dtype=np.float32)
+        self.first_month = np.datetime64(first_month, 'M')
+        self.number_of_months = number_of_months
+        self.variables = list(variables)
+
+        self.shape = (number_of_months, len(grid.lat_edges) - 1, len(grid.lon_edges) - 1, len(self.altitudes))
+        self.count = {variable: np.zeros(self.shape, dtype=np.int64) for variable in self.variables}
+        self.mean = {variable: np.zeros(self.shape) for variable in self.variables}
+        self.m2 = {variable: np.zeros(self.shape) for variable in self.variables}
+
+    def get_months(self):
+        return self.first_month + np.arange(self.number_of_months)
+
+    def add_cells(self, variable, cells, count, mean, m2):
+        """
+        Combines the output of reduce_granule for one variable into the cube.
+        """
+        flat_count = self.count[variable].reshape(-1)
+        flat_mean = self.mean[variable].reshape(-1)
+        flat_m2 = self.m2[variable].reshape(-1)
+
+        # cells are unique, so the fancy-indexed update is safe
+        flat_count[cells], flat_mean[cells], flat_m2[cells] = \
+            combine_moments(flat_count[cells], flat_mean[cells], flat_m2[cells], count, mean, m2)
+
+    def add_reduced(self, reduced):
+        for variable, (cells, count, mean, m2) in reduced.items():
+            self.add_cells(variable, cells, count, mean, m2)
+
+    def add_granule(self, lat, lon, times, curtains):
+
+        self.add_reduced(reduce_granule(self.grid, self.first_month, self.number_of_months, len(self.altitudes),
+                                        lat, lon, times, curtains))
+
+    def collapse(self, variable, axis):
+        """
+        Combines the statistics of a variable over one or more axes
+        (0 month, 1 lat, 2 lon, 3 altitude). Returns (count, mean, M2).
+        """
+        count = self.count[variable]
+        mean = self.mean[variable]
+
+        total = count.sum(axis=axis, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            collapsed_mean = np.where(total > 0, (count * mean).sum(axis=axis, keepdims=True) / total, 0.)
+        m2 = (self.m2[variable] + count * (mean - collapsed_mean) ** 2).sum(axis=axis)
+
+        return total.squeeze(axis=axis), collapsed_mean.squeeze(axis=axis), m2
+
+    def get_mean(self, variable, axis=None):
+        """
+        Mean of a variable, NaN for empty cells, optionally reduced over axis.
+        """
+        if axis is None:
+            count, mean = self.count[variable], self.mean[variable]
+        else:
+            count, mean, _ = self.collapse(variable, axis)
+        return np.where(count > 0, mean, np.nan)
+
+    def get_std(self, variable, axis=None):
+
+        if axis is None:
+            count, m2 = self.count[variable], self.m2[variable]
+        else:
+            count, _, m2 = self.collapse(variable, axis)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > 0, np.sqrt(m2 / count), np.nan)
+
+    def save(self, file_path, complevel=4):
+
+        tmp_file = file_path + '.tmp'
+        with nc.Dataset(tmp_file, mode='w', format='NETCDF4') as dataset:
+            dataset.region = str(list(self.grid.get_region()))
+            dataset.binsize = self.grid.binsize
+            dataset.lon_binsize = self.grid.lon_binsize
+            dataset.first_month = str(self.first_month)
+
+            for name, size in zip(['month', 'lat', 'lon', 'altitude'], self.shape):
+                dataset.createDimension(name, size)
+            dataset.createVariable('lat', 'f4', ('lat',))[:] = self.grid.get_lat_centers()
+            dataset.createVariable('lon', 'f4', ('lon',))[:] = self.grid.get_lon_centers()
+            dataset.createVariable('altitude', 'f4', ('altitude',))[:] = self.altitudes
+
+            # one chunk holds a full altitude column of a small horizontal tile of one month
+            chunksizes = (1, min(self.shape[1], 16), min(self.shape[2], 16), self.shape[3])
+            dimensions = ('month', 'lat', 'lon', 'altitude')
+            for variable in self.variables:
+                for suffix, dtype, values in [('count', 'i4', self.count[variable]),
+                                              ('mean', 'f4', self.mean[variable]),
+                                              ('m2', 'f4', self.m2[variable])]:
+                    dataset.createVariable('{}_{}'.format(variable, suffix), dtype, dimensions, zlib=True,
+                                           complevel=complevel, chunksizes=chunksizes)[:] = values
+
+        os.replace(tmp_file, file_path)
+
+    @classmethod
+    def load(cls, file_path, variables=None):
+
+        with nc.Dataset(file_path, mode='r') as dataset:
+            dataset.set_auto_mask(False)
+            south, north, west, east = [float(value) for value in dataset.region.strip('[]').split(',')]
+            lon_binsize = float(dataset.lon_binsize) if 'lon_binsize' in dataset.ncattrs() else None
+            grid = CaliopGrid(south, north, west, east, binsize=float(dataset.binsize), lon_binsize=lon_binsize)
+
+            stored = [name[:-len('_count')] for name in dataset.variables if name.endswith('_count')]
+            variables = stored if variables is None else variables
+
+            cube = cls(grid, dataset['altitude'][:], dataset.first_month, len(dataset.dimensions['month']), [])
+            cube.variables = list(variables)
+            for variable in variables:
+                cube.count[variable] = dataset['{}_count'.format(variable)][:].astype(np.int64)
+                cube.mean[variable] = dataset['{}_mean'.format(variable)][:].astype(np.float64)
+                cube.m2[variable] = dataset['{}_m2'.format(variable)][:].astype(np.float64)
+
+        return cube
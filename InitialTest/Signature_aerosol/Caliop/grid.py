@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    grid.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        17/10/2026 20:15
+
+import numpy as np
+from Caliop.binning import get_bin_index
+from Caliop.region import BoxRegion
+
+
+class CaliopGrid():
+
+    """
+    Fixed lat/lon grid of a region, shared by extraction and aggregation so that
+    bins are identical from month to month.
+
+    If west > east the region crosses the dateline. Longitudes are then handled
+    in an unwrapped frame starting at west, e.g. 145 to 235 for 145E to 125W,
+    which is also the 0-360 frame used by the longitude plots.
+
+    lon_binsize defaults to binsize. A bin as wide as the region collapses that
+    axis, e.g. for a latitude curtain.
+    """
+
+    def __init__(self, south, north, west, east, binsize=0.1, lon_binsize=None):
+
+        self.south, self.north, self.west, self.east = south, north, west, east
+        self.binsize = binsize
+        self.lon_binsize = binsize if lon_binsize is None else lon_binsize
+        self.crosses_dateline = west > east
+
+        unwrapped_east = east + 360. if self.crosses_dateline else east
+        # edges from integer multiples of binsize, so they never drift like a float arange
+        self.lat_edges = south + binsize * np.arange(int(round((north - south) / binsize)) + 1)
+        self.lon_edges = west + self.lon_binsize * np.arange(int(round((unwrapped_east - west) / self.lon_binsize)) + 1)
+
+        self.name = 'lat{}_{}_lon{}_{}_{}'.format(south, north, west, east, binsize)
+        if self.lon_binsize != binsize:
+            self.name += '_{}'.format(self.lon_binsize)
+        self.region = BoxRegion(south, north, west, east)
+
+    def get_region(self):
+        return self.south, self.north, self.west, self.east
+
+    def get_curtain_grid(self, coordinate, binsize=None):
+        """
+        Grid of the same region with a single bin across the other coordinate,
+        for (lat, altitude) or (lon, altitude) curtains.
+        """
+        binsize = self.binsize if binsize is None else binsize
+        lon_width = self.lon_edges[-1] - self.lon_edges[0]
+        if coordinate == 'lat':
+            return CaliopGrid(self.south, self.north, self.west, self.east, binsize, lon_binsize=lon_width)
+        return CaliopGrid(self.south, self.north, self.west, self.east, float(self.north - self.south),
+                          lon_binsize=binsize)
+
+    def unwrap_longitude(self, lon):
+        """
+        Longitudes in the frame of the grid, continuous across the dateline.
+        """
+        lon = np.asarray(lon, dtype=np.float64)
+        if self.crosses_dateline:
+            return np.where(lon < self.west, lon + 360., lon)
+        return lon
+
+    def get_lat_index(self, lat):
+        return get_bin_index(np.asarray(lat, dtype=np.float64), self.lat_edges)
+
+    def get_lon_index(self, lon):
+        return get_bin_index(self.unwrap_longitude(lon), self.lon_edges)
+
+    def get_profile_index(self, data, coordinate):
+        """
+        lat or lon bin of every profile of a loaded granule. The index stored at
+        extraction time is used when it was computed on this grid.
+        """
+        name = coordinate + '_bin'
+        if name in data and data.get(name + '_grid') == self.name:
+            return data[name].astype(np.int64)
+
+        if coordinate == 'lat':
+            return self.get_lat_index(data['caliop_lat'])
+        return self.get_lon_index(data['caliop_lon'])
+
+    def get_lat_centers(self):
+        return (self.lat_edges[:-1] + self.lat_edges[1:]) / 2
+
+    def get_lon_centers(self):
+        return (self.lon_edges[:-1] + self.lon_edges[1:]) / 2
+
+
+# grids of the latitude and longitude curtain studies
+LAT_GRID = CaliopGrid(0, 50, -150, -135)
+LON_GRID = CaliopGrid(15, 40, 145, -125)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    groupby.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        18/10/2026 16:20
+
+import os
+import json
+from collections import OrderedDict
+import numpy as np
+from Caliop.binning import combine_moments, get_bin_index
+from Caliop.cube import get_month_index
+
+# number of distinct values of the categorical fields (3-bit classification flags)
+CATEGORICAL_FIELDS = {'aerosol_type': 8, 'feature_type': 8, 'day_night': 2}
+
+# feature types whose subtype is an aerosol type (3 tropospheric aerosol, 4 stratospheric aerosol)
+AEROSOL_FEATURE_TYPES = (3,)
+
+
+def get_field_sizes(fields, grid=None, altitude_edges=None, number_of_months=None):
+    """
+    Ordered {field: number of values} for a list of field names, taking the
+    binned fields from the grid, the altitude edges and the number of months.
+    """
+    sizes = OrderedDict()
+    for field in fields:
+        if field in CATEGORICAL_FIELDS:
+            sizes[field] = CATEGORICAL_FIELDS[field]
+        elif field == 'lat_bin':
+            sizes[field] = len(grid.lat_edges) - 1
+        elif field == 'lon_bin':
+            sizes[field] = len(grid.lon_edges) - 1
+        elif field == 'alt_bin':
+            sizes[field] = len(altitude_edges) - 1
+        elif field == 'month':
+            sizes[field] = number_of_months
+        else:
+            raise ValueError("Unknown group-by field: {}".format(field))
+    return sizes
+
+
+def get_granule_codes(granule, fields, grid=None, altitude_edges=None, first_month=None, number_of_months=None,
+                      flag_variable='Atmospheric_Volume_Description', aerosol_feature_types=AEROSOL_FEATURE_TYPES):
+    """
+    Integer code of every group-by field for the current selection of a
+    CaliopGranule, as arrays broadcastable to (altitude, profile). aerosol_type
+    and feature_type come from the decoded classification flags, day_night
+    from Day_Night_Flag. Values outside the bins get -1.
+
+    aerosol_type is the feature subtype of the bins whose feature type is in
+    aerosol_feature_types only: cloud subtypes and the subtype 0 of clear air
+    get -1, so those bins drop out of any key holding aerosol_type. Tropospheric
+    and stratospheric subtypes share codes, so mix types 3 and 4 with care.
+    """
+    codes = {}
+    for field in fields:
+        if field == 'aerosol_type':
+            flags = granule.get_feature_flags(flag_variable)
+            aerosol = np.isin(flags['feature_type'], aerosol_feature_types)
+            codes[field] = np.where(aerosol, flags['feature_subtype'].astype(np.int16), -1)
+        elif field == 'feature_type':
+            codes[field] = granule.get_feature_flags(flag_variable)['feature_type']
+        elif field == 'day_night':
+            codes[field] = granule.get_day_night_flag()[np.newaxis, :]
+        elif field == 'lat_bin':
+            codes[field] = grid.get_lat_index(granule.get_latitude())[np.newaxis, :]
+        elif field == 'lon_bin':
+            codes[field] = grid.get_lon_index(granule.get_longitude())[np.newaxis, :]
+        elif field == 'alt_bin':
+            codes[field] = get_bin_index(granule.get_altitudes(), altitude_edges)[:, np.newaxis]
+        elif field == 'month':
+            codes[field] = get_month_index(granule.get_profile_UTC(), first_month, number_of_months)[np.newaxis, :]
+        else:
+            raise ValueError("Unknown group-by field: {}".format(field))
+    return codes
+
+
+class GroupBy():
+
+    """
+    Count, mean and M2 of several variables per group of a composite key built
+    from categorical fields and bins, e.g. (aerosol_type, day_night, lat_bin,
+    alt_bin, month). Each field code is folded into one integer key, so a
+    granule is reduced with a single bincount per statistic whatever the number
+    of fields. occurrence counts every bin with a valid key, including missing
+    values, and gives the occurrence frequency of a category.
+
+    Accumulators from several granules or processes merge exactly
+    (Chan et al. update), and can be saved to / loaded from .npz.
+    """
+
+    def __init__(self, field_sizes, variables):
+
+        self.field_sizes = OrderedDict(field_sizes)
+        self.fields = list(self.field_sizes)
+        self.shape = tuple(self.field_sizes.values())
+        self.number_of_groups = int(np.prod(self.shape))
+        self.variables = list(variables)
+
+        self.occurrence = np.zeros(self.number_of_groups, dtype=np.int64)
+        self.count = {variable: np.zeros(self.number_of_groups, dtype=np.int64) for variable in self.variables}
+        self.mean = {variable: np.zeros(self.number_of_groups) for variable in self.variables}
+        self.m2 = {variable: np.zeros(self.number_of_groups) for variable in self.variables}
+
+    def get_keys(self, codes):
+        """
+        Composite key of every value from the field codes (broadcast together),
+        -1 if any code is outside its field.
+        """
+        arrays = np.broadcast_arrays(*[np.asarray(codes[field]) for field in self.fields])
+        key = np.zeros(arrays[0].shape, dtype=np.int64)
+        invalid = np.zeros(arrays[0].shape, dtype=bool)
+        for code, size in zip(arrays, self.shape):
+            invalid |= (code < 0) | (code >= size)
+            key = key * size + code
+        key[invalid] = -1
+        return key
+
+    def add(self, codes, values):
+        """
+        Adds one granule: codes as from get_granule_codes and {variable: array}
+        values of the same (broadcast) shape. NaN values are skipped.
+        """
+        key = self.get_keys(codes).ravel()
+        valid = key >= 0
+        self.occurrence += np.bincount(key[valid], minlength=self.number_of_groups)
+
+        for variable in self.variables:
+            data = np.asarray(values[variable]).ravel()
+            keep = valid & np.isfinite(data)
+            group = key[keep]
+            data = data[keep].astype(np.float64)
+
+            count = np.bincount(group, minlength=self.number_of_groups)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.bincount(group, weights=data, minlength=self.number_of_groups) / count
+            mean[count == 0] = 0.
+            m2 = np.bincount(group, weights=(data - mean[group]) ** 2, minlength=self.number_of_groups)
+
+            self._combine(variable, count, mean, m2)
+
+    def _combine(self, variable, count, mean, m2):
+        self.count[variable], self.mean[variable], self.m2[variable] = \
+            combine_moments(self.count[variable], self.mean[variable], self.m2[variable], count, mean, m2)
+
+    def merge(self, other):
+
+        if self.field_sizes != other.field_sizes or self.variables != other.variables:
+            raise ValueError("Cannot merge group-by statistics over different keys")
+
+        self.occurrence += other.occurrence
+        for variable in self.variables:
+            self._combine(variable, other.count[variable], other.mean[variable], other.m2[variable])
+        return self
+
+    def _get_axes(self, fields):
+        return tuple(self.fields.index(field) for field in fields)
+
+    def collapse(self, variable, fields=()):
+        """
+        (count, mean, M2) of a variable over the group shape, with the given
+        fields summed out.
+        """
+        count = self.count[variable].reshape(self.shape)
+        mean = self.mean[variable].reshape(self.shape)
+        m2 = self.m2[variable].reshape(self.shape)
+        if len(fields) == 0:
+            return count, mean, m2
+
+        axis = self._get_axes(fields)
+        total = count.sum(axis=axis, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            collapsed_mean = np.where(total > 0, (count * mean).sum(axis=axis, keepdims=True) / total, 0.)
+        m2 = (m2 + count * (mean - collapsed_mean) ** 2).sum(axis=axis)
+
+        return total.squeeze(axis=axis), collapsed_mean.squeeze(axis=axis), m2
+
+    def get_count(self, variable, fields=()):
+        return self.collapse(variable, fields)[0]
+
+    def get_sum(self, variable, fields=()):
+        count, mean, _ = self.collapse(variable, fields)
+        return count * mean
+
+    def get_mean(self, variable, fields=()):
+        count, mean, _ = self.collapse(variable, fields)
+        return np.where(count > 0, mean, np.nan)
+
+    def get_variance(self, variable, fields=(), ddof=0):
+        count, _, m2 = self.collapse(variable, fields)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > ddof, m2 / (count - ddof), np.nan)
+
+    def get_std(self, variable, fields=(), ddof=0):
+        return np.sqrt(self.get_variance(variable, fields, ddof))
+
+    def get_frequency(self, over, fields=()):
+        """
+        Occurrence frequency of the categories of the fields in over within the
+        remaining groups, e.g. over=['aerosol_type'] gives the fraction of bins
+        of each aerosol type per (lat_bin, alt_bin, month). fields are summed
+        out first. NaN where a group is empty.
+        """
+        occurrence = self.occurrence.reshape(self.shape)
+        if len(fields) > 0:
+            occurrence = occurrence.sum(axis=self._get_axes(fields))
+        remaining = [field for field in self.fields if field not in fields]
+
+        axis = tuple(remaining.index(field) for field in over)
+        total = occurrence.sum(axis=axis, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(total > 0, occurrence / total, np.nan)
+
+    def save(self, file_path):
+
+        arrays = {'occurrence': self.occurrence}
+        for variable in self.variables:
+            arrays['{}_count'.format(variable)] = self.count[variable]
+            arrays['{}_mean'.format(variable)] = self.mean[variable]
+            arrays['{}_m2'.format(variable)] = self.m2[variable]
+
+        tmp_file = file_path + '.tmp.npz'
+        np.savez_compressed(tmp_file, fields=json.dumps(list(self.field_sizes.items())),
+                            variables=json.dumps(self.variables), **arrays)
+        os.replace(tmp_file, file_path)
+
+    @classmethod
+    def load(cls, file_path):
+
+        with np.load(file_path) as data:
+            groupby = cls(json.loads(str(data['fields'])), json.loads(str(data['variables'])))
+            groupby.occurrence = data['occurrence']
+            for variable in groupby.variables:
+                groupby.count[variable] = data['{}_count'.format(variable)]
+                groupby.mean[variable] = data['{}_mean'.format(variable)]
+                groupby.m2[variable] = data['{}_m2'.format(variable)]
+
+        return groupby
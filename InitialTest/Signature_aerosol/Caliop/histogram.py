@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    histogram.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        18/10/2026 17:40
+
+import os
+import numpy as np
+
+# fixed bins of the distributions, so that histograms of any month or region merge
+EXTINCTION_EDGES_KM = (1e-4, 10., 20)    # (min, max, bins per decade), km-1
+DEPOLARIZATION_EDGES = (1e-3, 2., 20)
+
+
+def get_log_edges(minimum, maximum, bins_per_decade):
+    """
+    Logarithmically spaced bin edges from minimum to maximum.
+    """
+    number_of_bins = int(np.ceil(np.log10(maximum / minimum) * bins_per_decade))
+    return np.logspace(np.log10(minimum), np.log10(maximum), number_of_bins + 1)
+
+
+def _get_bin(values, edges):
+    # 0 is the underflow (including zero and negative values), len(edges) the overflow
+    return np.searchsorted(edges, values, side='right')
+
+
+class StreamingHistogram():
+
+    """
+    Fixed-memory distribution of one variable per group (e.g. per altitude bin
+    of a region): counts over fixed, usually log-spaced, edges plus an
+    underflow and an overflow bin. Histograms merge by addition, and medians
+    and percentiles are interpolated within the bin holding the quantile,
+    in log space for log-spaced edges.
+    """
+
+    def __init__(self, edges, number_of_groups, log=True):
+
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.number_of_groups = number_of_groups
+        self.log = log
+        self.counts = np.zeros((number_of_groups, len(self.edges) + 1), dtype=np.int64)
+
+    def add(self, values, group):
+        """
+        Adds values with the group index of each one; NaN values and negative
+        groups are skipped.
+        """
+        values = np.asarray(values).ravel()
+        group = np.broadcast_to(group, np.shape(values)).ravel()
+        keep = (group >= 0) & (group < self.number_of_groups) & np.isfinite(values)
+
+        number_of_bins = self.counts.shape[1]
+        cell = group[keep] * number_of_bins + _get_bin(values[keep], self.edges)
+        self.counts += np.bincount(cell, minlength=self.counts.size).reshape(self.counts.shape)
+
+    def merge(self, other):
+
+        if not np.array_equal(self.edges, other.edges) or self.number_of_groups != other.number_of_groups:
+            raise ValueError("Cannot merge histograms over different bins")
+        self.counts += other.counts
+        return self
+
+    def get_quantile(self, q):
+        """
+        q-quantile (0 <= q <= 1) of every group, NaN for empty groups. Values in
+        the underflow/overflow bins are reported at the first/last edge.
+        """
+        counts = self.counts
+        total = counts.sum(axis=1)
+        cdf = np.cumsum(counts, axis=1)
+        target = q * total
+
+        rows = np.arange(self.number_of_groups)
+        index = np.minimum((cdf < target[:, np.newaxis]).sum(axis=1), counts.shape[1] - 1)
+        in_bin = counts[rows, index]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.where(in_bin > 0, (target - (cdf[rows, index] - in_bin)) / in_bin, 0.)
+
+        # bounds of every bin, the outer bins collapsed onto the first and last edge
+        bounds = np.concatenate([self.edges[:1], self.edges, self.edges[-1:]])
+        lower, upper = bounds[index], bounds[index + 1]
+        if self.log:
+            quantile = np.exp(np.log(lower) + fraction * (np.log(upper) - np.log(lower)))
+        else:
+            quantile = lower + fraction * (upper - lower)
+
+        return np.where(total > 0, quantile, np.nan)
+
+    def get_median(self):
+        return self.get_quantile(0.5)
+
+    def get_percentiles(self, percentiles=(5, 25, 50, 75, 95)):
+        """
+        (percentile, group) array.
+        """
+        return np.stack([self.get_quantile(p / 100.) for p in percentiles])
+
+    def save(self, file_path):
+
+        tmp_file = file_path + '.tmp.npz'
+        np.savez_compressed(tmp_file, edges=self.edges, counts=self.counts, log=self.log)
+        os.replace(tmp_file, file_path)
+
+    @classmethod
+    def load(cls, file_path):
+
+        with np.load(file_path) as data:
+            histogram = cls(data['edges'], data['counts'].shape[0], log=bool(data['log']))
+            histogram.counts = data['counts']
+        return histogram
+
+
+class JointHistogram():
+
+    """
+    Mergeable 2D histogram of (x, y) pairs per group, e.g. depolarization vs
+    extinction per aerosol subtype, with underflow and overflow bins on both
+    axes.
+    """
+
+    def __init__(self, x_edges, y_edges, number_of_groups):
+
+        self.x_edges = np.asarray(x_edges, dtype=np.float64)
+        self.y_edges = np.asarray(y_edges, dtype=np.float64)
+        self.number_of_groups = number_of_groups
+        self.counts = np.zeros((number_of_groups, len(self.x_edges) + 1, len(self.y_edges) + 1), dtype=np.int64)
+
+    def add(self, x, y, group):
+
+        x = np.asarray(x).ravel()
+        y = np.asarray(y).ravel()
+        group = np.broadcast_to(group, np.shape(x)).ravel()
+        keep = (group >= 0) & (group < self.number_of_groups) & np.isfinite(x) & np.isfinite(y)
+
+        number_of_x, number_of_y = self.counts.shape[1:]
+        cell = (group[keep] * number_of_x + _get_bin(x[keep], self.x_edges)) * number_of_y + \
+               _get_bin(y[keep], self.y_edges)
+        self.counts += np.bincount(cell, minlength=self.counts.size).reshape(self.counts.shape)
+
+    def merge(self, other):
+
+        if not (np.array_equal(self.x_edges, other.x_edges) and np.array_equal(self.y_edges, other.y_edges)) or \
+                self.number_of_groups != other.number_of_groups:
+            raise ValueError("Cannot merge histograms over different bins")
+        self.counts += other.counts
+        return self
+
+    def get_density(self):
+        """
+        Counts of the inner bins normalised per group, NaN for empty groups.
+        """
+        inner = self.counts[:, 1:-1, 1:-1]
+        total = inner.sum(axis=(1, 2), keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(total > 0, inner / total, np.nan)
+
+    def save(self, file_path):
+
+        tmp_file = file_path + '.tmp.npz'
+        np.savez_compressed(tmp_file, x_edges=self.x_edges, y_edges=self.y_edges, counts=self.counts)
+        os.replace(tmp_file, file_path)
+
+    @classmethod
+    def load(cls, file_path):
+
+        with np.load(file_path) as data:
+            histogram = cls(data['x_edges'], data['y_edges'], data['counts'].shape[0])
+            histogram.counts = data['counts']
+        return histogram
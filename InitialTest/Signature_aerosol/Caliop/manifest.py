@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    manifest.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        17/10/2026 15:30
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+
+DONE = 'done'
+EMPTY = 'empty'      # processed, but no profile in the region
+FAILED = 'failed'
+
+
+def get_file_fingerprint(path):
+    """
+    Cheap fingerprint of an input granule: size and mtime.
+    """
+    stat = os.stat(path)
+    return '{}-{}'.format(stat.st_size, int(stat.st_mtime))
+
+
+def get_config_key(config):
+    """
+    Short stable key of an extraction configuration (region, variables, output format...).
+    """
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+
+
+class ExtractionManifest():
+
+    """
+    Persistent record of which granules have been extracted with which
+    configuration. Per (granule, configuration) it keeps the input fingerprint,
+    the output path, the status and the error message, so that an interrupted
+    run resumes where it stopped and corrupt granules are not retried forever.
+    """
+
+    def __init__(self, manifest_file, config):
+
+        self.manifest_file = manifest_file
+        self.config = config
+        self.config_key = get_config_key(config)
+
+        self.connection = sqlite3.connect(manifest_file)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS configs (
+                config_key TEXT PRIMARY KEY, config TEXT);
+            CREATE TABLE IF NOT EXISTS granules (
+                path TEXT, config_key TEXT, fingerprint TEXT, output_path TEXT,
+                status TEXT, error TEXT, updated REAL,
+                PRIMARY KEY (path, config_key));
+        """)
+        self.connection.execute("INSERT OR REPLACE INTO configs VALUES (?, ?)",
+                                (self.config_key, json.dumps(config, sort_keys=True)))
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def get_record(self, path):
+
+        return self.connection.execute(
+            "SELECT fingerprint, output_path, status, error FROM granules WHERE path = ? AND config_key = ?",
+            (path, self.config_key)).fetchone()
+
+    def needs_processing(self, path, force=False, retry_failed=False):
+        """
+        False for granules already done with an unchanged input (and an output
+        still on disk) and for known-bad granules, unless force or retry_failed.
+        """
+        if force:
+            return True
+
+        record = self.get_record(path)
+        if record is None:
+            return True
+
+        fingerprint, output_path, status, _ = record
+        if fingerprint != get_file_fingerprint(path):
+            return True
+        if status == DONE:
+            return output_path is None or not os.path.exists(output_path)
+        if status == FAILED:
+            return retry_failed
+
+        return False
+
+    def filter(self, paths, force=False, retry_failed=False):
+        return [path for path in paths if self.needs_processing(path, force, retry_failed)]
+
+    def record(self, path, status, output_path=None, error=None):
+
+        self.connection.execute(
+            "INSERT OR REPLACE INTO granules VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (path, self.config_key, get_file_fingerprint(path), output_path, status,
+             None if error is None else str(error), time.time()))
+        self.connection.commit()
+
+    def get_failed(self):
+
+        return self.connection.execute(
+            "SELECT path, error FROM granules WHERE status = ? AND config_key = ?",
+            (FAILED, self.config_key)).fetchall()
+
+    def invalidate(self, config=None, remove_outputs=False):
+        """
+        Forgets everything produced with every stored configuration that contains
+        all items of config, e.g. {'region': [15, 40, 145, -125]} for all runs over
+        that region. Defaults to this configuration. Output files are deleted with
+        remove_outputs. Returns the number of records removed.
+        """
+        criteria = self.config if config is None else config
+        # round trip through json so tuples compare equal to the stored lists
+        criteria = json.loads(json.dumps(criteria))
+
+        config_keys = [config_key for config_key, stored in
+                       self.connection.execute("SELECT config_key, config FROM configs").fetchall()
+                       if all(json.loads(stored).get(key) == value for key, value in criteria.items())]
+
+        # outputs still recorded by a configuration that is kept are never deleted
+        placeholders = ', '.join('?' * len(config_keys))
+        kept_outputs = set(output_path for (output_path,) in self.connection.execute(
+            "SELECT output_path FROM granules WHERE output_path IS NOT NULL AND config_key NOT IN ({})".format(
+                placeholders), config_keys).fetchall())
+
+        number_removed = 0
+        for config_key in config_keys:
+            if remove_outputs:
+                for (output_path,) in self.connection.execute(
+                        "SELECT output_path FROM granules WHERE config_key = ? AND output_path IS NOT NULL",
+                        (config_key,)).fetchall():
+                    if output_path not in kept_outputs and os.path.exists(output_path):
+                        os.remove(output_path)
+
+            number_removed += self.connection.execute(
+                "DELETE FROM granules WHERE config_key = ?", (config_key,)).rowcount
+        self.connection.commit()
+
+        return number_removed
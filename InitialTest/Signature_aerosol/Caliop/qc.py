@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    qc.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        18/10/2026 15:00
+
+import json
+from collections import OrderedDict
+import numpy as np
+
+# order in which the rules are evaluated and reported
+QC_RULES = ['altitude', 'below_tropopause', 'feature_type', 'feature_subtype', 'cad_score', 'extinction_qc']
+
+# commonly used settings, usable by name wherever a filter is expected
+QC_PRESETS = {
+    # aerosol bins with a confident CAD score and an unconstrained or constrained extinction retrieval
+    'aerosol': {'feature_type': [3], 'cad_score': [-100, -20], 'extinction_qc': [0, 1], 'below_tropopause': True},
+}
+
+
+class QCFilter():
+
+    """
+    Declarative quality control of (altitude, profile) bins, evaluated inside
+    CaliopGranule.apply_qc before any curtain is read. Every rule is optional:
+
+        altitude          [min, max] in km
+        below_tropopause  keep bins below the tropopause height of their profile
+        feature_type      accepted feature types (3 = tropospheric aerosol)
+        feature_subtype   accepted feature subtypes
+        cad_score         [min, max] CAD score, e.g. [-100, -20] for confident aerosol
+        extinction_qc     accepted Extinction_QC_Flag_532 values
+
+    Profiles without any bin left are dropped from the selection, so they are
+    never read or written.
+    """
+
+    def __init__(self, altitude=None, below_tropopause=False, feature_type=None, feature_subtype=None,
+                 cad_score=None, extinction_qc=None, flag_variable='Atmospheric_Volume_Description',
+                 cad_variable='CAD_Score', extinction_qc_variable='Extinction_QC_Flag_532'):
+
+        self.altitude = altitude
+        self.below_tropopause = below_tropopause
+        self.feature_type = feature_type
+        self.feature_subtype = feature_subtype
+        self.cad_score = cad_score
+        self.extinction_qc = extinction_qc
+
+        self.flag_variable = flag_variable
+        self.cad_variable = cad_variable
+        self.extinction_qc_variable = extinction_qc_variable
+
+    @classmethod
+    def from_dict(cls, config):
+        return cls(**config)
+
+    @classmethod
+    def from_json(cls, file_path):
+
+        with open(file_path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+    @classmethod
+    def from_argument(cls, argument):
+        """
+        Filter from a preset name or a JSON file, as given on the command line.
+        """
+        if argument in QC_PRESETS:
+            return cls.from_dict(QC_PRESETS[argument])
+        return cls.from_json(argument)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in QC_RULES if getattr(self, name) not in (None, False)}
+
+    def _get_rule_mask(self, granule, name):
+
+        if name == 'altitude':
+            altitudes = granule.get_altitudes()
+            return ((altitudes >= self.altitude[0]) & (altitudes <= self.altitude[1]))[:, np.newaxis]
+
+        if name == 'below_tropopause':
+            # profiles without a valid tropopause height lose every bin
+            tropopause = granule.get_tropopause_height()
+            tropopause = np.where(tropopause > 0, tropopause, -np.inf)
+            return granule.get_altitudes()[:, np.newaxis] < tropopause[np.newaxis, :]
+
+        if name in ('feature_type', 'feature_subtype'):
+            return np.isin(granule.get_feature_flags(self.flag_variable)[name], getattr(self, name))
+
+        if name == 'cad_score':
+            cad_score = _get_first_layer(granule.read(self.cad_variable)).T
+            return (cad_score >= self.cad_score[0]) & (cad_score <= self.cad_score[1])
+
+        if name == 'extinction_qc':
+            extinction_qc = _get_first_layer(granule.read(self.extinction_qc_variable)).T
+            return np.isin(extinction_qc, self.extinction_qc)
+
+        raise ValueError("Unknown QC rule: {}".format(name))
+
+    def evaluate(self, granule):
+        """
+        Returns the (altitude, profile) mask of the bins passing every rule and
+        the number of bins each rule removed, in evaluation order (a bin is
+        counted against the first rule it fails).
+        """
+        shape = (len(granule.get_altitudes()), len(granule.get_latitude()))
+        keep = np.ones(shape, dtype=bool)
+
+        report = OrderedDict()
+        for name in QC_RULES:
+            if getattr(self, name) in (None, False):
+                continue
+            rule_mask = np.broadcast_to(self._get_rule_mask(granule, name), shape)
+            report[name] = int(np.count_nonzero(keep & ~rule_mask))
+            keep &= rule_mask
+
+        report['kept'] = int(np.count_nonzero(keep))
+        return keep, report
+
+
+def _get_first_layer(data):
+    # a few APro QC fields carry a trailing (2) dimension, keep the first entry like the flags
+    return data[:, :, 0] if data.ndim == 3 else data
+
+
+def merge_reports(total, report):
+    """
+    Adds the counts of one granule report to a running total.
+    """
+    for name, count in report.items():
+        total[name] = total.get(name, 0) + count
+    return total
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    region.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        18/10/2026 13:20
+
+import json
+import numpy as np
+
+
+class Region():
+
+    """
+    Base class of the profile selections. A region turns the lat/lon of every
+    profile of a granule into one boolean mask, computed once and reused for
+    every variable. Regions combine with | (union), & (intersection) and
+    - (difference).
+    """
+
+    def get_mask(self, lat, lon):
+        raise NotImplementedError
+
+    def get_bounds(self):
+        """
+        (south, north, west, east) box containing the region, west > east if it
+        crosses the dateline. Used to prune granules before reading them.
+        """
+        raise NotImplementedError
+
+    def get_index(self, lat, lon):
+        return np.flatnonzero(self.get_mask(lat, lon))
+
+    def __or__(self, other):
+        return UnionRegion(self, other)
+
+    def __and__(self, other):
+        return IntersectionRegion(self, other)
+
+    def __sub__(self, other):
+        return DifferenceRegion(self, other)
+
+
+class BoxRegion(Region):
+
+    """
+    Lat/lon box with strict bounds. If west > east the box crosses the dateline,
+    e.g. BoxRegion(15, 40, 145, -125) for 145E to 125W.
+    """
+
+    def __init__(self, south, north, west, east):
+        self.south, self.north, self.west, self.east = south, north, west, east
+
+    def get_mask(self, lat, lon):
+
+        lat = np.asarray(lat)
+        lon = np.asarray(lon)
+        if self.west > self.east:
+            lon_mask = (lon > self.west) | (lon < self.east)
+        else:
+            lon_mask = (lon > self.west) & (lon < self.east)
+
+        return (lat > self.south) & (lat < self.north) & lon_mask
+
+    def get_bounds(self):
+        return self.south, self.north, self.west, self.east
+
+    def __repr__(self):
+        return 'BoxRegion({}, {}, {}, {})'.format(self.south, self.north, self.west, self.east)
+
+
+class PolygonRegion(Region):
+
+    """
+    Polygon given by its (lon, lat) vertices, e.g. a garbage patch outline.
+    The vertices are unwrapped so that a polygon may cross the dateline; the
+    point-in-polygon test is an even-odd ray casting vectorised over profiles.
+    """
+
+    def __init__(self, vertices, name=None):
+
+        vertices = np.asarray(vertices, dtype=np.float64)
+        if np.array_equal(vertices[0], vertices[-1]):
+            vertices = vertices[:-1]
+
+        lon = vertices[:, 0].copy()
+        # make consecutive vertices continuous across the dateline
+        lon[1:] = lon[0] + np.cumsum((np.diff(lon) + 180.) % 360. - 180.)
+        self.lon = lon
+        self.lat = vertices[:, 1]
+        self.name = name
+
+    def get_mask(self, lat, lon):
+
+        lat = np.asarray(lat, dtype=np.float64)
+        # bring the profiles into the frame of the unwrapped vertices
+        lon = (np.asarray(lon, dtype=np.float64) - self.lon.min()) % 360. + self.lon.min()
+
+        inside = np.zeros(lat.shape, dtype=bool)
+        lon_j, lat_j = self.lon[-1], self.lat[-1]
+        for lon_i, lat_i in zip(self.lon, self.lat):
+            crosses = (lat_i > lat) != (lat_j > lat)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                lon_cross = (lon_j - lon_i) * (lat - lat_i) / (lat_j - lat_i) + lon_i
+            inside ^= crosses & (lon < lon_cross)
+            lon_j, lat_j = lon_i, lat_i
+
+        return inside
+
+    def get_bounds(self):
+
+        west, east = self.lon.min(), self.lon.max()
+        west = (west + 180.) % 360. - 180.
+        east = (east + 180.) % 360. - 180.
+        return self.lat.min(), self.lat.max(), west, east
+
+    @classmethod
+    def from_geojson(cls, file_path):
+        """
+        Region of every Polygon / MultiPolygon in a GeoJSON file (geometry,
+        Feature or FeatureCollection). Holes are subtracted.
+        """
+        with open(file_path, 'r') as f:
+            geojson = json.load(f)
+
+        region = _polygon_from_geometries(_get_geometries(geojson), cls)
+        if region is None:
+            raise ValueError("No polygon found in {}".format(file_path))
+
+        return region
+
+
+def _get_geometries(geojson):
+
+    if geojson['type'] == 'FeatureCollection':
+        return [geometry for feature in geojson['features'] for geometry in _get_geometries(feature)]
+    if geojson['type'] == 'Feature':
+        return _get_geometries(geojson['geometry'])
+    if geojson['type'] == 'GeometryCollection':
+        return [geometry for item in geojson['geometries'] for geometry in _get_geometries(item)]
+    if geojson['type'] in ('Polygon', 'MultiPolygon'):
+        return [geojson]
+    return []
+
+
+def _polygon_from_geometries(geometries, polygon_class=None):
+    """
+    Union of the Polygon / MultiPolygon geometries, holes subtracted. None if
+    there is no polygon.
+    """
+    polygon_class = PolygonRegion if polygon_class is None else polygon_class
+
+    region = None
+    for geometry in geometries:
+        polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+        for rings in polygons:
+            polygon = polygon_class(rings[0])
+            for hole in rings[1:]:
+                polygon = polygon - polygon_class(hole)
+            region = polygon if region is None else region | polygon
+
+    return region
+
+
+def _merge_bounds(bounds_a, bounds_b):
+    """
+    Smallest box holding two boxes, possibly crossing the dateline.
+    """
+    south = min(bounds_a[0], bounds_b[0])
+    north = max(bounds_a[1], bounds_b[1])
+
+    def unwrap(west, east, start):
+        west = start + (west - start) % 360.
+        east = west + (east - west) % 360.
+        return west, east if east > west else east + 360.
+
+    # start the merged box at either western edge and keep the narrower one
+    candidates = []
+    for start in [bounds_a[2], bounds_b[2]]:
+        east = max(unwrap(bounds_a[2], bounds_a[3], start)[1], unwrap(bounds_b[2], bounds_b[3], start)[1])
+        candidates.append((east - start, start, east))
+    width, west, east = min(candidates)
+    if width >= 360.:
+        return south, north, -180., 180.
+
+    return south, north, (west + 180.) % 360. - 180., (east + 180.) % 360. - 180.
+
+class UnionRegion(Region):
+
+    def __init__(self, region_a, region_b):
+        self.region_a, self.region_b = region_a, region_b
+
+    def get_mask(self, lat, lon):
+        return self.region_a.get_mask(lat, lon) | self.region_b.get_mask(lat, lon)
+
+    def get_bounds(self):
+        return _merge_bounds(self.region_a.get_bounds(), self.region_b.get_bounds())
+
+
+class IntersectionRegion(Region):
+
+    def __init__(self, region_a, region_b):
+        self.region_a, self.region_b = region_a, region_b
+
+    def get_mask(self, lat, lon):
+        return self.region_a.get_mask(lat, lon) & self.region_b.get_mask(lat, lon)
+
+    def get_bounds(self):
+        # either box is a valid (if not the tightest) bound of the intersection
+        return self.region_a.get_bounds()
+
+
+class DifferenceRegion(Region):
+
+    def __init__(self, region_a, region_b):
+        self.region_a, self.region_b = region_a, region_b
+
+    def get_mask(self, lat, lon):
+        return self.region_a.get_mask(lat, lon) & ~self.region_b.get_mask(lat, lon)
+
+    def get_bounds(self):
+        return self.region_a.get_bounds()
+
+
+class RegionSet():
+
+    """
+    Ordered set of named regions evaluated together, e.g. a garbage patch and
+    its northern and southern controls. Granules are read once over the union
+    of the regions and every profile is labelled with a bit per region, so
+    adding a control region costs one more mask instead of a full re-run.
+    """
+
+    MAX_REGIONS = 32
+
+    def __init__(self, regions):
+
+        regions = list(regions.items()) if isinstance(regions, dict) else list(regions)
+        if len(regions) > self.MAX_REGIONS:
+            raise ValueError("At most {} regions can be labelled at once".format(self.MAX_REGIONS))
+
+        self.names = [name for name, _ in regions]
+        self.regions = [region for _, region in regions]
+
+    def __len__(self):
+        return len(self.regions)
+
+    def get_union(self):
+
+        union = self.regions[0]
+        for region in self.regions[1:]:
+            union = union | region
+        return union
+
+    def get_masks(self, lat, lon):
+        """
+        (region, profile) boolean masks. Regions may overlap.
+        """
+        return np.stack([region.get_mask(lat, lon) for region in self.regions])
+
+    def get_flags(self, lat, lon):
+        """
+        Bit i of the flag of a profile is set if it lies in region i.
+        """
+        masks = self.get_masks(lat, lon)
+        weights = (np.uint32(1) << np.arange(len(self), dtype=np.uint32))[:, np.newaxis]
+        return (masks * weights).sum(axis=0, dtype=np.uint32)
+
+    def get_region_id(self, lat, lon):
+        """
+        Index of the first region holding each profile, -1 outside every region.
+        """
+        masks = self.get_masks(lat, lon)
+        return np.where(masks.any(axis=0), masks.argmax(axis=0), -1)
+
+    def masks_from_flags(self, flags, names=None):
+        """
+        (region, profile) masks from stored flags. names are the regions the
+        flags were written with; they are matched to this set by name.
+        """
+        names = self.names if names is None else list(names)
+        flags = np.asarray(flags, dtype=np.uint32)
+        return np.stack([(flags >> np.uint32(names.index(name))) & 1 == 1 for name in self.names])
+
+    def get_profile_masks(self, data):
+        """
+        (region, profile) masks of a loaded granule. The flags stored at
+        extraction time are used when they cover every region of this set.
+        """
+        if 'region_flags' in data and set(self.names) <= set(data['region_names']):
+            return self.masks_from_flags(data['region_flags'], data['region_names'])
+        return self.get_masks(data['caliop_lat'], data['caliop_lon'])
+
+    @classmethod
+    def from_geojson(cls, file_path):
+        """
+        One region per Feature of a FeatureCollection, named by its 'name' property.
+        """
+        with open(file_path, 'r') as f:
+            geojson = json.load(f)
+
+        regions = []
+        for index, feature in enumerate(geojson['features']):
+            name = (feature.get('properties') or {}).get('name', 'region{}'.format(index))
+            region = _polygon_from_geometries(_get_geometries(feature))
+            if region is None:
+                raise ValueError("Feature {} of {} has no polygon".format(name, file_path))
+            regions.append((name, region))
+
+        return cls(regions)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    schema.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        17/10/2026 10:05
+
+import os
+import re
+import json
+import logging
+import numpy as np
+
+# e.g. CAL_LID_L2_05kmAPro-Standard-V4-51.2017-06-01T00-23-18ZN.hdf
+PRODUCT_VERSION_PATTERN = re.compile(r'(CAL_LID_[A-Za-z0-9_]+-[A-Za-z]+)-(V\d+-\d+)')
+# bumped whenever the fingerprint changes, so that older cache files are rebuilt
+SCHEMA_FORMAT = 2
+DEFAULT_CACHE_PATH = os.environ.get('CALIOP_SCHEMA_CACHE',
+                                    os.path.join(os.path.expanduser('~'), '.cache', 'PacificPlastic', 'caliop_schema'))
+
+
+def get_product_version(filename):
+    """
+    Returns (product, version) parsed from a CALIOP granule name, or None if the
+    name does not follow the standard naming convention.
+    """
+    match = PRODUCT_VERSION_PATTERN.search(os.path.basename(filename))
+    if match is None:
+        return None
+    return match.group(1), match.group(2)
+
+
+def get_fingerprint(sd):
+    """
+    Cheap check for version drift from the SD header: number of datasets and
+    of global attributes, then the name, HDF type code and shape of every
+    dataset, read without selecting any. The profile dimension, which differs
+    from granule to granule, is stored as None.
+    """
+    datasets = sd.datasets()
+    number_of_profiles = _get_dims(datasets['Latitude'][1])[0] if 'Latitude' in datasets else None
+
+    shapes = []
+    for name in sorted(datasets):
+        _, dims, hdf_type, _ = datasets[name]
+        dims = [None if dim == number_of_profiles else int(dim) for dim in _get_dims(dims)]
+        shapes.append([name, int(hdf_type), dims])
+
+    return [int(value) for value in sd.info()] + [shapes]
+
+
+def _get_dims(dims):
+    return list(dims) if isinstance(dims, (list, tuple)) else [dims]
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("Cannot serialise {!r}".format(value))
+
+
+class CaliopSchema():
+
+    """
+    Header information shared by every granule of one product version: the
+    altitude grid and, per SDS, its shape, HDF type code and attributes.
+    Shapes are those of the granule the schema was built from, so the profile
+    dimension is only indicative.
+    """
+
+    def __init__(self, product, version, fingerprint, altitudes, datasets):
+
+        self.product = product
+        self.version = version
+        self.fingerprint = list(fingerprint)
+        self.altitudes = np.asarray(altitudes, dtype=np.float32)
+        self.datasets = datasets
+
+    @classmethod
+    def from_granule(cls, granule, product, version):
+
+        datasets = {}
+        for name, (_, dims, hdf_type, _) in granule.sd.datasets().items():
+            datasets[name] = {'shape': _get_dims(dims),
+                              'type': hdf_type,
+                              'attributes': granule.select(name).attributes()}
+
+        return cls(product, version, get_fingerprint(granule.sd),
+                   granule.read_altitudes(), datasets)
+
+    def get_variable_names(self):
+        """
+        Returns the names of the 2D (profile x altitude) variables.
+        """
+        valid_shape = [self.datasets['Latitude']['shape'][0], len(self.altitudes)]
+        return set([name for name, info in self.datasets.items() if info['shape'] == valid_shape])
+
+    def to_dict(self):
+        return {'format': SCHEMA_FORMAT,
+                'product': self.product,
+                'version': self.version,
+                'fingerprint': self.fingerprint,
+                'altitudes': self.altitudes.tolist(),
+                'datasets': self.datasets}
+
+    @classmethod
+    def from_dict(cls, dictionary):
+        return cls(dictionary['product'], dictionary['version'], dictionary['fingerprint'],
+                   dictionary['altitudes'], dictionary['datasets'])
+
+
+class CaliopSchemaCache():
+
+    """
+    Persistent cache of CaliopSchema objects, one JSON file per product and
+    version under cache_path. A granule whose fingerprint does not match the
+    cached one is read from its own headers instead.
+    """
+
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH):
+
+        self.cache_path = cache_path
+        self._schemas = {}
+
+    def _get_cache_file(self, product, version):
+        return os.path.join(self.cache_path, '{}-{}.json'.format(product, version))
+
+    def load(self, product, version):
+
+        key = (product, version)
+        if key not in self._schemas:
+            cache_file = self._get_cache_file(product, version)
+            if not os.path.exists(cache_file):
+                return None
+            with open(cache_file, 'r') as f:
+                dictionary = json.load(f)
+            # written with another fingerprint, rebuilt by get
+            if dictionary.get('format') != SCHEMA_FORMAT:
+                return None
+            self._schemas[key] = CaliopSchema.from_dict(dictionary)
+
+        return self._schemas[key]
+
+    def save(self, schema):
+
+        if not os.path.exists(self.cache_path):
+            os.makedirs(self.cache_path, exist_ok=True)
+
+        cache_file = self._get_cache_file(schema.product, schema.version)
+        # write to a temporary file first so that concurrent jobs never read half a file
+        tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+        with open(tmp_file, 'w') as f:
+            json.dump(schema.to_dict(), f, default=_to_json)
+        os.replace(tmp_file, cache_file)
+
+        self._schemas[(schema.product, schema.version)] = schema
+
+    def get(self, granule):
+        """
+        Returns the schema of an open CaliopGranule, building and saving it on a
+        cache miss. Returns None for unrecognised file names or version drift.
+        """
+        product_version = get_product_version(granule.filename)
+        if product_version is None:
+            return None
+
+        schema = self.load(*product_version)
+
+        if schema is None:
+            schema = CaliopSchema.from_granule(granule, *product_version)
+            self.save(schema)
+            logging.info("Cached schema of {} {}".format(*product_version))
+            return schema
+
+        if get_fingerprint(granule.sd) != schema.fingerprint:
+            logging.warning("Schema fingerprint of {} does not match the cached {} {}, "
+                            "reading headers instead".format(granule.filename, *product_version))
+            return None
+
+        return schema
+
+
+_default_schema_cache = None
+
+def get_default_schema_cache():
+
+    global _default_schema_cache
+
+    if _default_schema_cache is None:
+        _default_schema_cache = CaliopSchemaCache()
+
+    return _default_schema_cache
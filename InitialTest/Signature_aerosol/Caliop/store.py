@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    store.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        17/10/2026 16:40
+
+import os
+import json
+import netCDF4 as nc
+import numpy as np
+import pandas as pd
+
+NUM_ROWS = 399  # altitude bins of the 5 km APro curtains, used for the legacy csv files
+
+# compact on-disk types of the curtain variables
+CURTAIN_VARIABLES = {'caliop_aerosol_type': 'u1',
+                     'caliop_feature_type': 'u1',
+                     'caliop_dp': 'f4',
+                     'beta_caliop': 'f4',
+                     'alpha_caliop': 'f4'}
+TIME_UNITS = 'milliseconds since 1970-01-01 00:00:00'
+
+
+def _write_profile_variables(dataset, result, complevel):
+    """
+    Writes the altitude axis and the per-profile variables shared by the dense
+    and sparse layouts.
+    """
+    altitude = dataset.createVariable('alt_caliop', 'f4', ('altitude',))
+    altitude.units = 'km'
+    altitude[:] = result['alt_caliop']
+
+    for name in ['caliop_lat', 'caliop_lon']:
+        variable = dataset.createVariable(name, 'f4', ('profile',), zlib=True, complevel=complevel)
+        variable[:] = result[name]
+
+    if 'caliop_time' in result:
+        variable = dataset.createVariable('caliop_time', 'i8', ('profile',), zlib=True, complevel=complevel)
+        variable.units = TIME_UNITS
+        variable[:] = result['caliop_time'].astype('datetime64[ms]').astype(np.int64)
+
+    # lat/lon bins of every profile on the grid of the extraction
+    for name in ['lat_bin', 'lon_bin']:
+        if name in result:
+            variable = dataset.createVariable(name, 'i2', ('profile',), zlib=True, complevel=complevel)
+            variable.grid = result['grid']
+            variable[:] = result[name]
+
+    # bit i set if the profile lies in region i of a RegionSet, names as a JSON list since they are free text
+    if 'region_flags' in result:
+        variable = dataset.createVariable('region_flags', 'u4', ('profile',), zlib=True, complevel=complevel)
+        variable.regions = json.dumps(list(result['region_names']))
+        variable[:] = result['region_flags']
+
+
+def get_region_names(attribute):
+    """
+    Decodes the region names of a region_flags variable. Files written before
+    the names were JSON-encoded hold them comma-joined.
+    """
+    if attribute.startswith('['):
+        return json.loads(attribute)
+    return attribute.split(',')
+
+
+def save_granule(output_file, result, complevel=4):
+    """
+    Saves the region subset of one granule as NetCDF4. Curtain variables are
+    stored as (profile, altitude) arrays, lat/lon/time per profile and the
+    altitude axis once. result holds the curtains as (altitude, profile)
+    arrays, like the rest of the extraction code.
+    """
+    number_of_altitudes, number_of_profiles = result['caliop_aerosol_type'].shape
+    chunk_profiles = max(1, min(number_of_profiles, 1024))
+
+    # write next to the output first so that an interrupted job never leaves a truncated file
+    tmp_file = output_file + '.tmp'
+    with nc.Dataset(tmp_file, mode='w', format='NETCDF4') as dataset:
+        dataset.createDimension('profile', number_of_profiles)
+        dataset.createDimension('altitude', number_of_altitudes)
+        _write_profile_variables(dataset, result, complevel)
+
+        for name, dtype in CURTAIN_VARIABLES.items():
+            if name not in result:
+                continue
+            variable = dataset.createVariable(name, dtype, ('profile', 'altitude'), zlib=True, shuffle=True,
+                                              complevel=complevel,
+                                              chunksizes=(chunk_profiles, number_of_altitudes))
+            variable[:] = result[name].T
+
+    os.replace(tmp_file, output_file)
+
+
+def save_granule_sparse(output_file, result, feature_types=(3,), complevel=4):
+    """
+    Saves only the (profile, altitude) bins whose feature type is in
+    feature_types (3 = tropospheric aerosol) as COO records: bin_profile and
+    bin_altitude index the per-profile variables and the altitude axis, and
+    every curtain variable holds one value per record. Per-profile variables
+    are kept for every profile, so profiles without a stored bin still count
+    in occurrence statistics.
+    """
+    number_of_altitudes, number_of_profiles = result['caliop_aerosol_type'].shape
+    # records ordered by profile then altitude, so that a profile is contiguous on disk
+    bin_profile, bin_altitude = np.nonzero(np.isin(result['caliop_feature_type'], feature_types).T)
+    chunk_bins = max(1, min(len(bin_profile), 16384))
+
+    tmp_file = output_file + '.tmp'
+    with nc.Dataset(tmp_file, mode='w', format='NETCDF4') as dataset:
+        dataset.layout = 'sparse'
+        dataset.feature_types = np.asarray(feature_types, dtype=np.int16)
+
+        dataset.createDimension('profile', number_of_profiles)
+        dataset.createDimension('altitude', number_of_altitudes)
+        dataset.createDimension('bin', len(bin_profile))
+        _write_profile_variables(dataset, result, complevel)
+
+        for name, dtype, values in [('bin_profile', 'i4', bin_profile), ('bin_altitude', 'i2', bin_altitude)]:
+            dataset.createVariable(name, dtype, ('bin',), zlib=True, shuffle=True, complevel=complevel,
+                                   chunksizes=(chunk_bins,))[:] = values
+
+        for name, dtype in CURTAIN_VARIABLES.items():
+            if name not in result:
+                continue
+            variable = dataset.createVariable(name, dtype, ('bin',), zlib=True, shuffle=True,
+                                              complevel=complevel, chunksizes=(chunk_bins,))
+            variable[:] = result[name][bin_altitude, bin_profile]
+
+    os.replace(tmp_file, output_file)
+
+
+def load_granule(file_path, variables=None, dense=True):
+    """
+    Loads one extracted granule. Curtains are returned as (altitude, profile)
+    arrays, lat/lon per profile and alt_caliop once. NetCDF files are read
+    directly; legacy long-format csv files are reshaped as before.
+
+    Sparse files are expanded to curtains (NaN, or 0 for the classification
+    variables, outside the stored bins) unless dense=False, in which case the
+    curtain variables are returned as records with bin_profile/bin_altitude
+    and data['layout'] is 'sparse'. data['feature_types'] lists the feature
+    types of the stored bins.
+    """
+    if file_path.endswith('.csv'):
+        return _load_granule_csv(file_path, variables)
+
+    variables = list(CURTAIN_VARIABLES) if variables is None else variables
+
+    data = {'layout': 'dense'}
+    with nc.Dataset(file_path, mode='r') as dataset:
+        dataset.set_auto_mask(False)
+        for name in ['caliop_lat', 'caliop_lon', 'alt_caliop']:
+            data[name] = dataset[name][:]
+        if 'caliop_time' in dataset.variables:
+            data['caliop_time'] = dataset['caliop_time'][:].astype('datetime64[ms]')
+        for name in ['lat_bin', 'lon_bin']:
+            if name in dataset.variables:
+                data[name] = dataset[name][:]
+                data[name + '_grid'] = dataset[name].grid
+        if 'region_flags' in dataset.variables:
+            data['region_flags'] = dataset['region_flags'][:]
+            data['region_names'] = get_region_names(dataset['region_flags'].regions)
+
+        sparse = getattr(dataset, 'layout', 'dense') == 'sparse'
+        if sparse:
+            data['layout'] = 'sparse'
+            data['feature_types'] = [int(value) for value in np.atleast_1d(dataset.feature_types)]
+            data['bin_profile'] = dataset['bin_profile'][:].astype(np.int64)
+            data['bin_altitude'] = dataset['bin_altitude'][:].astype(np.int64)
+
+        for name in variables:
+            if name in dataset.variables:
+                data[name] = dataset[name][:] if sparse else dataset[name][:].T
+
+    if sparse and dense:
+        data = densify_granule(data)
+
+    return data
+
+
+def densify_granule(data):
+    """
+    Expands the records of a sparse granule to (altitude, profile) curtains.
+    """
+    shape = (len(data['alt_caliop']), len(data['caliop_lat']))
+    dense = {name: value for name, value in data.items() if name not in ('bin_profile', 'bin_altitude')}
+    dense['layout'] = 'dense'
+
+    for name in CURTAIN_VARIABLES:
+        if name not in data:
+            continue
+        values = data[name]
+        fill = np.nan if np.issubdtype(values.dtype, np.floating) else 0
+        curtain = np.full(shape, fill, dtype=values.dtype)
+        curtain[data['bin_altitude'], data['bin_profile']] = values
+        dense[name] = curtain
+
+    return dense
+
+
+def get_granule_records(data, variables):
+    """
+    Flat (values, profile index, altitude index) view of a loaded granule,
+    dense or sparse: returns ({variable: values}, profile, altitude).
+    """
+    if data.get('layout') == 'sparse':
+        return {name: data[name] for name in variables}, data['bin_profile'], data['bin_altitude']
+
+    number_of_altitudes, number_of_profiles = data[variables[0]].shape
+    profile = np.tile(np.arange(number_of_profiles), number_of_altitudes)
+    altitude = np.repeat(np.arange(number_of_altitudes), number_of_profiles)
+    return {name: data[name].ravel() for name in variables}, profile, altitude
+
+
+def _load_granule_csv(file_path, variables=None):
+
+    variables = list(CURTAIN_VARIABLES) if variables is None else variables
+
+    df = pd.read_csv(file_path)
+    num_cols = len(df) // NUM_ROWS  # Calculate number of columns
+
+    data = {'caliop_lat': df['caliop_lat'].values[:num_cols],
+            'caliop_lon': df['caliop_lon'].values[:num_cols],
+            'alt_caliop': df['alt_caliop'].values[::num_cols]}
+    for name in variables:
+        data[name] = df[name].values.reshape(NUM_ROWS, num_cols)
+
+    return data
+
+
+def list_granule_files(path, pattern=''):
+    """
+    Returns the extracted granule files (.nc or legacy .csv) in path whose name contains pattern.
+    """
+    return sorted([os.path.join(path, file) for file in os.listdir(path)
+                   if file.endswith(('.nc', '.csv')) and pattern in file])
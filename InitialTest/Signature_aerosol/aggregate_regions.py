@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    aggregate_regions.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        18/10/2026 14:10
+
+import os
+import argparse
+import numpy as np
+from Caliop.store import load_granule, list_granule_files, get_granule_records
+from Caliop.binning import BinnedStatistics
+from Caliop.histogram import StreamingHistogram, JointHistogram, get_log_edges, \
+    EXTINCTION_EDGES_KM, DEPOLARIZATION_EDGES
+from Caliop.region import RegionSet
+from Caliop.groupby import AEROSOL_FEATURE_TYPES
+from caliop_extraction import REGIONS
+
+NUM_ROWS = 399  # altitude bins of the 5 km APro curtains
+NUMBER_OF_SUBTYPES = 8  # 3-bit aerosol subtype field
+
+# variables with a streaming distribution, and the (x, y) pair of the joint histogram
+HISTOGRAM_EDGES = {'alpha_caliop': EXTINCTION_EDGES_KM, 'caliop_dp': DEPOLARIZATION_EDGES}
+JOINT_VARIABLES = ('caliop_dp', 'alpha_caliop')
+
+
+def aggregate_regions(file_paths, region_set, grid, coordinate, variables, feature_types=AEROSOL_FEATURE_TYPES):
+    """
+    Reads every extracted granule once and fills, per region, one
+    BinnedStatistics per variable over the lat or lon bins of grid, a
+    StreamingHistogram per altitude bin of extinction and depolarization and a
+    depolarization vs extinction JointHistogram per aerosol subtype.
+    Returns {region: {variable: statistics}}, {region: {name: histogram}} and
+    the altitudes.
+
+    Statistics and histograms only take the bins whose feature type is in
+    feature_types, for dense and sparse granules alike, so clouds and clear air
+    never enter the aerosol curtains and distributions and a month gives the
+    same results whatever its storage layout. Sparse granules must store every
+    one of feature_types.
+    """
+    bin_edges = grid.lat_edges if coordinate == 'lat' else grid.lon_edges
+    statistics = {name: {variable: BinnedStatistics(bin_edges, NUM_ROWS) for variable in variables}
+                  for name in region_set.names}
+
+    histogram_variables = [variable for variable in variables if variable in HISTOGRAM_EDGES]
+    joint = all(variable in variables for variable in JOINT_VARIABLES)
+    histograms = {}
+    for name in region_set.names:
+        histograms[name] = {variable: StreamingHistogram(get_log_edges(*HISTOGRAM_EDGES[variable]), NUM_ROWS)
+                            for variable in histogram_variables}
+        if joint:
+            histograms[name]['joint'] = JointHistogram(get_log_edges(*HISTOGRAM_EDGES[JOINT_VARIABLES[0]]),
+                                                       get_log_edges(*HISTOGRAM_EDGES[JOINT_VARIABLES[1]]),
+                                                       NUMBER_OF_SUBTYPES)
+
+    record_variables = histogram_variables + (['caliop_aerosol_type'] if joint else [])
+    if record_variables:
+        record_variables.append('caliop_feature_type')
+    alts = None
+
+    for file_path in file_paths:
+        data = load_granule(file_path, list(set(variables) | set(record_variables) | {'caliop_feature_type'}),
+                            dense=False)
+        alts = data['alt_caliop']
+        bin_index = grid.get_profile_index(data, coordinate)
+        masks = region_set.get_profile_masks(data)
+        if record_variables:
+            if data['layout'] == 'sparse' and not set(feature_types) <= set(data['feature_types']):
+                raise ValueError("{} only stores feature types {}, not {}".format(
+                    file_path, data['feature_types'], list(feature_types)))
+            records, record_profile, record_altitude = get_granule_records(data, record_variables)
+            selected = np.isin(records['caliop_feature_type'], feature_types)
+
+        for name, mask in zip(region_set.names, masks):
+            if not mask.any():
+                continue
+            # profiles outside the region are skipped through their bin index
+            region_bin_index = np.where(mask, bin_index, -1)
+            for variable in variables:
+                statistics[name][variable].add_granule(data, variable, region_bin_index, feature_types)
+
+            # distributions from the same records, grouped by altitude bin or subtype
+            if record_variables:
+                inside = mask[record_profile] & selected
+                for variable in histogram_variables:
+                    histograms[name][variable].add(records[variable][inside], record_altitude[inside])
+                if joint:
+                    histograms[name]['joint'].add(records[JOINT_VARIABLES[0]][inside],
+                                                  records[JOINT_VARIABLES[1]][inside],
+                                                  records['caliop_aerosol_type'][inside].astype(np.int64))
+
+    return statistics, histograms, alts
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Aggregate extracted CALIOP curtains over several regions in one pass.")
+    parser.add_argument("MONTH", type=str, help="Month in the format YYYY-MM.")
+    parser.add_argument("REGIONS", type=str, help="GeoJSON FeatureCollection of named regions.")
+    parser.add_argument("--region", type=str, default='lat', choices=sorted(REGIONS),
+                        help="Predefined grid and extraction directory.")
+    parser.add_argument("--variables", type=str, nargs='+', default=['alpha_caliop', 'caliop_dp'],
+                        help="Curtain variables to aggregate.")
+    parser.add_argument("--feature_types", type=int, nargs='+', default=list(AEROSOL_FEATURE_TYPES),
+                        help="Feature types of the bins aggregated (3 = tropospheric aerosol).")
+    parser.add_argument("--input_path", type=str, default=None, help="Overrides the extraction directory.")
+    parser.add_argument("--output_path", type=str, default='./region_statistics',
+                        help="Directory of the per-region statistics (.npz).")
+    args = parser.parse_args()
+
+    grid, input_path = REGIONS[args.region]
+    input_path = os.path.join(args.input_path or input_path, args.MONTH[5:7])
+    region_set = RegionSet.from_geojson(args.REGIONS)
+
+    file_paths = list_granule_files(input_path, args.MONTH)
+    print('Aggregating {} granules over {} regions'.format(len(file_paths), len(region_set)))
+    statistics, histograms, alts = aggregate_regions(file_paths, region_set, grid, args.region, args.variables,
+                                                     args.feature_types)
+
+    if not os.path.exists(args.output_path):
+        os.makedirs(args.output_path, exist_ok=True)
+
+    # one mergeable file per (region, variable), see merge_statistics
+    for name, region_statistics in statistics.items():
+        for variable, variable_statistics in region_statistics.items():
+            output_file = os.path.join(args.output_path, '{}_{}_{}_{}.npz'.format(name, variable, args.region,
+                                                                               args.MONTH))
+            variable_statistics.save(output_file)
+            print('{}: {} values of {} saved to {}'.format(name, int(variable_statistics.count.sum()), variable,
+                                                           output_file))
+
+    # histograms merge by addition across months and jobs
+    for name, region_histograms in histograms.items():
+        for variable, histogram in region_histograms.items():
+            histogram.save(os.path.join(args.output_path, '{}_{}_histogram_{}_{}.npz'.format(
+                name, variable, args.region, args.MONTH)))
+        for variable in HISTOGRAM_EDGES:
+            if variable in region_histograms:
+                median = region_histograms[variable].get_median()
+                print('{}: column median of {} {:.4g}'.format(name, variable, np.nanmedian(median)))
+
+    if alts is not None:
+        np.save(os.path.join(args.output_path, 'alt_caliop.npy'), alts)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    build_caliop_catalog.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        17/10/2026 11:45
+
+import logging
+import argparse
+from Caliop.catalog import CaliopCatalog
+
+CALIPSO_DATA_PATH = "/gws/nopw/j04/gbov/data/asdc.larc.nasa.gov/data/CALIPSO/LID_L2_05kmAPro-Standard-V4-51/"
+CATALOG_FILE = './caliop_APro_catalog.sqlite'
+
+parser = argparse.ArgumentParser(description="Build or incrementally update the CALIOP granule catalog.")
+parser.add_argument("--data_path", type=str, default=CALIPSO_DATA_PATH, help="Root of the CALIOP data tree.")
+parser.add_argument("--catalog", type=str, default=CATALOG_FILE, help="SQLite catalog file.")
+args = parser.parse_args()
+
+logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.INFO)
+
+def main():
+
+    with CaliopCatalog(args.catalog) as catalog:
+        number_indexed = catalog.update(args.data_path)
+
+    print('Indexed {} new or changed granules into {}'.format(number_indexed, args.catalog))
+
+if __name__ == "__main__":
+    main()
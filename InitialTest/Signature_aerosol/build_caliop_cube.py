@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    build_caliop_cube.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        18/10/2026 10:30
+
+import os
+import logging
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Caliop.caliop import CaliopGranule
+from Caliop.cube import CaliopCube, reduce_granule
+from Caliop.grid import CaliopGrid
+from caliop_extraction import list_granules, REGIONS, CALIPSO_DATA_PATH
+
+CUBE_VARIABLES = ['Extinction_Coefficient_532', 'Particulate_Depolarization_Ratio_Profile_532']
+
+logger = logging.getLogger()
+
+
+def reduce_granule_file(hdf_file, grid, first_month, number_of_months, variables):
+    """
+    Worker: reads the region subset of one granule and reduces it to cube cells.
+    """
+    with CaliopGranule(hdf_file) as granule:
+        if granule.select_region(grid.region) == 0:
+            return None
+
+        curtains = {variable: granule.get_calipso_data(variable, masked=False) for variable in variables}
+        return reduce_granule(grid, first_month, number_of_months, len(granule.get_altitudes()),
+                              granule.get_latitude(), granule.get_longitude(), granule.get_profile_UTC(),
+                              curtains)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Build a (month, lat, lon, altitude) CALIOP cube in one pass.")
+    parser.add_argument("START_DATE", type=str, help="First date in the format YYYY-MM-DD.")
+    parser.add_argument("END_DATE", type=str, help="Last date in the format YYYY-MM-DD (included).")
+    parser.add_argument("--region", type=str, default='lat', choices=sorted(REGIONS), help="Predefined region.")
+    parser.add_argument("--binsize", type=float, default=None,
+                        help="Horizontal resolution in degrees, 1 for a full cube and the 0.1 of the region grid "
+                             "for a curtain by default.")
+    parser.add_argument("--curtain", action='store_true',
+                        help="Collapse the cube to the (month, lat, altitude) curtain of the 'lat' region or the "
+                             "(month, lon, altitude) curtain of the 'lon' region, as read by the trend scripts.")
+    parser.add_argument("--variables", type=str, nargs='+', default=CUBE_VARIABLES, help="SDS names to accumulate.")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get('SLURM_CPUS_PER_TASK', os.cpu_count() or 1)),
+                        help="Number of worker processes.")
+    parser.add_argument("--data_path", type=str, default=CALIPSO_DATA_PATH, help="Root of the CALIOP data tree.")
+    parser.add_argument("--catalog", type=str, default=None, help="Granule catalog used to prune the granules.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Cube file, defaults to ./caliop_cube_<region>.nc or ./caliop_curtain_<region>.nc")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.INFO)
+
+    region_grid = REGIONS[args.region][0]
+    if args.curtain:
+        grid = region_grid.get_curtain_grid(args.region, args.binsize)
+    else:
+        grid = CaliopGrid(*region_grid.get_region(), binsize=args.binsize or 1.0)
+    first_month = np.datetime64(args.START_DATE, 'M')
+    number_of_months = int((np.datetime64(args.END_DATE, 'M') - first_month).astype(int)) + 1
+
+    file_list = list_granules(args.START_DATE, args.END_DATE, grid.get_region(), args.data_path, args.catalog)
+    if len(file_list) == 0:
+        print('No granules found')
+        return
+
+    with CaliopGranule(file_list[0]) as granule:
+        altitudes = granule.get_altitudes()
+
+    cube = CaliopCube(grid, altitudes, first_month, number_of_months, args.variables)
+    logger.info("Building cube of shape {} from {} granules".format(cube.shape, len(file_list)))
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(reduce_granule_file, hdf_file, grid, first_month, number_of_months,
+                                   args.variables): hdf_file for hdf_file in file_list}
+
+        for future in as_completed(futures):
+            try:
+                reduced = future.result()
+            except Exception as e:
+                print('Cannot process file: {}'.format(futures[future]))
+                logger.warning("Cannot process file {}: {}".format(futures[future], e))
+                continue
+
+            if reduced is not None:
+                cube.add_reduced(reduced)
+
+    output = args.output or './caliop_{}_{}.nc'.format('curtain' if args.curtain else 'cube', args.region)
+    cube.save(output)
+    print('Saved cube to {}'.format(output))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    build_caliop_groupby.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        18/10/2026 16:55
+
+import os
+import logging
+import argparse
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from Caliop.caliop import CaliopGranule
+from Caliop.grid import CaliopGrid
+from Caliop.groupby import GroupBy, get_field_sizes, get_granule_codes, AEROSOL_FEATURE_TYPES
+from Caliop.qc import QCFilter, QC_PRESETS
+from caliop_extraction import list_granules, REGIONS, CALIPSO_DATA_PATH
+
+GROUP_FIELDS = ['aerosol_type', 'day_night', 'lat_bin', 'alt_bin', 'month']
+GROUP_VARIABLES = ['Extinction_Coefficient_532', 'Particulate_Depolarization_Ratio_Profile_532']
+GRANULES_PER_TASK = 50
+
+logger = logging.getLogger()
+
+
+def group_granules(file_list, field_sizes, variables, grid, altitude_edges, first_month, qc_filter=None,
+                   aerosol_feature_types=AEROSOL_FEATURE_TYPES):
+    """
+    Worker: accumulates a chunk of granules into one GroupBy, so that only one
+    accumulator per chunk goes back to the main process. Returns it with the
+    granules that could not be read.
+    """
+    groupby = GroupBy(field_sizes, variables)
+    number_of_months = field_sizes.get('month')
+    failed = []
+
+    for hdf_file in file_list:
+        try:
+            with CaliopGranule(hdf_file) as granule:
+                if granule.select_region(grid.region) == 0:
+                    continue
+                if qc_filter is not None and granule.apply_qc(qc_filter)['profiles'] == 0:
+                    continue
+
+                codes = get_granule_codes(granule, groupby.fields, grid, altitude_edges, first_month,
+                                          number_of_months, aerosol_feature_types=aerosol_feature_types)
+                values = {variable: granule.get_calipso_data(variable, masked=False) for variable in variables}
+                groupby.add(codes, values)
+        except Exception as e:
+            failed.append((hdf_file, repr(e)))
+
+    return groupby, failed
+
+
+def run_chunks(chunks, workers, *args):
+    """
+    Runs group_granules over chunks of granules and yields (partial, failed)
+    per chunk. Only `workers` chunks are in flight, so when a worker dies
+    (OOM, crash in the HDF library) only those are suspect: their granules
+    are retried one by one, and a single granule in flight during another
+    break is run alone in its own pool, where a break reports it as failed
+    instead of ending the build.
+    """
+    pending = deque(chunks)
+    isolated = []
+
+    while len(pending) > 0:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            running = {}
+            try:
+                while len(pending) > 0 or len(running) > 0:
+                    while len(pending) > 0 and len(running) < workers:
+                        chunk = pending.popleft()
+                        running[executor.submit(group_granules, chunk, *args)] = chunk
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        running.pop(future)
+                        yield result
+            except BrokenProcessPool as e:
+                logger.error("Worker pool broken, retrying {} chunks: {}".format(len(running), e))
+                executor.shutdown(wait=False, cancel_futures=True)
+                for chunk in running.values():
+                    if len(chunk) > 1:
+                        pending.extendleft([hdf_file] for hdf_file in reversed(chunk))
+                    else:
+                        isolated.append(chunk)
+
+    for chunk in isolated:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            try:
+                yield executor.submit(group_granules, chunk, *args).result()
+            except BrokenProcessPool as e:
+                yield None, [(chunk[0], repr(e))]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Stratified CALIOP statistics over composite keys in one pass.")
+    parser.add_argument("START_DATE", type=str, help="First date in the format YYYY-MM-DD.")
+    parser.add_argument("END_DATE", type=str, help="Last date in the format YYYY-MM-DD (included).")
+    parser.add_argument("--region", type=str, default='lat', choices=sorted(REGIONS), help="Predefined region.")
+    parser.add_argument("--fields", type=str, nargs='+', default=GROUP_FIELDS,
+                        help="Key fields among aerosol_type, feature_type, day_night, lat_bin, lon_bin, alt_bin, month.")
+    parser.add_argument("--aerosol_feature_types", type=int, nargs='+', default=list(AEROSOL_FEATURE_TYPES),
+                        help="Feature types whose bins are grouped by aerosol_type (3 = tropospheric aerosol).")
+    parser.add_argument("--binsize", type=float, default=1.0, help="Horizontal resolution of lat_bin/lon_bin in degrees.")
+    parser.add_argument("--altitude_binsize", type=float, default=0.5, help="Height of alt_bin in km.")
+    parser.add_argument("--max_altitude", type=float, default=10., help="Top of the alt_bin grid in km.")
+    parser.add_argument("--variables", type=str, nargs='+', default=GROUP_VARIABLES, help="SDS names to reduce.")
+    parser.add_argument("--qc", type=str, default=None,
+                        help="QC filter: a preset ({}) or a JSON file of rules.".format(', '.join(sorted(QC_PRESETS))))
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get('SLURM_CPUS_PER_TASK', os.cpu_count() or 1)),
+                        help="Number of worker processes.")
+    parser.add_argument("--data_path", type=str, default=CALIPSO_DATA_PATH, help="Root of the CALIOP data tree.")
+    parser.add_argument("--catalog", type=str, default=None, help="Granule catalog used to prune the granules.")
+    parser.add_argument("--output", type=str, default=None, help="Output file, defaults to ./caliop_groupby_<region>.npz")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.INFO)
+
+    grid = CaliopGrid(*REGIONS[args.region][0].get_region(), binsize=args.binsize)
+    altitude_edges = args.altitude_binsize * np.arange(int(round(args.max_altitude / args.altitude_binsize)) + 1)
+    first_month = np.datetime64(args.START_DATE, 'M')
+    number_of_months = int((np.datetime64(args.END_DATE, 'M') - first_month).astype(int)) + 1
+    qc_filter = None if args.qc is None else QCFilter.from_argument(args.qc)
+
+    field_sizes = get_field_sizes(args.fields, grid, altitude_edges, number_of_months)
+    groupby = GroupBy(field_sizes, args.variables)
+
+    file_list = list_granules(args.START_DATE, args.END_DATE, grid.region, args.data_path, args.catalog)
+    logger.info("Grouping {} granules over {} groups {}".format(len(file_list), groupby.number_of_groups,
+                                                               dict(field_sizes)))
+
+    chunks = [file_list[i:i + GRANULES_PER_TASK] for i in range(0, len(file_list), GRANULES_PER_TASK)]
+    for partial, failed in run_chunks(chunks, args.workers, field_sizes, args.variables, grid, altitude_edges,
+                                      first_month, qc_filter, args.aerosol_feature_types):
+        if partial is not None:
+            groupby.merge(partial)
+        for hdf_file, error in failed:
+            print('Cannot process file: {}'.format(hdf_file))
+            logger.warning("Cannot process file {}: {}".format(hdf_file, error))
+
+    output = args.output or './caliop_groupby_{}.npz'.format(args.region)
+    groupby.save(output)
+    print('Saved group-by statistics to {}'.format(output))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    caliop_extraction.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        17/10/2026 14:10
+
+import os
+import sys
+import json
+import logging
+import argparse
+import pandas as pd
+import numpy as np
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from get_caliop import *
+from Caliop.catalog import CaliopCatalog
+from Caliop.manifest import ExtractionManifest, DONE, EMPTY, FAILED, get_config_key
+from Caliop.store import save_granule, save_granule_sparse
+from Caliop.grid import LAT_GRID, LON_GRID
+from Caliop.region import PolygonRegion, RegionSet
+from Caliop.qc import QCFilter, QC_PRESETS, merge_reports
+
+# Constants
+LOG_EXTENSION = ".log"
+CALIPSO_DATA_PATH = "/gws/nopw/j04/gbov/data/asdc.larc.nasa.gov/data/CALIPSO/LID_L2_05kmAPro-Standard-V4-51/"
+
+MANIFEST_FILE_NAME = 'manifest.sqlite'
+CONFIG_FILE_NAME = 'extraction_config.json'
+OUTPUT_VARIABLES = ['caliop_aerosol_type', 'caliop_feature_type', 'caliop_dp', 'beta_caliop', 'alpha_caliop']
+
+# grids and output directories of the former per-day scripts
+REGIONS = {'lat': (LAT_GRID, './csv_APro_lat_distribution'),
+           'lon': (LON_GRID, './csv_APro_lon_distribution')}
+
+logger = logging.getLogger()
+
+
+def _get_granule_date(path):
+    # CAL_LID_L2_05kmAPro-Standard-V4-51.2017-06-01T00-23-18ZN.hdf -> 2017-06-01
+    return os.path.basename(path).split('.')[1][:10] if '.' in os.path.basename(path) else None
+
+
+def list_granules(start_date, end_date, region, data_path=CALIPSO_DATA_PATH, catalog_file=None):
+    """
+    Returns the granule paths dated from start_date to end_date (both included).
+    With a catalog, only the granules crossing region are returned.
+    """
+    dates = np.arange(np.datetime64(start_date), np.datetime64(end_date) + np.timedelta64(1, 'D'))
+    date_strings = set([str(date) for date in dates])
+
+    if catalog_file is not None:
+        with CaliopCatalog(catalog_file) as catalog:
+            paths = catalog.query(dates[0], dates[-1] + np.timedelta64(1, 'D'), region)
+        return [path for path in paths if _get_granule_date(path) in date_strings]
+
+    paths = []
+    for year_month in sorted(set([date_string[:7] for date_string in date_strings])):
+        month_path = os.path.join(data_path, *year_month.split('-'))
+        if not os.path.exists(month_path):
+            continue
+        for file in sorted(os.listdir(month_path)):
+            if _get_granule_date(file) in date_strings:
+                paths.append(os.path.join(month_path, file))
+
+    return paths
+
+
+def extract_granule(hdf_file, grid, region=None, region_set=None, qc_filter=None):
+    """
+    Worker: reads the region subset of one granule and maps its profiles to the
+    lat/lon bins of grid. region defaults to the box of the grid. With a
+    RegionSet, only the profiles in one of its regions are read, once, and each
+    is labelled with region_flags. A QCFilter is applied before any curtain is
+    read; its report is returned as qc_report, alone if no profile passed.
+    Returns None if no profile is in the region.
+    """
+    region = grid.region if region is None else region
+    if region_set is not None:
+        region = region & region_set.get_union()
+
+    with CaliopGranule(hdf_file) as granule:
+        if granule.select_region(region) == 0:
+            return None
+
+        qc_report = None
+        if qc_filter is not None:
+            qc_report = granule.apply_qc(qc_filter)
+            if qc_report['profiles'] == 0:
+                return {'qc_report': qc_report}
+
+        flags = granule.get_feature_flags('Atmospheric_Volume_Description')
+        lat = granule.get_latitude()
+        lon = granule.get_longitude()
+
+        result = {'caliop_aerosol_type': flags['feature_subtype'],
+                  'caliop_feature_type': flags['feature_type'],
+                  'caliop_dp': granule.get_calipso_data('Particulate_Depolarization_Ratio_Profile_532', masked=False),
+                  'beta_caliop': granule.get_calipso_data('Total_Backscatter_Coefficient_532', masked=False),
+                  'alpha_caliop': granule.get_calipso_data('Extinction_Coefficient_532', masked=False),
+                  'caliop_lat': lat,
+                  'caliop_lon': lon,
+                  'caliop_time': granule.get_profile_UTC(),
+                  'alt_caliop': granule.get_altitudes(),
+                  'lat_bin': grid.get_lat_index(lat),
+                  'lon_bin': grid.get_lon_index(lon),
+                  'grid': grid.name,
+                  'qc_report': qc_report}
+        if region_set is not None:
+            result['region_flags'] = region_set.get_flags(lat, lon)
+            result['region_names'] = region_set.names
+
+        return result
+
+
+def save_granule_csv(output_file, result):
+    """
+    Writes one granule in the long format of caliop_extraction_lat/lon.py.
+    """
+    number_of_altitudes, number_of_profiles = result['caliop_aerosol_type'].shape
+
+    df = pd.DataFrame({
+        'caliop_aerosol_type': result['caliop_aerosol_type'].flatten(),
+        'caliop_feature_type': result['caliop_feature_type'].flatten(),
+        'caliop_dp': result['caliop_dp'].flatten(),
+        'beta_caliop': result['beta_caliop'].flatten(),
+        'alpha_caliop': result['alpha_caliop'].flatten(),
+        'caliop_lat': np.tile(result['caliop_lat'], number_of_altitudes),
+        'caliop_lon': np.tile(result['caliop_lon'], number_of_altitudes),
+        'alt_caliop': np.repeat(result['alt_caliop'], number_of_profiles)
+    })
+    df.to_csv(output_file, index=False)
+
+
+# output format: (extension, writer)
+OUTPUT_FORMATS = {'netcdf': ('.nc', save_granule),
+                  'sparse': ('.nc', save_granule_sparse),
+                  'csv': ('.csv', save_granule_csv)}
+
+
+def get_output_file(output_path, hdf_file, output_format='netcdf'):
+
+    output_path_month = os.path.join(output_path, _get_granule_date(hdf_file)[5:7])
+    if not os.path.exists(output_path_month):
+        os.makedirs(output_path_month, exist_ok=True)
+
+    extension = OUTPUT_FORMATS[output_format][0]
+    return os.path.join(output_path_month, "{}{}".format(os.path.basename(hdf_file)[0:-4], extension))
+
+
+def claim_output_path(output_path, config):
+    """
+    Output files are named after their granule only, so an output directory
+    holds the outputs of one configuration. Records the configuration in the
+    directory, or raises ValueError if it already holds another one.
+    """
+    config_file = os.path.join(output_path, CONFIG_FILE_NAME)
+    if os.path.exists(config_file):
+        with open(config_file, 'r') as f:
+            stored = json.load(f)
+        if get_config_key(stored) != get_config_key(config):
+            raise ValueError("{} holds the outputs of another extraction configuration ({}), "
+                             "use another --output_path".format(output_path, config_file))
+        return
+
+    tmp_file = config_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(config, f, sort_keys=True, indent=1)
+    os.replace(tmp_file, config_file)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Extract CALIOP region subsets for a date range in parallel.")
+    parser.add_argument("START_DATE", type=str, help="First date in the format YYYY-MM-DD.")
+    parser.add_argument("END_DATE", type=str, help="Last date in the format YYYY-MM-DD (included).")
+    parser.add_argument("--region", type=str, default='lat', choices=sorted(REGIONS),
+                        help="Predefined region and output directory.")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get('SLURM_CPUS_PER_TASK', os.cpu_count() or 1)),
+                        help="Number of worker processes.")
+    parser.add_argument("--data_path", type=str, default=CALIPSO_DATA_PATH, help="Root of the CALIOP data tree.")
+    parser.add_argument("--output_path", type=str, default=None, help="Overrides the region output directory.")
+    parser.add_argument("--catalog", type=str, default=None,
+                        help="Granule catalog (see build_caliop_catalog.py) used to open only granules crossing the region.")
+    parser.add_argument("--format", type=str, default='netcdf', choices=sorted(OUTPUT_FORMATS),
+                        help="Output format: compressed NetCDF4 curtains, sparse NetCDF4 records of the "
+                             "--sparse_feature_types bins only, or the legacy long-format csv.")
+    parser.add_argument("--sparse_feature_types", type=int, nargs='+', default=[3],
+                        help="Feature types stored by the sparse format (3 = tropospheric aerosol).")
+    parser.add_argument("--manifest", type=str, default=None,
+                        help="Extraction manifest, defaults to {} in the output directory.".format(MANIFEST_FILE_NAME))
+    parser.add_argument("--force", action='store_true', help="Re-extract every granule, even completed or known-bad ones.")
+    parser.add_argument("--retry_failed", action='store_true', help="Retry granules that failed in a previous run.")
+    parser.add_argument("--invalidate", action='store_true',
+                        help="Forget (and delete) every output of this region and variable configuration first.")
+    parser.add_argument("--geojson", type=str, default=None,
+                        help="GeoJSON polygon(s); only profiles inside the region box and the polygons are extracted.")
+    parser.add_argument("--qc", type=str, default=None,
+                        help="QC filter applied in the reader: a preset ({}) or a JSON file of rules.".format(
+                            ', '.join(sorted(QC_PRESETS))))
+    parser.add_argument("--regions", type=str, default=None,
+                        help="GeoJSON FeatureCollection of named regions (e.g. patch and controls) labelled in one pass.")
+    args = parser.parse_args()
+
+    grid, output_path = REGIONS[args.region]
+    region = grid.region
+    if args.geojson is not None:
+        region = region & PolygonRegion.from_geojson(args.geojson)
+    region_set = None if args.regions is None else RegionSet.from_geojson(args.regions)
+    qc_filter = None if args.qc is None else QCFilter.from_argument(args.qc)
+    output_path = args.output_path or output_path
+
+    script_base_name, _ = os.path.splitext(sys.modules['__main__'].__file__)
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', filemode='w',
+                        filename=script_base_name + LOG_EXTENSION, level=logging.INFO)
+
+    if not os.path.exists(output_path):
+        os.makedirs(output_path, exist_ok=True)
+
+    config = {'region': grid.get_region(), 'grid': grid.name, 'variables': OUTPUT_VARIABLES,
+              'output_path': os.path.abspath(output_path), 'format': args.format}
+    if args.geojson is not None:
+        config['geojson'] = os.path.abspath(args.geojson)
+    if region_set is not None:
+        config['regions'] = os.path.abspath(args.regions)
+    if qc_filter is not None:
+        config['qc'] = qc_filter.to_dict()
+    if args.format == 'sparse':
+        config['sparse_feature_types'] = args.sparse_feature_types
+    try:
+        claim_output_path(output_path, config)
+    except ValueError as e:
+        print(e)
+        logger.error(e)
+        sys.exit(1)
+
+    with ExtractionManifest(args.manifest or os.path.join(output_path, MANIFEST_FILE_NAME), config) as manifest:
+        if args.invalidate:
+            logger.info("Invalidated {} manifest records".format(manifest.invalidate(remove_outputs=True)))
+
+        file_list = list_granules(args.START_DATE, args.END_DATE, region, args.data_path, args.catalog)
+        number_of_files = len(file_list)
+        file_list = manifest.filter(file_list, force=args.force, retry_failed=args.retry_failed)
+        logger.info("Extracting {} of {} granules with {} workers".format(len(file_list), number_of_files,
+                                                                          args.workers))
+
+        writer = OUTPUT_FORMATS[args.format][1]
+        if args.format == 'sparse':
+            writer = partial(save_granule_sparse, feature_types=args.sparse_feature_types)
+
+        qc_total = {}
+        broken = False
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = {executor.submit(extract_granule, hdf_file, grid, region, region_set, qc_filter): hdf_file
+                       for hdf_file in file_list}
+
+            # results are written by this process as soon as each worker finishes
+            for future in as_completed(futures):
+                hdf_file = futures[future]
+                try:
+                    result = future.result()
+                except BrokenProcessPool as e:
+                    # a killed worker (OOM, preemption) says nothing about the granules: leave every
+                    # unfinished one unrecorded so that the next run retries it
+                    print('Worker pool broken, stopping: {}'.format(e))
+                    logger.error("Worker pool broken at {}, stopping: {}".format(hdf_file, e))
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    broken = True
+                    break
+                except Exception as e:
+                    print('Cannot process file: {}'.format(hdf_file))
+                    logger.warning("Cannot process file {}: {}".format(hdf_file, e))
+                    manifest.record(hdf_file, FAILED, error=repr(e))
+                    continue
+
+                print('Processing file: {}'.format(os.path.basename(hdf_file)))
+                if result is not None and result['qc_report'] is not None:
+                    logger.info("QC {}: {}".format(os.path.basename(hdf_file), dict(result['qc_report'])))
+                    merge_reports(qc_total, result['qc_report'])
+                if result is None or 'alpha_caliop' not in result:
+                    manifest.record(hdf_file, EMPTY)
+                    continue
+
+                output_file = get_output_file(output_path, hdf_file, args.format)
+                writer(output_file, result)
+                manifest.record(hdf_file, DONE, output_path=output_file)
+
+        if qc_filter is not None:
+            print('QC bins removed per rule: {}'.format(qc_total))
+            logger.info("QC bins removed per rule: {}".format(qc_total))
+
+    if broken:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
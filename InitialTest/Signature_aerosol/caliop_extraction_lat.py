@@ -16,26 +16,32 @@ import matplotlib as mpl
 import matplotlib.pyplot as plt
 from matplotlib.gridspec import GridSpec
 from get_caliop import *
+from Caliop.catalog import CaliopCatalog
+from Caliop.grid import LAT_GRID
+from Caliop.region import PolygonRegion
 
 # Constants
 LOG_EXTENSION = ".log"
-# latitude distribution
-NORTHERN_LATITUDE = 50
-SOUTHERN_LATITUDE = 0
-WESTERN_LONGITUDE = -150
-EASTERN_LONGITUDE = -135
+# box of the aggregation grid; the reader computes one profile mask from it per granule
+REGION = LAT_GRID.region
 MIN_ALTITUDE = 0
 MAX_ALTITUDE = 20
 
 # Set up argument parser
 parser = argparse.ArgumentParser(description="Script to process data at specific date.")
 parser.add_argument("DATE_SEARCH", type=str, help="Date in the format YYYY-MM-DD.")
+parser.add_argument("--catalog", type=str, default=None,
+                    help="Granule catalog (see build_caliop_catalog.py) used to open only granules crossing REGION.")
+parser.add_argument("--geojson", type=str, default=None,
+                    help="GeoJSON polygon(s), e.g. a garbage patch outline; only profiles inside REGION and the polygons are kept.")
 
 # Parse the arguments
 args = parser.parse_args()
 
 # Use the parsed arguments
 DATE_SEARCH = args.DATE_SEARCH
+if args.geojson is not None:
+    REGION = REGION & PolygonRegion.from_geojson(args.geojson)
 
 # Directory paths and locations
 CALIPSO_DATA_PATH = "/gws/nopw/j04/gbov/data/asdc.larc.nasa.gov/data/CALIPSO/LID_L2_05kmAPro-Standard-V4-51/"
@@ -63,9 +69,17 @@ def main():
 
     data_path = os.path.join(CALIPSO_DATA_PATH, year, month)
 
-    file_list = os.listdir(data_path)
-    # only keep files that contains year-month-day in the full file name
-    file_list = [file for file in file_list if DATE_SEARCH in file]
+    if args.catalog is not None:
+        start_time = np.datetime64(DATE_SEARCH)
+        with CaliopCatalog(args.catalog) as catalog:
+            file_list = [os.path.basename(path) for path in
+                         catalog.query(start_time, start_time + np.timedelta64(1, 'D'), REGION)]
+        # granules starting the day before can reach into this day, keep them with their own date
+        file_list = [file for file in file_list if DATE_SEARCH in file]
+    else:
+        file_list = os.listdir(data_path)
+        # only keep files that contains year-month-day in the full file name
+        file_list = [file for file in file_list if DATE_SEARCH in file]
 
     # iterate through all files
     for file in file_list:
@@ -75,7 +89,7 @@ def main():
             (footprint_lat_caliop, footprint_lon_caliop,
              alt_caliop, beta_caliop, alpha_caliop,
              caliop_aerosol_type, caliop_feature_type, caliop_dp, alt_tropopause) \
-                = extract_variables_from_caliop(data_path + '/' + file, logger)
+                = extract_variables_from_caliop(data_path + '/' + file, logger, region=REGION)
 
             print('Processing file: {}'.format(file))
 
@@ -83,13 +97,9 @@ def main():
             print('Cannot process file: {}'.format(file))
             continue
 
-        caliop_aerosol_type = caliop_aerosol_type[:, (footprint_lat_caliop > SOUTHERN_LATITUDE) & (footprint_lat_caliop < NORTHERN_LATITUDE) & (footprint_lon_caliop > WESTERN_LONGITUDE) & (footprint_lon_caliop < EASTERN_LONGITUDE)]
-        caliop_feature_type = caliop_feature_type[:, (footprint_lat_caliop > SOUTHERN_LATITUDE) & (footprint_lat_caliop < NORTHERN_LATITUDE) & (footprint_lon_caliop > WESTERN_LONGITUDE) & (footprint_lon_caliop < EASTERN_LONGITUDE)]
-        caliop_dp = caliop_dp[:, (footprint_lat_caliop > SOUTHERN_LATITUDE) & (footprint_lat_caliop < NORTHERN_LATITUDE) & (footprint_lon_caliop > WESTERN_LONGITUDE) & (footprint_lon_caliop < EASTERN_LONGITUDE)]
-        beta_caliop = beta_caliop[:, (footprint_lat_caliop > SOUTHERN_LATITUDE) & (footprint_lat_caliop < NORTHERN_LATITUDE) & (footprint_lon_caliop > WESTERN_LONGITUDE) & (footprint_lon_caliop < EASTERN_LONGITUDE)]
-        alpha_caliop = alpha_caliop[:, (footprint_lat_caliop > SOUTHERN_LATITUDE) & (footprint_lat_caliop < NORTHERN_LATITUDE) & (footprint_lon_caliop > WESTERN_LONGITUDE) & (footprint_lon_caliop < EASTERN_LONGITUDE)]
-        caliop_lat = footprint_lat_caliop[(footprint_lat_caliop > SOUTHERN_LATITUDE) & (footprint_lat_caliop < NORTHERN_LATITUDE) & (footprint_lon_caliop > WESTERN_LONGITUDE) & (footprint_lon_caliop < EASTERN_LONGITUDE)]
-        caliop_lon = footprint_lon_caliop[(footprint_lat_caliop > SOUTHERN_LATITUDE) & (footprint_lat_caliop < NORTHERN_LATITUDE) & (footprint_lon_caliop > WESTERN_LONGITUDE) & (footprint_lon_caliop < EASTERN_LONGITUDE)]
+        # only the profiles inside REGION have been read
+        caliop_lat = footprint_lat_caliop
+        caliop_lon = footprint_lon_caliop
 
         if caliop_aerosol_type.shape[1] > 0:
 
@@ -5,7 +5,8 @@
 # @Email:       rui.song@physics.ox.ac.uk
 # @Time:        08/01/2023 23:17
 
-from Caliop.caliop import Caliop_hdf_reader
+from Caliop.caliop import CaliopGranule
+from Caliop.region import BoxRegion
 import os
 
 def find_caliop_file(dir, filename, date):
@@ -19,37 +20,37 @@ def find_caliop_file(dir, filename, date):
     else:
         return None
 
-def extract_variables_from_caliop(hdf_file, logger):
-    """Extract relevant variables from the CALIOP data"""
-
-    caliop_request = Caliop_hdf_reader()
-    caliop_latitude_list = caliop_request. \
-        _get_latitude(hdf_file)
-    caliop_longitude_list = caliop_request. \
-        _get_longitude(hdf_file)
-    caliop_altitude_list = caliop_request. \
-        get_altitudes(hdf_file)
-    caliop_beta_list = caliop_request. \
-        _get_calipso_data(filename=hdf_file,
-                          variable='Total_Backscatter_Coefficient_532')
-    caliop_alpha_list = caliop_request. \
-        _get_calipso_data(filename=hdf_file,
-                          variable='Extinction_Coefficient_532')
-
-    (caliop_aerosol_type, caliop_feature_type) = caliop_request.\
-        _get_feature_classification(filename=hdf_file,
-                                    variable='Atmospheric_Volume_Description')
-
-    caliop_Depolarization_Ratio_list = caliop_request. \
-        _get_calipso_data(filename=hdf_file,
-                          variable='Particulate_Depolarization_Ratio_Profile_532')
-
-    CAD_Score = caliop_request. \
-        _get_calipso_data(filename=hdf_file,
-                          variable='CAD_Score')
-
-    caliop_tropopause_height = caliop_request.\
-        _get_tropopause_height(filename=hdf_file)
+def extract_variables_from_caliop(hdf_file, logger, region=None, qc_filter=None):
+    """
+    Extract relevant variables from the CALIOP data. If region is given, as a
+    Region or a (south, north, west, east) box, only the profiles inside it are read.
+    With a QCFilter, profiles without any passing bin are not read and rejected
+    bins are NaN. The profile variables are float32 arrays with NaN for missing data.
+    """
+
+    with CaliopGranule(hdf_file) as granule:
+        if region is not None:
+            if isinstance(region, tuple):
+                region = BoxRegion(*region)
+            number_of_profiles = granule.select_region(region)
+            logger.info("Selected {} profiles in region {}".format(number_of_profiles, region))
+        if qc_filter is not None:
+            logger.info("QC bins removed per rule: {}".format(dict(granule.apply_qc(qc_filter))))
+        caliop_latitude_list = granule.get_latitude()
+        caliop_longitude_list = granule.get_longitude()
+        caliop_altitude_list = granule.get_altitudes()
+        caliop_beta_list = granule. \
+            get_calipso_data('Total_Backscatter_Coefficient_532', masked=False)
+        caliop_alpha_list = granule. \
+            get_calipso_data('Extinction_Coefficient_532', masked=False)
+
+        (caliop_aerosol_type, caliop_feature_type) = granule. \
+            get_feature_classification('Atmospheric_Volume_Description')
+
+        caliop_Depolarization_Ratio_list = granule. \
+            get_calipso_data('Particulate_Depolarization_Ratio_Profile_532', masked=False)
+
+        caliop_tropopause_height = granule.get_tropopause_height()
 
     logger.info("Extracted data from caliop file: 7 parameters")
 
@@ -60,45 +61,25 @@ def extract_variables_from_caliop(hdf_file, logger):
 
 def extract_cloud_phase_caliop(hdf_file, logger):
 
-    caliop_request = Caliop_hdf_reader()
-    caliop_cloud_phase, caliop_cloud_phase_QA = caliop_request. \
-        _get_cloud_phase(filename=hdf_file, variable='Atmospheric_Volume_Description')
+    with CaliopGranule(hdf_file) as granule:
+        caliop_cloud_phase, caliop_cloud_phase_QA = granule. \
+            get_cloud_phase('Atmospheric_Volume_Description')
 
     return caliop_cloud_phase, caliop_cloud_phase_QA
 
 def extract_variables_from_caliop_level1(hdf_file, logger):
     """Extract relevant variables from the CALIOP Level-1 data"""
 
-    caliop_request = Caliop_hdf_reader()
-    caliop_latitude_list = caliop_request. \
-        _get_latitude(hdf_file)
-    caliop_longitude_list = caliop_request. \
-        _get_longitude(hdf_file)
-    caliop_altitude_list = caliop_request. \
-        get_altitudes(hdf_file)
-    caliop_total_attenuated_backscatter_list = \
-        caliop_request._get_calipso_data(filename=hdf_file,
-                                         variable='Total_Attenuated_Backscatter_532')
-    caliop_perpendicular_attenuated_backscatter_532_list = \
-        caliop_request._get_calipso_data(filename=hdf_file,
-                                            variable='Perpendicular_Attenuated_Backscatter_532')
-    caliop_atteunated_backscatter_1064_list = \
-        caliop_request._get_calipso_data(filename=hdf_file,
-                                            variable='Attenuated_Backscatter_1064')
-
-    # caliop_alpha_list = caliop_request. \
-    #     _get_calipso_data(filename=hdf_file,
-    #                       variable='Extinction_Coefficient_532')
-    # (caliop_aerosol_type, caliop_feature_type) = caliop_request.\
-    #     _get_feature_classification(filename=hdf_file,
-    #                                 variable='Atmospheric_Volume_Description')
-    #
-    # caliop_Depolarization_Ratio_list = caliop_request. \
-    #     _get_calipso_data(filename=hdf_file,
-    #                       variable='Particulate_Depolarization_Ratio_Profile_532')
-    #
-    # caliop_tropopause_height = caliop_request.\
-    #     _get_tropopause_height(filename=hdf_file)
+    with CaliopGranule(hdf_file) as granule:
+        caliop_latitude_list = granule.get_latitude()
+        caliop_longitude_list = granule.get_longitude()
+        caliop_altitude_list = granule.get_altitudes()
+        caliop_total_attenuated_backscatter_list = \
+            granule.get_calipso_data('Total_Attenuated_Backscatter_532')
+        caliop_perpendicular_attenuated_backscatter_532_list = \
+            granule.get_calipso_data('Perpendicular_Attenuated_Backscatter_532')
+        caliop_atteunated_backscatter_1064_list = \
+            granule.get_calipso_data('Attenuated_Backscatter_1064')
 
     logger.info("Extracted data from caliop level-1 file")
     return caliop_latitude_list, caliop_longitude_list, \
@@ -110,38 +91,25 @@ def extract_variables_from_caliop_level1(hdf_file, logger):
 def extract_variables_from_caliop_ALay(hdf_file, logger):
     """Extract relevant variables from the CALIOP Level-1 data"""
 
-    caliop_request = Caliop_hdf_reader()
-
-    caliop_Profile_Time = caliop_request. \
-        _get_calipso_data(filename=hdf_file,
-                            variable='Profile_Time')
-    caliop_DN_flag = caliop_request. \
-        _get_calipso_data(filename=hdf_file,
-                            variable='Day_Night_Flag')
-    caliop_latitude_list = caliop_request. \
-        _get_latitude(hdf_file)
-    caliop_longitude_list = caliop_request. \
-        _get_longitude(hdf_file)
-
-    caliop_Integrated_Attenuated_Total_Color_Ratio = \
-        caliop_request._get_calipso_data(filename=hdf_file,
-                                         variable='Integrated_Attenuated_Total_Color_Ratio')
-    caliop_Integrated_Particulate_Depolarization_Ratio = \
-        caliop_request._get_calipso_data(filename=hdf_file,
-                                            variable='Integrated_Particulate_Depolarization_Ratio')
-
-    (caliop_aerosol_type, caliop_feature_type) = caliop_request. \
-        _get_feature_classification_ALay(filename=hdf_file,
-                                         variable='Feature_Classification_Flags')
-
-    caliop_Layer_Top_Altitude =  caliop_request._get_calipso_data(filename=hdf_file,
-                                                                  variable='Layer_Top_Altitude')
-    caliop_Layer_Base_Altitude = caliop_request._get_calipso_data(filename=hdf_file,
-                                                                 variable='Layer_Base_Altitude')
-    caliop_Tropopause_Height = caliop_request._get_calipso_data(filename=hdf_file,
-                                                                variable='Tropopause_Height')
-
-    caliop_CAD =  caliop_request._get_calipso_data(filename=hdf_file, variable='CAD_Score')
+    with CaliopGranule(hdf_file) as granule:
+        caliop_Profile_Time = granule.get_calipso_data('Profile_Time')
+        caliop_DN_flag = granule.get_calipso_data('Day_Night_Flag')
+        caliop_latitude_list = granule.get_latitude()
+        caliop_longitude_list = granule.get_longitude()
+
+        caliop_Integrated_Attenuated_Total_Color_Ratio = \
+            granule.get_calipso_data('Integrated_Attenuated_Total_Color_Ratio')
+        caliop_Integrated_Particulate_Depolarization_Ratio = \
+            granule.get_calipso_data('Integrated_Particulate_Depolarization_Ratio')
+
+        (caliop_aerosol_type, caliop_feature_type) = granule. \
+            get_feature_classification_ALay('Feature_Classification_Flags')
+
+        caliop_Layer_Top_Altitude = granule.get_calipso_data('Layer_Top_Altitude')
+        caliop_Layer_Base_Altitude = granule.get_calipso_data('Layer_Base_Altitude')
+        caliop_Tropopause_Height = granule.get_calipso_data('Tropopause_Height')
+
+        caliop_CAD = granule.get_calipso_data('CAD_Score')
 
     logger.info("Extracted data from caliop ALay file")
     return (caliop_Profile_Time, caliop_DN_flag,
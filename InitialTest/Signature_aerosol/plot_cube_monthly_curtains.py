@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+# @Filename:    plot_cube_monthly_curtains.py
+# @Author:      Dr. Rui Song
+# @Email:       rui.song@physics.ox.ac.uk
+# @Time:        18/10/2026 11:05
+
+import os
+import argparse
+import numpy as np
+import proplot as pplt
+from Caliop.cube import CaliopCube
+
+FIG_OUT_PATH = './figures'
+
+if not os.path.exists(FIG_OUT_PATH):
+    os.mkdir(FIG_OUT_PATH)
+
+# collapsed cube axis and x coordinate of the curtain
+CURTAINS = {'lat': (2, 'Latitude [$^{\\circ}$]'),
+            'lon': (1, 'Longitude [$^{\\circ}$]')}
+
+parser = argparse.ArgumentParser(description="Monthly curtains sliced from a CALIOP cube (see build_caliop_cube.py).")
+parser.add_argument("CUBE_FILE", type=str, help="Cube file.")
+parser.add_argument("--variable", type=str, default='Extinction_Coefficient_532', help="Variable to plot.")
+parser.add_argument("--curtain", type=str, default='lat', choices=sorted(CURTAINS), help="Latitude or longitude curtain.")
+parser.add_argument("--vmax", type=float, default=0.1, help="Upper limit of the colour scale.")
+args = parser.parse_args()
+
+def main():
+    cube = CaliopCube.load(args.CUBE_FILE, [args.variable])
+    axis, xlabel = CURTAINS[args.curtain]
+    edges = cube.grid.lat_edges if args.curtain == 'lat' else cube.grid.lon_edges
+    centers = (edges[:-1] + edges[1:]) / 2
+
+    # (month, lat or lon, altitude) means, a single reduction of the cube
+    curtains = cube.get_mean(args.variable, axis=axis)
+    months = cube.get_months()
+
+    number_of_columns = 3
+    number_of_rows = int(np.ceil(len(months) / number_of_columns))
+    fig, axs = pplt.subplots(nrows=number_of_rows, ncols=number_of_columns, figsize=(28, 4.5 * number_of_rows))
+
+    mappable = None
+    for month, curtain, ax in zip(months, curtains, axs):
+        X, Alts = np.meshgrid(centers, cube.altitudes)
+        ax.set_xlabel(xlabel, fontsize=20)
+        ax.set_ylabel('Altitude [km]', fontsize=20)
+        ax.format(xlim=(edges.min(), edges.max()), ylim=(0., 4), fontsize=18)
+        mappable = ax.pcolormesh(X, Alts, curtain.T, shading='auto', cmap='RdYlBu_r', vmin=0., vmax=args.vmax)
+        ax.set_title('{}'.format(month), fontsize=18)
+
+    fig.colorbar(mappable, loc='b', span=number_of_columns, label=args.variable, labelsize=18, ticklabelsize=16)
+    fig.savefig(FIG_OUT_PATH + '/cube_{}_{}_curtains.png'.format(args.variable, args.curtain))
+
+if __name__ == "__main__":
+    main()
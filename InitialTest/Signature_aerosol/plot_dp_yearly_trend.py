@@ -6,58 +6,35 @@
 # @Time:        23/01/2024 16:44
 
 import os
-import pandas as pd
 import numpy as np
+from Caliop.cube import CaliopCube, get_month_index
 import proplot as pplt
 
 # Constants
-CSV_OUTPUT_PATH = './csv_APro'
+CUBE_FILE = './caliop_curtain_lat.nc'  # 0.1 degree curtain cube, see build_caliop_cube.py --curtain
+VARIABLE = 'Particulate_Depolarization_Ratio_Profile_532'
 FIG_OUT_PATH = './figures'
 
 if not os.path.exists(FIG_OUT_PATH):
     os.mkdir(FIG_OUT_PATH)
 
-BINSIZE = 0.1  # Group latitudes every 0.1 degree
-NUM_ROWS = 399  # Fixed number of rows in each dataframe
 
-def load_data(file_path):
-    df = pd.read_csv(file_path)
-    num_cols = len(df) // NUM_ROWS
-    dp_caliop = df['caliop_dp'].values.reshape(NUM_ROWS, num_cols)
-    lats = df['caliop_lat'].unique()
-    alts = df['alt_caliop'].unique()
-    return dp_caliop, lats, alts
+def aggregate_data(cube, month):
+    """
+    Mean (lat, altitude) curtain of one month, a reduction of the cube over longitude.
+    """
+    lat_bins = cube.grid.lat_edges
+    month_index = get_month_index([month], cube.first_month, cube.number_of_months)[0]
+    if month_index < 0:
+        print(f"Warning: {month} is not in {CUBE_FILE}.")
+        return np.full((len(lat_bins) - 1, len(cube.altitudes)), np.nan), lat_bins, cube.altitudes
 
-def create_latitude_bins(lats):
-    min_lat, max_lat = min(lats), max(lats)
-    return np.arange(min_lat, max_lat + BINSIZE, BINSIZE)
+    averaged_dp = cube.get_mean(VARIABLE, axis=2)[month_index]
 
-def aggregate_data(dp_data_list):
-    all_lats = np.concatenate([lats for _, lats in dp_data_list])
-    lat_bins = create_latitude_bins(all_lats)
-    aggregated_dp = [np.empty((0, NUM_ROWS)) for _ in range(len(lat_bins) - 1)]
-
-    for dp_caliop, lats in dp_data_list:
-        for i, (bin_min, bin_max) in enumerate(zip(lat_bins[:-1], lat_bins[1:])):
-            indices = (lats >= bin_min) & (lats < bin_max)
-            aggregated_dp[i] = np.vstack((aggregated_dp[i], dp_caliop[:, indices].T))
-
-    averaged_dp = np.empty((len(lat_bins) - 1, NUM_ROWS))
-    for i, bin_data in enumerate(aggregated_dp):
-        if bin_data.size == 0:
-            print(f"Warning: No data for bin {i} ({lat_bins[i]} - {lat_bins[i+1]}).")
-            averaged_dp[i] = np.full(NUM_ROWS, np.nan)
-        else:
-            bin_data = np.nan_to_num(bin_data, nan=0)
-            averaged_dp[i] = np.mean(bin_data, axis=0)
-    return averaged_dp, lat_bins
-
-# def plot_averaged_dp(averaged_dp, lat_bins, alts, ax):
-#     lat_centers = (lat_bins[:-1] + lat_bins[1:]) / 2
-#     Lats, Alts = np.meshgrid(lat_centers, alts)
-#     colormap = ax.pcolormesh(Lats, Alts, averaged_dp.T, shading='auto', cmap='RdYlBu_r', vmin=0., vmax=0.1)
-#     ax.colorbar(colormap, label='Particulate Depolarization Ratio', fraction=0.046, pad=0.04)
+    for i in np.flatnonzero(np.all(np.isnan(averaged_dp), axis=1)):
+        print(f"Warning: No data for bin {i} ({lat_bins[i]} - {lat_bins[i+1]}).")
 
+    return averaged_dp, lat_bins, cube.altitudes
 
 def plot_averaged_dp(averaged_dp, lat_bins, alts, ax):
     lat_centers = (lat_bins[:-1] + lat_bins[1:]) / 2
@@ -71,22 +48,14 @@ def plot_averaged_dp(averaged_dp, lat_bins, alts, ax):
 
 
 def main():
+    cube = CaliopCube.load(CUBE_FILE, [VARIABLE])
     fig, axs = pplt.subplots(nrows=4, ncols=3, figsize=(28, 18))
     months = [f'{2017}-{month:02d}' for month in range(1, 13)]
     mappables = []
     number_of_columns = 3
 
     for month, ax in zip(months, axs):
-        CSV_OUTPUT_PATH_MONTH = CSV_OUTPUT_PATH +'/%s'%month[-2:]
-        dp_data_list = []
-        for file in os.listdir(CSV_OUTPUT_PATH_MONTH):
-            if file.endswith('.csv') and month in file:
-                print('Processing: ', file)
-                file_path = os.path.join(CSV_OUTPUT_PATH_MONTH, file)
-                dp_caliop, lats, alts = load_data(file_path)
-                dp_data_list.append((dp_caliop, lats))
-
-        averaged_dp, lat_bins = aggregate_data(dp_data_list)
+        averaged_dp, lat_bins, alts = aggregate_data(cube, month)
         mappable = plot_averaged_dp(averaged_dp, lat_bins, alts, ax)
         mappables.append(mappable)
         ax.set_title(f'{month}', fontsize= 18)
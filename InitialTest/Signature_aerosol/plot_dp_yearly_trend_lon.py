@@ -6,53 +6,35 @@
 # @Time:        24/01/2024 12:42
 
 import os
-import pandas as pd
 import numpy as np
+from Caliop.cube import CaliopCube, get_month_index
 import proplot as pplt
 import matplotlib.ticker as ticker
 # Constants
-CSV_OUTPUT_PATH = './csv_APro_lon_distribution'
+CUBE_FILE = './caliop_curtain_lon.nc'  # 0.1 degree curtain cube, see build_caliop_cube.py --curtain
+VARIABLE = 'Particulate_Depolarization_Ratio_Profile_532'
 FIG_OUT_PATH = './figures'
 
 if not os.path.exists(FIG_OUT_PATH):
     os.mkdir(FIG_OUT_PATH)
 
-BINSIZE = 0.1  # Group longitudes every 0.1 degree
-NUM_ROWS = 399  # Fixed number of rows in each dataframe
-
-def load_data(file_path):
-    df = pd.read_csv(file_path)
-    num_cols = len(df) // NUM_ROWS
-    dp_caliop = df['caliop_dp'].values.reshape(NUM_ROWS, num_cols)
-    longs = df['caliop_lon'].unique()  # Adjusted to read longitude
-    alts = df['alt_caliop'].unique()
-
-    longs[longs<0.] = 360. + longs[longs<0.]
-    return dp_caliop, longs, alts
-
-def create_longitude_bins(longs):
-    min_long, max_long = min(longs), max(longs)
-    return np.arange(min_long, max_long + BINSIZE, BINSIZE)
-
-def aggregate_data(dp_data_list):
-    all_longs = np.concatenate([longs for _, longs in dp_data_list])
-    long_bins = create_longitude_bins(all_longs)
-    aggregated_dp = [np.empty((0, NUM_ROWS)) for _ in range(len(long_bins) - 1)]
-
-    for dp_caliop, longs in dp_data_list:
-        for i, (bin_min, bin_max) in enumerate(zip(long_bins[:-1], long_bins[1:])):
-            indices = (longs >= bin_min) & (longs < bin_max)
-            aggregated_dp[i] = np.vstack((aggregated_dp[i], dp_caliop[:, indices].T))
-
-    averaged_dp = np.empty((len(long_bins) - 1, NUM_ROWS))
-    for i, bin_data in enumerate(aggregated_dp):
-        if bin_data.size == 0:
-            print("Warning: No data for bin")
-            averaged_dp[i] = np.full(NUM_ROWS, np.nan)
-        else:
-            bin_data = np.nan_to_num(bin_data, nan=0)
-            averaged_dp[i] = np.mean(bin_data, axis=0)
-    return averaged_dp, long_bins
+
+def aggregate_data(cube, month):
+    """
+    Mean (lon, altitude) curtain of one month, a reduction of the cube over latitude.
+    """
+    long_bins = cube.grid.lon_edges
+    month_index = get_month_index([month], cube.first_month, cube.number_of_months)[0]
+    if month_index < 0:
+        print(f"Warning: {month} is not in {CUBE_FILE}.")
+        return np.full((len(long_bins) - 1, len(cube.altitudes)), np.nan), long_bins, cube.altitudes
+
+    averaged_dp = cube.get_mean(VARIABLE, axis=1)[month_index]
+
+    for i in np.flatnonzero(np.all(np.isnan(averaged_dp), axis=1)):
+        print("Warning: No data for bin")
+
+    return averaged_dp, long_bins, cube.altitudes
 
 def plot_averaged_dp(averaged_dp, long_bins, alts, ax):
     long_centers = (long_bins[:-1] + long_bins[1:]) / 2
@@ -80,6 +62,7 @@ def plot_averaged_dp(averaged_dp, long_bins, alts, ax):
     return ax.pcolormesh(Longs, Alts, averaged_dp.T, shading='auto', cmap='magma', vmin=0., vmax=0.1)
 
 def main():
+    cube = CaliopCube.load(CUBE_FILE, [VARIABLE])
     fig, axs = pplt.subplots(nrows=4, ncols=3, figsize=(28, 18))
     months = ['{}-{:02d}'.format(2017, month) for month in range(1, 13)]
 
@@ -87,16 +70,7 @@ def main():
     number_of_columns = 3
 
     for month, ax in zip(months, axs):
-        CSV_OUTPUT_PATH_MONTH = CSV_OUTPUT_PATH + '/%s' % month[-2:]
-        dp_data_list = []
-        for file in os.listdir(CSV_OUTPUT_PATH_MONTH):
-            if file.endswith('.csv') and month in file:
-                print('Processing: ', file)
-                file_path = os.path.join(CSV_OUTPUT_PATH_MONTH, file)
-                dp_caliop, longs, alts = load_data(file_path)
-                dp_data_list.append((dp_caliop, longs))
-
-        averaged_dp, long_bins = aggregate_data(dp_data_list)
+        averaged_dp, long_bins, alts = aggregate_data(cube, month)
         mappable = plot_averaged_dp(averaged_dp, long_bins, alts, ax)
         mappables.append(mappable)
         ax.set_title('{}'.format(month), fontsize=18)
@@ -5,58 +5,32 @@
 # @Email:       rui.song@physics.ox.ac.uk
 # @Time:        23/01/2024 12:21
 
-import os
-import pandas as pd
 import numpy as np
+from Caliop.cube import CaliopCube, get_month_index
 import matplotlib.pyplot as plt
 import proplot as pplt
 
 # Constants
-CSV_OUTPUT_PATH = './csv_APro'
-BINSIZE = 0.1  # Group latitudes every 0.1 degree
-NUM_ROWS = 399  # Fixed number of rows in each dataframe
+CUBE_FILE = './caliop_curtain_lat.nc'  # 0.1 degree curtain cube, see build_caliop_cube.py --curtain
+VARIABLE = 'Particulate_Depolarization_Ratio_Profile_532'
 
 
-def load_data(file_path):
-    df = pd.read_csv(file_path)
-    num_cols = len(df) // NUM_ROWS  # Calculate number of columns
-    dp_caliop = df['caliop_dp'].values.reshape(NUM_ROWS, num_cols)
-    lats = df['caliop_lat'].unique()
-    alts = df['alt_caliop'].unique()
-    return dp_caliop, lats, alts
-
-def create_latitude_bins(lats):
-    min_lat = min(lats)
-    max_lat = max(lats)
-    return np.arange(min_lat, max_lat + BINSIZE, BINSIZE)
-
-
-def aggregate_data(alpha_data_list):
-    all_lats = np.concatenate([lats for _, lats in alpha_data_list])
-    lat_bins = create_latitude_bins(all_lats)
-    aggregated_dp = [np.empty((0, NUM_ROWS)) for _ in range(len(lat_bins) - 1)]
-
-    for alpha_caliop, lats in alpha_data_list:
-        for i in range(len(lat_bins) - 1):
-            bin_min = lat_bins[i]
-            bin_max = lat_bins[i + 1]
-            indices = (lats >= bin_min) & (lats < bin_max)
-            aggregated_dp[i] = np.vstack((aggregated_dp[i], alpha_caliop[:, indices].T))
-
-    # Averaging with a check for empty bins
-    averaged_dp = np.empty((len(lat_bins) - 1, NUM_ROWS))
+def aggregate_data(cube, month):
+    """
+    Mean (lat, altitude) curtain of one month, a reduction of the cube over longitude.
+    """
+    lat_bins = cube.grid.lat_edges
+    month_index = get_month_index([month], cube.first_month, cube.number_of_months)[0]
+    if month_index < 0:
+        print(f"Warning: {month} is not in {CUBE_FILE}.")
+        return np.full((len(lat_bins) - 1, len(cube.altitudes)), np.nan), lat_bins, cube.altitudes
 
-    for i, bin_data in enumerate(aggregated_dp):
+    averaged_dp = cube.get_mean(VARIABLE, axis=2)[month_index]
 
-        if bin_data.size == 0:
-            # Log a warning or error message indicating the empty bin
-            print(f"Warning: No data found for bin {i} (Latitude range: {lat_bins[i]} - {lat_bins[i+1]}). Filling with NaN.")
-            averaged_dp[i] = np.full(NUM_ROWS, np.nan)
-        else:
-            bin_data = np.nan_to_num(bin_data, nan = 0)
-            averaged_dp[i] = np.mean(bin_data, axis=0)
+    for i in np.flatnonzero(np.all(np.isnan(averaged_dp), axis=1)):
+        print(f"Warning: No data found for bin {i} (Latitude range: {lat_bins[i]} - {lat_bins[i+1]}). Filling with NaN.")
 
-    return averaged_dp, lat_bins
+    return averaged_dp, lat_bins, cube.altitudes
 
 def plot_averaged_dp(averaged_alpha, lat_bins, alts):
     """
@@ -96,15 +70,8 @@ def plot_averaged_dp(averaged_alpha, lat_bins, alts):
     fig.savefig('./depolarization_latitude_trend_proplot_2017-08.png')
 
 def main():
-    dp_data_list = []
-    for file in os.listdir(CSV_OUTPUT_PATH):
-        if file.endswith('.csv') & file.__contains__('2017-08'):
-            print('Processing: ', file)
-            file_path = os.path.join(CSV_OUTPUT_PATH, file)
-            dp_caliop, lats, alts = load_data(file_path)
-            dp_data_list.append((dp_caliop, lats))
-
-    averaged_dp, lat_bins = aggregate_data(dp_data_list)
+    cube = CaliopCube.load(CUBE_FILE, [VARIABLE])
+    averaged_dp, lat_bins, alts = aggregate_data(cube, '2017-08')
     plot_averaged_dp(averaged_dp, lat_bins, alts)
 
 if __name__ == "__main__":
@@ -5,58 +5,32 @@
 # @Email:       rui.song@physics.ox.ac.uk
 # @Time:        22/01/2024 23:27
 
-import os
-import pandas as pd
 import numpy as np
+from Caliop.cube import CaliopCube, get_month_index
 import matplotlib.pyplot as plt
 import proplot as pplt
 
 # Constants
-CSV_OUTPUT_PATH = './csv_APro'
-BINSIZE = 0.1  # Group latitudes every 0.1 degree
-NUM_ROWS = 399  # Fixed number of rows in each dataframe
+CUBE_FILE = './caliop_curtain_lat.nc'  # 0.1 degree curtain cube, see build_caliop_cube.py --curtain
+VARIABLE = 'Extinction_Coefficient_532'
 
 
-def load_data(file_path):
-    df = pd.read_csv(file_path)
-    num_cols = len(df) // NUM_ROWS  # Calculate number of columns
-    alpha_caliop = df['alpha_caliop'].values.reshape(NUM_ROWS, num_cols)
-    lats = df['caliop_lat'].unique()
-    alts = df['alt_caliop'].unique()
-    return alpha_caliop, lats, alts
-
-def create_latitude_bins(lats):
-    min_lat = min(lats)
-    max_lat = max(lats)
-    return np.arange(min_lat, max_lat + BINSIZE, BINSIZE)
-
-
-def aggregate_data(alpha_data_list):
-    all_lats = np.concatenate([lats for _, lats in alpha_data_list])
-    lat_bins = create_latitude_bins(all_lats)
-    aggregated_alpha = [np.empty((0, NUM_ROWS)) for _ in range(len(lat_bins) - 1)]
-
-    for alpha_caliop, lats in alpha_data_list:
-        for i in range(len(lat_bins) - 1):
-            bin_min = lat_bins[i]
-            bin_max = lat_bins[i + 1]
-            indices = (lats >= bin_min) & (lats < bin_max)
-            aggregated_alpha[i] = np.vstack((aggregated_alpha[i], alpha_caliop[:, indices].T))
-
-    # Averaging with a check for empty bins
-    averaged_alpha = np.empty((len(lat_bins) - 1, NUM_ROWS))
+def aggregate_data(cube, month):
+    """
+    Mean (lat, altitude) curtain of one month, a reduction of the cube over longitude.
+    """
+    lat_bins = cube.grid.lat_edges
+    month_index = get_month_index([month], cube.first_month, cube.number_of_months)[0]
+    if month_index < 0:
+        print(f"Warning: {month} is not in {CUBE_FILE}.")
+        return np.full((len(lat_bins) - 1, len(cube.altitudes)), np.nan), lat_bins, cube.altitudes
 
-    for i, bin_data in enumerate(aggregated_alpha):
+    averaged_alpha = cube.get_mean(VARIABLE, axis=2)[month_index]
 
-        if bin_data.size == 0:
-            # Log a warning or error message indicating the empty bin
-            print(f"Warning: No data found for bin {i} (Latitude range: {lat_bins[i]} - {lat_bins[i+1]}). Filling with NaN.")
-            averaged_alpha[i] = np.full(NUM_ROWS, np.nan)
-        else:
-            bin_data = np.nan_to_num(bin_data, nan = 0)
-            averaged_alpha[i] = np.mean(bin_data, axis=0)
+    for i in np.flatnonzero(np.all(np.isnan(averaged_alpha), axis=1)):
+        print(f"Warning: No data found for bin {i} (Latitude range: {lat_bins[i]} - {lat_bins[i+1]}). Filling with NaN.")
 
-    return averaged_alpha, lat_bins
+    return averaged_alpha, lat_bins, cube.altitudes
 
 def plot_averaged_alpha(averaged_alpha, lat_bins, alts):
     """
@@ -96,15 +70,8 @@ def plot_averaged_alpha(averaged_alpha, lat_bins, alts):
     fig.savefig('./extinction_latitude_trend_proplot_2017-06.png')
 
 def main():
-    alpha_data_list = []
-    for file in os.listdir(CSV_OUTPUT_PATH):
-        if file.endswith('.csv') & file.__contains__('2017-06'):
-            print('Processing: ', file)
-            file_path = os.path.join(CSV_OUTPUT_PATH, file)
-            alpha_caliop, lats, alts = load_data(file_path)
-            alpha_data_list.append((alpha_caliop, lats))
-
-    averaged_alpha, lat_bins = aggregate_data(alpha_data_list)
+    cube = CaliopCube.load(CUBE_FILE, [VARIABLE])
+    averaged_alpha, lat_bins, alts = aggregate_data(cube, '2017-06')
     plot_averaged_alpha(averaged_alpha, lat_bins, alts)
 
 if __name__ == "__main__":